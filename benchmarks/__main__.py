@@ -0,0 +1,70 @@
+import argparse
+import json
+import sys
+
+from benchmarks import bench_database, bench_maintain, bench_memory, bench_peers, bench_torrent  # noqa: F401
+from benchmarks import bench_choker, bench_dht, bench_http_tracker, bench_udp_tracker  # noqa: F401
+from benchmarks import runner
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description='Run benchmarks.')
+
+    parser.add_argument('patterns',
+                        type=str,
+                        nargs=argparse.ZERO_OR_MORE,
+                        help='Benchmark name patterns, e.g. "udp.*" or "torrent.construct[files=1,*"')
+
+    parser.add_argument('-o', '--output',
+                        required=False,
+                        help='Write JSON results to file instead of stdout')
+
+    parser.add_argument('-r', '--repeat',
+                        type=int,
+                        default=5,
+                        help='Number of timed repeats per benchmark')
+
+    parser.add_argument('-c', '--compare',
+                        required=False,
+                        help='Baseline JSON results. Exit with 1 if any benchmark regressed')
+
+    parser.add_argument('-t', '--threshold',
+                        type=float,
+                        default=1.1,
+                        help='Slowdown ratio considered a regression')
+
+    parser.add_argument('-l', '--list',
+                        required=False,
+                        help='List benchmarks selected by the patterns and exit',
+                        action='store_true')
+
+    args = parser.parse_args()
+
+    if args.list:
+        for _benchmark in runner.select(args.patterns):
+            print(_benchmark.full_name)
+
+        return None
+
+    results = runner.run(args.patterns, repeat=args.repeat)
+    _json = json.dumps(results, indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(_json)
+    else:
+        print(_json)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = runner.compare(json.load(file), results, args.threshold)
+
+        for name, old, new, ratio in regressions:
+            print(f'REGRESSION {name}: {old} -> {new} ({ratio:.2f}x)', file=sys.stderr)
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    run()
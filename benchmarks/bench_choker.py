@@ -0,0 +1,46 @@
+import random
+
+from benchmarks.runner import benchmark
+from torrent.network.choker import Choker
+
+
+def _choker(torrents: int, peers: int, seeding: bool) -> Choker:
+    """ Choker with peers spread over torrents, random rates, 3 of 4 peers interested
+    """
+    _random = random.Random(peers)
+    choker = Choker(slots=4, global_slots=200, _random=random.Random(0))
+
+    for index in range(torrents):
+        info_hash = index.to_bytes(20, 'big')
+        choker.add_torrent(info_hash, seeding=seeding)
+
+        for number in range(peers // torrents):
+            peer = (f'10.{index % 256}.{number // 256 % 256}.{number % 256}', 6881)
+            choker.connected(info_hash, peer, now=0)
+            choker.interested(info_hash, peer, number % 4 != 0)
+            choker.downloaded(info_hash, peer, _random.randrange(1 << 20), now=5)
+            choker.uploaded(info_hash, peer, _random.randrange(1 << 20), now=5)
+
+    return choker
+
+
+@benchmark('choker.round', torrents=(1, 100), peers=(1000, 20000), seeding=(False, True))
+def choke_round(torrents, peers, seeding):
+    choker = _choker(torrents, peers, seeding)
+    rounds = iter(range(10, 10 ** 9, Choker.ROUND))
+
+    yield lambda: choker.run_round(now=next(rounds))
+
+
+@benchmark('choker.account', peers=(1000,))
+def account(peers):
+    choker = _choker(1, peers, False)
+    info_hash = (0).to_bytes(20, 'big')
+    keys = [(f'10.0.{number // 256 % 256}.{number % 256}', 6881) for number in range(peers)]
+
+    def _account():
+        for now in range(6, 16):
+            for peer in keys:
+                choker.downloaded(info_hash, peer, 16384, now=now)
+
+    yield _account
@@ -0,0 +1,106 @@
+from benchmarks.runner import benchmark
+from benchmarks.utils import temporary_directory
+from database.database import Database
+
+
+ROWS = (100, 10000)
+INSERT = ('INSERT INTO torrent (name, torrent_path, path_to_save, created_by, comment, creation_date) '
+          'VALUES (:name, :torrent_path, :path_to_save, :created_by, :comment, :creation_date)')
+
+
+def _row(i: int) -> dict:
+    return {
+        'name': f'synthetic-{i}',
+        'torrent_path': f'/tmp/synthetic-{i}.torrent',
+        'path_to_save': '/tmp',
+        'created_by': 'clutcher benchmarks',
+        'comment': 'Synthetic torrent',
+        'creation_date': 1640995200,
+    }
+
+
+@benchmark('database.insert')
+def insert():
+    with temporary_directory():
+        database = Database('benchmarks')
+        database.create_table()
+        row = _row(0)
+
+        yield lambda: database.execute(INSERT, row)
+
+        database.close()
+
+
+@benchmark('database.secure_fetchall', rows=ROWS)
+def secure_fetchall(rows):
+    with temporary_directory():
+        database = Database('benchmarks')
+        database.create_table()
+        database.cursor.executemany(INSERT, [_row(i) for i in range(rows)])
+        database.connection.commit()
+
+        def _fetchall():
+            for _ in database.secure_fetchall('SELECT * FROM torrent'):
+                pass
+
+        yield _fetchall
+
+        database.close()
+
+
+def _torrent(i: int, rows: int) -> dict:
+    return dict(_row(i), name=f'synthetic-{i * 7919 % rows:08d}', info_hash=i.to_bytes(20, 'big'),
+                state='active' if i % 3 else 'paused')
+
+
+def _populated(rows: int) -> Database:
+    database = Database('benchmarks')
+    database.create_tables()
+
+    with database.connection:
+        database.torrents.insert_many(_torrent(i, rows) for i in range(rows))
+
+    return database
+
+
+@benchmark('database.stream', rows=ROWS)
+def stream(rows):
+    with temporary_directory():
+        database = _populated(rows)
+
+        def _stream():
+            for _ in database.torrents.select():
+                pass
+
+        yield _stream
+
+        database.close()
+
+
+@benchmark('database.get_info_hash', rows=ROWS)
+def get_info_hash(rows):
+    with temporary_directory():
+        database = _populated(rows)
+        info_hashes = [(i * 97 % rows).to_bytes(20, 'big') for i in range(100)]
+
+        def _get():
+            for info_hash in info_hashes:
+                database.torrents.get('info_hash', info_hash)
+
+        yield _get
+
+        database.close()
+
+
+@benchmark('database.page', rows=ROWS, order_by=('id', 'name'))
+def page(rows, order_by):
+    """ Last page, keyset pagination makes it as cheap as the first one
+    """
+    with temporary_directory():
+        database = _populated(rows)
+        *_, last = database.torrents.select((order_by, 'id'), order_by=order_by)
+        after = (last[order_by], last['id'])
+
+        yield lambda: database.torrents.page(order_by, after=after, limit=100, descending=True)
+
+        database.close()
@@ -0,0 +1,66 @@
+import asyncio
+import random
+
+from benchmarks.runner import benchmark
+from torrent.network.dht import DHTNode
+
+
+def _swarm(loop: asyncio.AbstractEventLoop, nodes: int, seed: int = 0) -> list:
+    """ Start nodes on localhost, every node bootstraps from the first one
+    """
+    _random = random.Random(seed)
+    swarm = [DHTNode(node_id=_random.getrandbits(160).to_bytes(20, 'big'), host='127.0.0.1', port=0)
+             for _ in range(nodes)]
+
+    async def _start():
+        for node in swarm:
+            await node.start()
+
+        for node in swarm[1:]:
+            await node.bootstrap([(swarm[0].host, swarm[0].port)])
+
+    loop.run_until_complete(_start())
+
+    return swarm
+
+
+@benchmark('dht.get_peers', nodes=(32, 256))
+def get_peers(nodes):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    swarm = _swarm(loop, nodes)
+    _random = random.Random(nodes)
+    info_hashes = [_random.getrandbits(160).to_bytes(20, 'big') for _ in range(8)]
+    stats = {'lookups': 0, 'queries': 0, 'responses': 0, 'found': 0, 'duration': 0.0}
+
+    for info_hash in info_hashes:
+        loop.run_until_complete(_random.choice(swarm).announce(info_hash, port=6881))
+
+    def _get_peers():
+        for info_hash in info_hashes:
+            result = loop.run_until_complete(_random.choice(swarm).get_peers(info_hash))
+            stats['lookups'] += 1
+            stats['queries'] += result.queries
+            stats['responses'] += result.responses
+            stats['found'] += bool(result.peers)
+            stats['duration'] += result.duration
+
+    def _stats():
+        lookups = stats['lookups'] or 1
+
+        return {
+            'lookups': stats['lookups'],
+            'queries_per_lookup': stats['queries'] / lookups,
+            'responses_per_lookup': stats['responses'] / lookups,
+            'found_ratio': stats['found'] / lookups,
+            'mean_lookup_seconds': stats['duration'] / lookups,
+            'messages': sum(sum(node.messages.values()) for node in swarm),
+        }
+
+    yield _get_peers, _stats
+
+    for node in swarm:
+        node.stop()
+
+    loop.close()
+    asyncio.set_event_loop(None)
@@ -0,0 +1,41 @@
+import asyncio
+
+from benchmarks.runner import benchmark
+from benchmarks.tracker import StandInTracker
+from torrent.network.http_tracker import ConnectionPool, HTTPTrackerClient
+
+
+@benchmark('http_tracker.announce_many', torrents=(100, 1000), keep_alive=(True, False))
+def announce_many(torrents, keep_alive):
+    loop = asyncio.new_event_loop()
+    tracker = StandInTracker(keep_alive=keep_alive)
+    url = loop.run_until_complete(tracker.start())
+    client = HTTPTrackerClient(ConnectionPool(max_per_host=8, max_idle=8))
+    requests = [{'url': url, 'info_hash': i.to_bytes(20, 'big'), 'peer_id': b'-CL0001-' + bytes(12)}
+                for i in range(torrents)]
+
+    def _announce_many():
+        for response in loop.run_until_complete(client.announce_many(requests)):
+            if isinstance(response, Exception):
+                raise response
+
+    yield _announce_many
+
+    client.close()
+    loop.run_until_complete(tracker.stop())
+    loop.close()
+
+
+@benchmark('http_tracker.scrape', torrents=(1, 100))
+def scrape(torrents):
+    loop = asyncio.new_event_loop()
+    tracker = StandInTracker()
+    url = loop.run_until_complete(tracker.start())
+    client = HTTPTrackerClient()
+    info_hashes = [i.to_bytes(20, 'big') for i in range(torrents)]
+
+    yield lambda: loop.run_until_complete(client.scrape(url, info_hashes))
+
+    client.close()
+    loop.run_until_complete(tracker.stop())
+    loop.close()
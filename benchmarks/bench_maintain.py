@@ -0,0 +1,22 @@
+import contextlib
+import io
+
+from benchmarks import generator
+from benchmarks.runner import benchmark
+from benchmarks.utils import temporary_directory
+from clutcher.maintain import Maintain
+
+
+@benchmark('maintain.start', torrents=(1, 100), files=(1, 1000))
+def start(torrents, files):
+    with temporary_directory() as directory:
+        paths = [str(generator.write(directory / f'synthetic-{i}.torrent', files=files, seed=i))
+                 for i in range(torrents)]
+
+        def _start():
+            with contextlib.redirect_stdout(io.StringIO()):
+                maintain = Maintain(files=paths)
+                maintain.start()
+                maintain.stop()
+
+        yield _start
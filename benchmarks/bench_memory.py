@@ -0,0 +1,13 @@
+from benchmarks import generator
+from benchmarks.runner import memory_benchmark
+from benchmarks.utils import temporary_directory
+from torrent.structure.torrent import Torrent
+
+
+@memory_benchmark('memory.torrent', torrents=(100,), files=(1, 100, 1000))
+def torrent(torrents, files):
+    with temporary_directory() as directory:
+        paths = [str(generator.write(directory / f'synthetic-{i}.torrent', files=files, seed=i))
+                 for i in range(torrents)]
+
+        yield lambda: ([Torrent(path) for path in paths], {'torrent': torrents, 'file': torrents * files})
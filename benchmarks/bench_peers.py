@@ -0,0 +1,57 @@
+from struct import pack
+import random
+
+from benchmarks.runner import benchmark, memory_benchmark
+from torrent.network.peer_store import PeerStore
+
+
+PEERS = (200, 50000)
+
+
+def _compact(count: int) -> bytes:
+    _random = random.Random(count)
+
+    return b''.join(pack('>IH', _random.getrandbits(32), _random.randint(1, 65535)) for _ in range(count))
+
+
+@benchmark('peers.add_compact', peers=PEERS)
+def add_compact(peers):
+    payload = _compact(peers)
+
+    yield lambda: PeerStore().add_compact(payload, now=0)
+
+
+@benchmark('peers.add_compact_duplicates', peers=PEERS)
+def add_compact_duplicates(peers):
+    payload = _compact(peers)
+    store = PeerStore()
+    store.add_compact(payload, now=0)
+
+    yield lambda: store.add_compact(payload, now=1)
+
+
+@benchmark('peers.next_candidate', peers=PEERS)
+def next_candidate(peers):
+    payload = _compact(peers)
+
+    def _next_candidate():
+        store = PeerStore()
+        store.add_compact(payload, now=0)
+
+        for _ in range(peers):
+            store.failed(*store.next_candidate(now=0), now=0)
+
+    yield _next_candidate
+
+
+@memory_benchmark('memory.peer_store', peers=PEERS)
+def peer_store(peers):
+    payload = _compact(peers)
+
+    def _peer_store():
+        store = PeerStore()
+        store.add_compact(payload, now=0)
+
+        return store, {'peer': peers}
+
+    yield _peer_store
@@ -0,0 +1,81 @@
+import bencodepy
+
+from benchmarks import generator
+from benchmarks.runner import benchmark
+from benchmarks.utils import temporary_directory
+from torrent.structure.maker import TorrentMaker
+from torrent.structure.torrent import Torrent
+
+
+FILES = (1, 100, 10000, 100000)
+PIECE_LENGTHS = (2 ** 16, 2 ** 20)
+
+
+@benchmark('torrent.generate', files=FILES)
+def generate(files):
+    yield lambda: generator.generate_bytes(files=files)
+
+
+@benchmark('torrent.decode', files=FILES)
+def decode(files):
+    _bytes = generator.generate_bytes(files=files)
+
+    yield lambda: bencodepy.decode(_bytes)
+
+
+@benchmark('torrent.construct', files=FILES, piece_length=PIECE_LENGTHS)
+def construct(files, piece_length):
+    with temporary_directory() as directory:
+        path = generator.write(directory / 'synthetic.torrent', files=files, piece_length=piece_length)
+
+        yield lambda: Torrent(str(path))
+
+
+@benchmark('torrent.info_hash', files=FILES)
+def info_hash(files):
+    with temporary_directory() as directory:
+        path = generator.write(directory / 'synthetic.torrent', files=files)
+        torrent = Torrent(str(path))
+        info = bencodepy.decode(path.read_bytes())[b'info']
+
+        def _info_hash():
+            torrent.info_hash = info
+
+        yield _info_hash
+
+
+@benchmark('torrent.files', files=FILES)
+def files_setter(files):
+    with temporary_directory() as directory:
+        path = generator.write(directory / 'synthetic.torrent', files=files)
+        torrent = Torrent(str(path))
+        info = bencodepy.decode(path.read_bytes())[b'info']
+
+        def _files():
+            torrent.files = info
+
+        yield _files
+
+
+@benchmark('torrent.total_length', files=FILES)
+def total_length(files):
+    with temporary_directory() as directory:
+        path = generator.write(directory / 'synthetic.torrent', files=files)
+        torrent = Torrent(str(path))
+
+        def _total_length():
+            torrent.total_length = torrent.files
+
+        yield _total_length
+
+
+@benchmark('torrent.make', workers=(1, 4), piece_length=PIECE_LENGTHS)
+def make(workers, piece_length):
+    with temporary_directory() as directory:
+        data = directory / 'data'
+        data.mkdir()
+
+        for i in range(16):
+            (data / f'file-{i}.bin').write_bytes(generator.pieces(2 ** 16, seed=i))
+
+        yield lambda: TorrentMaker(str(data), piece_length=piece_length, workers=workers).build_info()
@@ -0,0 +1,87 @@
+from struct import pack
+import random
+
+from benchmarks.runner import benchmark
+from torrent.network import udp_tracker_protocol as protocol
+
+
+INFO_HASH = bytes(range(20))
+PEER_ID = bytes(range(20, 40))
+PEERS = (0, 50, 200, 10000)
+
+
+def _peers(count: int) -> bytes:
+    _random = random.Random(count)
+
+    return b''.join(pack('>IH', _random.getrandbits(32), _random.randint(1, 65535)) for _ in range(count))
+
+
+def _encode_decode(name, message):
+    payload = message.to_bytes()
+
+    @benchmark(f'udp.{name}.to_bytes')
+    def _to_bytes():
+        yield message.to_bytes
+
+    @benchmark(f'udp.{name}.from_bytes')
+    def _from_bytes():
+        yield lambda: message.from_bytes(payload)
+
+
+def _connection_response():
+    message = protocol.ConnectionResponse()
+    message.connection_id = 0x0123456789abcdef
+
+    return message
+
+
+def _announce_response():
+    message = protocol.IPv4AnnounceResponse()
+    message.from_bytes(pack('>IIIII', 1, 1, 1800, 10, 20) + _peers(200))
+
+    return message
+
+
+def _scrape_request():
+    message = protocol.ScrapeRequest()
+    message.connection_id = 0x0123456789abcdef
+    message.info_hash = INFO_HASH
+
+    return message
+
+
+def _scrape_response():
+    message = protocol.ScrapeResponse(b'')
+    message.seeders = 10
+    message.connection_id = 0x0123456789abcdef
+
+    return message
+
+
+def _error_response():
+    message = protocol.ErrorResponse()
+    message.transaction_id = 1
+    message.message = 'Torrent is not registered'
+
+    return message
+
+
+_encode_decode('connection_request', protocol.ConnectionRequest())
+_encode_decode('connection_response', _connection_response())
+_encode_decode('announce_response', _announce_response())
+_encode_decode('scrape_request', _scrape_request())
+_encode_decode('scrape_response', _scrape_response())
+_encode_decode('error_response', _error_response())
+
+
+@benchmark('udp.announce_request.to_bytes')
+def announce_request_to_bytes():
+    yield protocol.IPv4AnnounceRequest(INFO_HASH, 0x0123456789abcdef, PEER_ID).to_bytes
+
+
+@benchmark('udp.peer_list', peers=PEERS)
+def peer_list(peers):
+    payload = pack('>IIIII', 1, 1, 1800, 10, 20) + _peers(peers)
+    message = protocol.IPv4AnnounceResponse()
+
+    yield lambda: message.from_bytes(payload)
@@ -0,0 +1,80 @@
+""" Deterministic synthetic .torrent generator
+
+    The same arguments always produce the same bytes, so results of different runs
+    measure the code and not the input.
+"""
+import hashlib
+import math
+import pathlib
+import random
+
+import bencodepy
+
+
+ANNOUNCE = b'udp://tracker.invalid:6969/announce'
+CREATION_DATE = 1640995200
+
+
+def generate(files: int = 1, piece_length: int = 2 ** 18, file_length: int = 2 ** 20, seed: int = 0,
+             name: str = 'synthetic') -> dict:
+    """
+
+    :param files: Number of files. 1 produces a single-file torrent
+    :param piece_length: Piece size in bytes
+    :param file_length: Average file length in bytes
+    :param seed: Random seed for file lengths, paths and pieces
+    :param name: Torrent name
+    :return: Decoded torrent dict with bytes keys
+    """
+    _random = random.Random(seed)
+    info = {
+        b'name': f'{name}-{files}'.encode('utf-8'),
+        b'piece length': piece_length,
+    }
+
+    if files == 1:
+        info[b'length'] = total_length = file_length
+    else:
+        _files = []
+        total_length = 0
+
+        for i in range(files):
+            _length = _random.randint(1, 2 * file_length)
+            total_length += _length
+
+            _files.append({
+                b'length': _length,
+                b'path': [f'directory-{i % 100}'.encode('utf-8'), f'file-{i}.bin'.encode('utf-8')],
+            })
+
+        info[b'files'] = _files
+
+    info[b'pieces'] = pieces(math.ceil(total_length / piece_length), seed)
+
+    return {
+        b'announce': ANNOUNCE,
+        b'announce-list': [[ANNOUNCE], [b'http://tracker.invalid/announce']],
+        b'comment': b'Synthetic torrent',
+        b'created by': b'clutcher benchmarks',
+        b'creation date': CREATION_DATE,
+        b'info': info,
+    }
+
+
+def pieces(count: int, seed: int = 0) -> bytes:
+    _seed = seed.to_bytes(8, 'big')
+
+    return b''.join(hashlib.sha1(_seed + i.to_bytes(8, 'big')).digest() for i in range(count))
+
+
+def generate_bytes(**kwargs) -> bytes:
+    return bencodepy.encode(generate(**kwargs))
+
+
+def write(path, **kwargs) -> pathlib.Path:
+    """ Write a synthetic torrent, see generate() for kwargs
+    """
+    path = pathlib.Path(path)
+    path.write_bytes(generate_bytes(**kwargs))
+
+    return path
@@ -0,0 +1,204 @@
+import contextlib
+import fnmatch
+import gc
+import itertools
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+import tracemalloc
+
+from clutcher import settings
+
+
+BENCHMARKS = []
+
+
+class Benchmark:
+    """ A named benchmark case
+
+        function is a generator: code before `yield` is setup, the yielded callable
+        is timed, code after `yield` is teardown. It may yield (callable, stats) instead,
+        stats() is then called after timing and its dict is reported with the result.
+    """
+    def __init__(self, name: str, function, params: dict) -> None:
+        self.name = name
+        self.function = contextlib.contextmanager(function)
+        self.params = params
+
+    @property
+    def full_name(self) -> str:
+        return full_name(self.name, self.params)
+
+    def run(self, repeat: int) -> dict:
+        stats = _stats = None
+
+        with self.function(**self.params) as _callable:
+            if isinstance(_callable, tuple):
+                _callable, _stats = _callable
+
+            timer = timeit.Timer(_callable, timer=time.perf_counter)
+            number, _ = timer.autorange()
+            times = [_time / number for _time in timer.repeat(repeat, number)]
+
+            if _stats is not None:
+                stats = _stats()
+
+        result = {
+            'name': self.name,
+            'params': self.params,
+            'number': number,
+            'repeat': repeat,
+            'min': min(times),
+            'median': statistics.median(times),
+            'mean': statistics.mean(times),
+            'times': times,
+        }
+
+        if stats is not None:
+            result['stats'] = stats
+
+        return result
+
+
+class MemoryBenchmark(Benchmark):
+    """ A named memory benchmark case
+
+        The yielded callable returns (objects, units): memory still allocated by objects is
+        reported in total and per unit, e.g. units={'torrent': 100, 'file': 10000}.
+    """
+    def run(self, repeat: int) -> dict:
+        with self.function(**self.params) as _callable:
+            gc.collect()
+            tracemalloc.start()
+            _before = tracemalloc.get_traced_memory()[0]
+            objects, units = _callable()
+            gc.collect()
+            _bytes = tracemalloc.get_traced_memory()[0] - _before
+            tracemalloc.stop()
+            del objects
+
+        result = {'name': self.name, 'params': self.params, 'bytes': _bytes}
+
+        for unit, count in units.items():
+            result[f'bytes_per_{unit}'] = _bytes / count
+
+        return result
+
+
+def full_name(name: str, params: dict) -> str:
+    if not params:
+        return name
+
+    _params = ','.join(f'{key}={value}' for key, value in params.items())
+
+    return f'{name}[{_params}]'
+
+
+def benchmark(name: str, **params):
+    """ Register a benchmark for every combination of params
+
+    :param name: Dotted benchmark name, e.g. torrent.info_hash
+    :param params: Parameter name and list of values
+    :return: decorator
+    """
+    def decorator(function):
+        keys = list(params)
+
+        for values in itertools.product(*(params[key] for key in keys)):
+            BENCHMARKS.append(Benchmark(name, function, dict(zip(keys, values))))
+
+        return function
+
+    return decorator
+
+
+def memory_benchmark(name: str, **params):
+    """ Register a memory benchmark for every combination of params, see benchmark()
+    """
+    def decorator(function):
+        keys = list(params)
+
+        for values in itertools.product(*(params[key] for key in keys)):
+            BENCHMARKS.append(MemoryBenchmark(name, function, dict(zip(keys, values))))
+
+        return function
+
+    return decorator
+
+
+def select(patterns: list = None) -> list:
+    """ Benchmarks whose full name matches any pattern, all of them without patterns
+
+    :param patterns: Shell-style patterns with * and ? wildcards. Brackets are literal, they are part of
+    parametrized names, e.g. udp.peer_list[peers=200] or udp.peer_list[peers=*]
+    """
+    if not patterns:
+        return list(BENCHMARKS)
+
+    # '[[]' is a character class matching '[' only, the closing ']' is literal on its own
+    _patterns = [pattern.replace('[', '[[]') for pattern in patterns]
+
+    return [_benchmark for _benchmark in BENCHMARKS
+            if any(fnmatch.fnmatchcase(_benchmark.full_name, pattern) for pattern in _patterns)]
+
+
+def run(patterns: list = None, repeat: int = 5, stream=sys.stderr) -> dict:
+    results = []
+
+    for _benchmark in select(patterns):
+        try:
+            result = _benchmark.run(repeat)
+        except Exception as e:
+            result = {'name': _benchmark.name, 'params': _benchmark.params, 'error': repr(e)}
+            print(f'{_benchmark.full_name}: {result["error"]}', file=stream)
+            results.append(result)
+            continue
+
+        if 'bytes' in result:
+            print(f'{_benchmark.full_name}: {result["bytes"]} bytes', file=stream)
+        else:
+            print(f'{_benchmark.full_name}: {result["min"] * 1e6:.2f} us', file=stream)
+
+        results.append(result)
+
+    return {
+        'version': settings.VERSION,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'created': time.time(),
+        'results': results,
+    }
+
+
+def compare(old: dict, new: dict, threshold: float = 1.1) -> list:
+    """ Find benchmarks that got slower
+
+    :param old: Baseline run, see run()
+    :param new: Current run
+    :param threshold: Ratio of new to old min time considered a regression
+    :return: List of (full name, old value, new value, ratio) for regressions
+    """
+    def _key(result):
+        return result['name'], json.dumps(result['params'], sort_keys=True)
+
+    baseline = {_key(result): result for result in old['results'] if 'error' not in result}
+    regressions = []
+
+    for result in new['results']:
+        _old = baseline.get(_key(result))
+
+        if _old is None or 'error' in result:
+            continue
+
+        # Time for timing benchmarks, bytes for memory ones
+        _value = 'bytes' if 'bytes' in result else 'min'
+        ratio = result[_value] / _old[_value] if _old[_value] else 1.0
+
+        if ratio > threshold:
+            regressions.append((full_name(result['name'], result['params']), _old[_value], result[_value], ratio))
+
+    return regressions
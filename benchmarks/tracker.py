@@ -0,0 +1,130 @@
+""" Local stand-in HTTP tracker
+
+    Answers announces with compact peers and scrapes with fixed stats. Counts connections
+    and requests, so clients can check keep-alive reuse. Bodies can be framed by
+    Content-Length, chunked or, HTTP/1.0 style, by closing the connection.
+"""
+import asyncio
+from struct import pack
+from urllib.parse import parse_qs, unquote_to_bytes, urlsplit
+
+import bencodepy
+
+
+class StandInTracker:
+    FRAMINGS = ('length', 'chunked', 'close')
+
+    def __init__(self, peers: int = 50, keep_alive: bool = True, interval: int = 1800,
+                 framing: str = 'length') -> None:
+        """
+
+        :param framing: One of FRAMINGS. chunked and close send the body in two segments
+        """
+        if framing not in self.FRAMINGS:
+            raise ValueError(f'Framing must be one of {self.FRAMINGS}, got {framing}')
+
+        self.keep_alive = keep_alive and framing != 'close'
+        self.interval = interval
+        self.framing = framing
+        self.peers = b''.join(pack('>IH', 0x0a000000 + i, 6881) for i in range(peers))
+
+        self.connections = 0
+        self.requests = 0
+        self.server = None
+        self.__writers = set()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """
+
+        :return: Announce URL
+        """
+        self.server = await asyncio.start_server(self.handle, host, port)
+        host, port = self.server.sockets[0].getsockname()[:2]
+
+        return f'http://{host}:{port}/announce'
+
+    async def stop(self) -> None:
+        self.server.close()
+
+        for writer in list(self.__writers):
+            writer.close()
+
+        await self.server.wait_closed()
+
+        # Let handlers see their connections closed
+        for _ in range(100):
+            if not self.__writers:
+                break
+
+            await asyncio.sleep(0.01)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self.__writers.add(writer)
+
+        try:
+            while True:
+                request_line = await reader.readline()
+
+                if not request_line:
+                    break
+
+                while (await reader.readline()) not in (b'\r\n', b''):
+                    pass
+
+                self.requests += 1
+                body = self.respond(request_line.split()[1].decode('ascii'))
+                await self.write(writer, body)
+
+                if not self.keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.__writers.discard(writer)
+            writer.close()
+
+    async def write(self, writer: asyncio.StreamWriter, body: bytes) -> None:
+        connection = 'keep-alive' if self.keep_alive else 'close'
+
+        if self.framing == 'length':
+            writer.write(f'HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: {len(body)}\r\n'
+                         f'Connection: {connection}\r\n\r\n'.encode('ascii') + body)
+            await writer.drain()
+            return None
+
+        half = len(body) // 2
+
+        if self.framing == 'chunked':
+            writer.write(f'HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nTransfer-Encoding: chunked\r\n'
+                         f'Connection: {connection}\r\n\r\n'.encode('ascii'))
+            segments = [f'{len(part):x}\r\n'.encode('ascii') + part + b'\r\n' for part in (body[:half], body[half:])]
+            segments[-1] += b'0\r\n\r\n'
+        else:
+            writer.write(b'HTTP/1.0 200 OK\r\nContent-Type: text/plain\r\n\r\n')
+            segments = [body[:half], body[half:]]
+
+        for segment in segments:
+            writer.write(segment)
+            await writer.drain()
+            # Separate TCP segments, the client sees a partial body first
+            await asyncio.sleep(0.01)
+
+    def respond(self, target: str) -> bytes:
+        split = urlsplit(target)
+        info_hashes = [unquote_to_bytes(value) for key, value in
+                       (pair.split('=', 1) for pair in split.query.split('&') if '=' in pair) if key == 'info_hash']
+
+        if split.path.endswith('/scrape'):
+            return bencodepy.encode({b'files': {info_hash: {b'complete': 10, b'downloaded': 100, b'incomplete': 5}
+                                                for info_hash in info_hashes}})
+
+        if len(info_hashes) != 1 or len(info_hashes[0]) != 20 or 'peer_id' not in parse_qs(split.query):
+            return bencodepy.encode({b'failure reason': b'Invalid announce'})
+
+        return bencodepy.encode({
+            b'interval': self.interval,
+            b'complete': 10,
+            b'incomplete': 5,
+            b'peers': self.peers,
+        })
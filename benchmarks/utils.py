@@ -0,0 +1,21 @@
+import contextlib
+import os
+import pathlib
+import tempfile
+
+
+@contextlib.contextmanager
+def temporary_directory():
+    """ Temporary working directory with database/data, as Database expects it in cwd
+    """
+    _cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory(prefix='clutcher-benchmarks-') as directory:
+        path = pathlib.Path(directory)
+        (path / 'database' / 'data').mkdir(parents=True)
+        os.chdir(directory)
+
+        try:
+            yield path
+        finally:
+            os.chdir(_cwd)
@@ -4,24 +4,119 @@
 # Use as you want, modify as you want but please include the author's name.
 
 import argparse
+import json
 import pathlib
 import sys
 
-from PyQt5.QtWidgets import QApplication
+from clutcher import control
+from clutcher.exception import ControlException, DaemonException
 
-from clutcher.maintain import Maintain
-from database.database import Database
-from ui.gui import MainFrame
+
+def make(argv: list) -> None:
+    from torrent.structure.maker import TorrentMaker
+
+    parser = argparse.ArgumentParser(prog='clutcher make', description='Create torrent file.')
+
+    parser.add_argument('path',
+                        type=str,
+                        help='File or directory')
+
+    parser.add_argument('-o', '--output',
+                        required=False,
+                        help='Torrent file path. Defaults to <name>.torrent')
+
+    parser.add_argument('-t', '--tracker',
+                        action='append',
+                        help='Tracker announce URL. Can be repeated')
+
+    parser.add_argument('-p', '--piece_length',
+                        type=int,
+                        required=False,
+                        help='Piece length in bytes, power of 2. Chosen automatically by default')
+
+    parser.add_argument('-c', '--comment',
+                        required=False,
+                        help='Comment')
+
+    parser.add_argument('--private',
+                        required=False,
+                        help='Private torrent',
+                        action='store_true')
+
+    parser.add_argument('-w', '--workers',
+                        type=int,
+                        required=False,
+                        help='Hashing threads. Defaults to CPU count')
+
+    args = parser.parse_args(argv)
+
+    try:
+        maker = TorrentMaker(args.path,
+                             announce=args.tracker,
+                             piece_length=args.piece_length,
+                             comment=args.comment,
+                             private=args.private,
+                             workers=args.workers)
+        output = maker.write(args.output or f'{maker.path.name}.torrent')
+    except (OSError, ValueError) as exception:
+        parser.error(str(exception))
+
+    print(f'{output}: {len(maker.files)} files, {maker.total_length} bytes, piece length {maker.piece_length}')
+
+
+def ctl(argv: list) -> None:
+    parser = argparse.ArgumentParser(prog='clutcher ctl', description='Control running daemon.')
+
+    parser.add_argument('--socket',
+                        required=False,
+                        help='Control socket path')
+
+    parser.add_argument('command',
+                        choices=control.COMMANDS,
+                        help='Command')
+
+    parser.add_argument('torrents',
+                        type=str,
+                        nargs=argparse.ZERO_OR_MORE,
+                        help='Torrent files for add, info hashes or names otherwise. All torrents by default')
+
+    args = parser.parse_args(argv)
+    torrents = args.torrents
+
+    if not sys.stdin.isatty():
+        torrents.extend(line.strip() for line in sys.stdin.readlines() if line.strip())
+
+    if args.command == 'add':
+        # The daemon may run in another working directory
+        torrents = [str(pathlib.Path(torrent).resolve()) for torrent in torrents]
+
+    try:
+        response = control.request(args.command, torrents, args.socket)
+    except ControlException as exception:
+        sys.exit(f'{parser.prog}: {exception}')
+
+    print(json.dumps(response, indent=2))
 
 
 def run() -> None:
+    if sys.argv[1:2] == ['make']:
+        return make(sys.argv[2:])
+
+    if sys.argv[1:2] == ['ctl']:
+        return ctl(sys.argv[2:])
+
+    # Imported after make and ctl are dispatched, `clutcher ctl` only needs clutcher.control
+    from clutcher import metrics, profiling
+    from clutcher.maintain import Maintain
+    from database.database import Database
+
     parser = argparse.ArgumentParser(description='Download files.')
 
     files = []
     _files_nargs = argparse.ONE_OR_MORE
 
     # TODO: replace it with something better
-    if '-g' in sys.argv or '--gui' in sys.argv:
+    if {'-g', '--gui', '-d', '--detach', '-l', '--list'} & set(sys.argv):
         _files_nargs = argparse.ZERO_OR_MORE
 
     if not sys.stdin.isatty():
@@ -37,9 +132,23 @@ def run() -> None:
 
     parser.add_argument('-d', '--detach',
                         required=False,
-                        help='Detach mode',
+                        help='Run as a daemon in the background, controlled with clutcher ctl',
                         action='store_true')
 
+    parser.add_argument('--watch',
+                        required=False,
+                        metavar='DIRECTORY',
+                        help='Daemon: load torrent files dropped into directory')
+
+    parser.add_argument('--watch_interval',
+                        type=float,
+                        default=2,
+                        help='Daemon: seconds between directory scans')
+
+    parser.add_argument('--socket',
+                        required=False,
+                        help=f'Daemon: control socket path. Defaults to {control.default_socket_path()}')
+
     parser.add_argument('-g', '--gui',
                         required=False,
                         help='Run gui application',
@@ -60,6 +169,69 @@ def run() -> None:
                         help='Drop all database data',
                         action='store_true')
 
+    parser.add_argument('-l', '--list',
+                        required=False,
+                        help='List torrents saved in database. Terminates program execution',
+                        action='store_true')
+
+    parser.add_argument('--upload_slots',
+                        type=int,
+                        default=4,
+                        help='Peers unchoked per torrent, plus one optimistic unchoke')
+
+    parser.add_argument('--global_upload_slots',
+                        type=int,
+                        required=False,
+                        help='Peers unchoked over all torrents, optimistic unchokes excluded. Unlimited by default')
+
+    parser.add_argument('-s', '--stats',
+                        required=False,
+                        help='Print metrics as JSON on exit',
+                        action='store_true')
+
+    parser.add_argument('--stats_file',
+                        required=False,
+                        help='Write metrics as JSON to file periodically')
+
+    parser.add_argument('--stats_interval',
+                        type=float,
+                        default=10,
+                        help='Seconds between metrics file writes')
+
+    parser.add_argument('--stats_port',
+                        type=int,
+                        required=False,
+                        help='Serve metrics in Prometheus text format on http://127.0.0.1:port/metrics')
+
+    parser.add_argument('--profile',
+                        required=False,
+                        metavar='PATH',
+                        help='Profile the run, write PATH.pstats or PATH.collapsed and PATH.subsystems.json')
+
+    parser.add_argument('--profile_mode', '--profile-mode',
+                        choices=profiling.MODES,
+                        default='cprofile',
+                        help='cprofile: deterministic, sampling: low-overhead flamegraph stacks. '
+                             'Python 3.12+ runs cprofile as sampling, it cannot profile threads there')
+
+    parser.add_argument('--profile_interval', '--profile-interval',
+                        type=float,
+                        default=5,
+                        help='Sampling interval in milliseconds')
+
+    parser.add_argument('--profile_subsystem', '--profile-subsystem',
+                        choices=list(profiling.SUBSYSTEMS),
+                        action='append',
+                        help='Restrict profile reports to subsystem. Can be repeated')
+
+    parser.add_argument('--trace_malloc', '--trace-malloc',
+                        type=int,
+                        nargs=argparse.OPTIONAL,
+                        const=10,
+                        default=0,
+                        metavar='N',
+                        help='Record top N allocators with tracemalloc')
+
     _args = parser.parse_args()
     dict_args = vars(_args)
     _tty_files = dict_args.get('files')
@@ -84,17 +256,84 @@ def run() -> None:
 
             return None
 
-        database.create_table()
+        database.create_tables()
+        database.close()
+
+    if dict_args.get('list'):
+        database = Database()
+        database.create_tables()
+
+        # Page by page, memory does not grow with the table
+        for rows in database.torrents.pages(order_by='name', limit=1000, columns=('info_hash', 'state', 'name')):
+            for row in rows:
+                print(f'{(row["info_hash"] or b"").hex()}\t{row["state"]}\t{row["name"]}')
+
         database.close()
 
-    if dict_args.get('gui'):
-        app = QApplication([])
-        main_frame = MainFrame(**dict_args)
-        main_frame.show()
-        sys.exit(app.exec_())
-    else:
-        maintain = Maintain(**dict_args)
-        maintain.start()
+        return None
+
+    clutcher_daemon = None
+
+    if dict_args.get('detach'):
+        from clutcher import daemon
+
+        clutcher_daemon = daemon.Daemon(dict_args.get('socket'),
+                                        watch=dict_args.get('watch'),
+                                        interval=dict_args.get('watch_interval'),
+                                        database=dict_args.get('database'),
+                                        upload_slots=dict_args.get('upload_slots'),
+                                        global_upload_slots=dict_args.get('global_upload_slots'))
+
+        # Checked before detaching, stderr is /dev/null afterwards
+        try:
+            clutcher_daemon.claim_socket()
+        except DaemonException as exception:
+            sys.exit(f'{parser.prog}: {exception}')
+
+        # Before any thread is started, only the forking thread survives fork()
+        daemon.detach()
+
+    stats_writer = None
+    stats_server = None
+
+    if dict_args.get('stats_file'):
+        stats_writer = metrics.SnapshotWriter(dict_args.get('stats_file'), dict_args.get('stats_interval'))
+        stats_writer.start()
+
+    if dict_args.get('stats_port'):
+        stats_server = metrics.serve(dict_args.get('stats_port'))
+
+    profiler = profiling.Profiler(dict_args.get('profile'),
+                                  mode=dict_args.get('profile_mode'),
+                                  interval=dict_args.get('profile_interval') / 1000,
+                                  trace_malloc=dict_args.get('trace_malloc'),
+                                  subsystems=dict_args.get('profile_subsystem'))
+
+    try:
+        with profiler:
+            if dict_args.get('gui'):
+                # Imported here, so daemon clients and make start without loading Qt
+                from PyQt5.QtWidgets import QApplication
+                from ui.gui import MainFrame
+
+                app = QApplication([])
+                main_frame = MainFrame(**dict_args)
+                main_frame.show()
+                sys.exit(app.exec_())
+            elif clutcher_daemon is not None:
+                clutcher_daemon.run(files)
+            else:
+                maintain = Maintain(**dict_args)
+                maintain.start()
+    finally:
+        if stats_writer:
+            stats_writer.stop()
+
+        if stats_server:
+            stats_server.shutdown()
+
+        if dict_args.get('stats'):
+            print(metrics.REGISTRY.to_json())
 
 
 if __name__ == '__main__':
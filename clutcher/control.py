@@ -0,0 +1,64 @@
+""" Daemon control client
+
+    Imports nothing heavier than socket and json, and clutcher.__main__ dispatches `clutcher ctl`
+    before importing the rest of the application, so the client starts fast.
+    Requests and responses are JSON objects, one per line:
+
+        {"command": "add", "torrents": ["/abs/a.torrent", "/abs/b.torrent"]}
+        {"added": ["<info_hash hex>"], "duplicates": [], "errors": {}}
+"""
+import json
+import os
+import pathlib
+import socket
+import tempfile
+
+from clutcher import settings
+from clutcher.exception import ControlException
+
+
+COMMANDS = ('add', 'remove', 'pause', 'resume', 'status', 'stats', 'shutdown')
+
+
+def default_socket_path() -> pathlib.Path:
+    _directory = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+
+    return pathlib.Path(_directory) / f'{settings.NAME}-{os.getuid()}.sock'
+
+
+def request(command: str, torrents: list = None, socket_path: str = None, timeout: float = 30) -> dict:
+    """ Send one command to a running daemon
+
+    :raise: clutcher.exception.ControlException if the daemon is not running or the command failed
+    """
+    _path = str(socket_path or default_socket_path())
+    payload = json.dumps({'command': command, 'torrents': torrents or []}).encode('utf-8') + b'\n'
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as _socket:
+        _socket.settimeout(timeout)
+
+        try:
+            _socket.connect(_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            raise ControlException(f'Daemon is not running on {_path}')
+        except OSError as exception:
+            raise ControlException(f'Cannot connect to daemon on {_path}: {exception}')
+
+        # socket.timeout is an OSError too
+        try:
+            _socket.sendall(payload)
+
+            with _socket.makefile('rb') as file:
+                line = file.readline()
+        except OSError as exception:
+            raise ControlException(f'No response from daemon on {_path}: {exception}')
+
+    if not line:
+        raise ControlException('Daemon closed the connection')
+
+    response = json.loads(line.decode('utf-8'))
+
+    if 'error' in response:
+        raise ControlException(response['error'])
+
+    return response
@@ -0,0 +1,424 @@
+""" Daemon mode
+
+    Torrents stay loaded between commands. A Watcher picks up .torrent files dropped
+    into a directory, a Unix-domain control socket takes newline-delimited JSON
+    commands, see clutcher.control for the protocol and the client.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import logging
+import os
+import pathlib
+import signal
+import socket
+import time
+
+from clutcher import metrics
+from clutcher.control import COMMANDS, default_socket_path
+from clutcher.exception import ControlException, DaemonException
+from clutcher.maintain import Maintain
+from torrent.structure.torrent import Torrent
+
+
+TORRENTS_LOADED = metrics.REGISTRY.gauge('clutcher_daemon_torrents', 'Torrents loaded by the daemon')
+CONTROL_COMMANDS = metrics.REGISTRY.counter('clutcher_daemon_commands_total', 'Control socket commands',
+                                            ('command', 'outcome'))
+WATCHED_FILES = metrics.REGISTRY.counter('clutcher_daemon_watched_files_total', 'Files picked up by the watcher')
+
+logger = logging.getLogger(__name__)
+
+
+class Watcher:
+    """ Poll a directory for new torrent files
+
+        A scan is skipped entirely while the directory mtime is unchanged, nothing is
+        pending and the last full scan is less than rescan seconds old, otherwise a single
+        os.scandir pass diffs (mtime, size) of every file against the previous scan. Files
+        rewritten in place leave the directory mtime alone, the periodic rescan finds them.
+        A file is ready once it is unchanged between two scans or older than settle seconds,
+        so files still being written are not read.
+    """
+    SUFFIX = '.torrent'
+    RESCAN = 60
+
+    def __init__(self, directory: str, settle: float = 1, rescan: float = RESCAN) -> None:
+        self.directory = pathlib.Path(directory).resolve()
+        self.settle = settle
+        self.rescan = rescan
+
+        self.__mtime = None
+        self.__scanned = None
+        self.__seen = {}
+        self.__pending = {}
+
+    def scan(self) -> list:
+        """
+
+        :return: Paths of new or changed torrent files, ready to be read
+        """
+        try:
+            _mtime = os.stat(str(self.directory)).st_mtime_ns
+        except FileNotFoundError:
+            return []
+
+        _now = time.monotonic()
+
+        if _mtime == self.__mtime and not self.__pending and _now - self.__scanned < self.rescan:
+            return []
+
+        self.__mtime = _mtime
+        self.__scanned = _now
+        _threshold = int((time.time() - self.settle) * 1e9)
+        seen = {}
+        pending = {}
+        ready = []
+
+        with os.scandir(str(self.directory)) as entries:
+            for entry in entries:
+                if not entry.name.endswith(self.SUFFIX) or entry.name.startswith('.') or not entry.is_file():
+                    continue
+
+                _stat = entry.stat()
+                signature = (_stat.st_mtime_ns, _stat.st_size)
+                seen[entry.name] = signature
+
+                if self.__seen.get(entry.name) == signature:
+                    continue
+
+                if self.__pending.get(entry.name) == signature or _stat.st_mtime_ns < _threshold:
+                    ready.append(entry.path)
+                else:
+                    pending[entry.name] = signature
+                    del seen[entry.name]
+
+        # Files removed from the directory are forgotten and picked up again if they come back
+        self.__seen = seen
+        self.__pending = pending
+
+        return ready
+
+
+class Daemon:
+    """ Long-running clutcher process
+
+        Torrents are keyed by info_hash, so the same torrent added twice, from the watcher
+        or the control socket, is loaded once. Every loaded torrent goes through
+        Maintain.process on a worker thread.
+    """
+    COMMANDS = COMMANDS
+
+    def __init__(self, socket_path: str = None, watch: str = None, interval: float = 2, workers: int = None,
+                 **kwargs) -> None:
+        self.socket_path = pathlib.Path(socket_path) if socket_path else default_socket_path()
+        self.watcher = Watcher(watch) if watch else None
+        self.interval = interval
+        self.maintain = Maintain(**dict(kwargs, files=[], detach=True))
+
+        self.torrents = {}
+        self.paused = set()
+
+        self.__executor = ThreadPoolExecutor(workers)
+        self.__loop = None
+        self.__stopped = None
+        self.__connections = set()
+
+    async def add(self, paths: list) -> dict:
+        """ Load torrent files in parallel, skip ones already loaded
+
+        :return: {'added': [info_hash hex], 'duplicates': [info_hash hex], 'errors': {path: message}}
+        """
+        loop = asyncio.get_event_loop()
+        futures = [loop.run_in_executor(self.__executor, Torrent, path) for path in paths]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        response = {'added': [], 'duplicates': [], 'errors': {}}
+
+        for path, torrent in zip(paths, results):
+            if isinstance(torrent, Exception):
+                response['errors'][str(path)] = str(torrent)
+                continue
+
+            _hex = torrent.info_hash.hex()
+
+            if torrent.info_hash in self.torrents:
+                response['duplicates'].append(_hex)
+                continue
+
+            self.torrents[torrent.info_hash] = torrent
+            # Registered here, on the loop, so a remove() handled before process() runs is final
+            self.maintain.add(torrent)
+            future = self.__executor.submit(self.maintain.process, torrent)
+            future.add_done_callback(lambda _future, _path=path: self.__processed(_future, _path))
+            response['added'].append(_hex)
+
+        TORRENTS_LOADED.set(len(self.torrents))
+
+        return response
+
+    @staticmethod
+    def __processed(future, path: str) -> None:
+        exception = future.exception()
+
+        if exception is not None:
+            logger.error('Processing %s failed', path, exc_info=exception)
+
+    def find(self, keys: list) -> list:
+        """
+
+        :param keys: Info hashes in hex or torrent names
+        :raise: clutcher.exception.ControlException if a key matches no torrent
+        """
+        if not keys:
+            return list(self.torrents)
+
+        names = {}
+
+        for info_hash, torrent in self.torrents.items():
+            names.setdefault(torrent.name.decode('utf-8', 'replace'), []).append(info_hash)
+
+        info_hashes = []
+
+        for key in keys:
+            try:
+                info_hash = bytes.fromhex(key)
+            except ValueError:
+                info_hash = None
+
+            if info_hash in self.torrents:
+                info_hashes.append(info_hash)
+            elif key in names:
+                info_hashes.extend(names[key])
+            else:
+                raise ControlException(f'No torrent matches {key}')
+
+        return list(dict.fromkeys(info_hashes))
+
+    def remove(self, keys: list) -> dict:
+        if not keys:
+            raise ControlException('remove needs info hashes or names')
+
+        info_hashes = self.find(keys)
+
+        for info_hash in info_hashes:
+            self.maintain.remove(self.torrents.pop(info_hash))
+            self.paused.discard(info_hash)
+
+        TORRENTS_LOADED.set(len(self.torrents))
+
+        return {'removed': [info_hash.hex() for info_hash in info_hashes]}
+
+    def pause(self, keys: list) -> dict:
+        info_hashes = self.find(keys)
+        self.paused.update(info_hashes)
+
+        for info_hash in info_hashes:
+            self.maintain.pause(self.torrents[info_hash])
+
+        return {'paused': [info_hash.hex() for info_hash in info_hashes]}
+
+    def resume(self, keys: list) -> dict:
+        info_hashes = self.find(keys)
+        self.paused.difference_update(info_hashes)
+
+        for info_hash in info_hashes:
+            self.maintain.resume(self.torrents[info_hash])
+
+        return {'resumed': [info_hash.hex() for info_hash in info_hashes]}
+
+    def status(self, keys: list) -> dict:
+        torrents = []
+
+        for info_hash in self.find(keys):
+            torrent = self.torrents[info_hash]
+            torrents.append({
+                'info_hash': info_hash.hex(),
+                'name': torrent.name.decode('utf-8', 'replace'),
+                'torrent_path': str(torrent.torrent_path),
+                'total_length': torrent.total_length,
+                'files': len(torrent.files),
+                'state': 'paused' if info_hash in self.paused else 'active',
+            })
+
+        return {'torrents': torrents}
+
+    async def dispatch(self, request: dict) -> dict:
+        command = request.get('command')
+        keys = request.get('torrents') or []
+
+        if not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+            raise ControlException('torrents must be a list of strings')
+
+        if command not in self.COMMANDS:
+            raise ControlException(f'Unknown command {command}')
+
+        if command == 'add':
+            return await self.add(keys)
+
+        if command == 'stats':
+            return metrics.REGISTRY.snapshot()
+
+        if command == 'shutdown':
+            self.stop()
+
+            return {'stopping': True}
+
+        return getattr(self, command)(keys)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """ Serve requests of one client connection, one JSON object per line each way
+        """
+        try:
+            while True:
+                line = await reader.readline()
+
+                if not line:
+                    break
+
+                command = None
+
+                try:
+                    request = json.loads(line.decode('utf-8'))
+
+                    if not isinstance(request, dict):
+                        raise ControlException('Request must be a JSON object')
+
+                    command = request.get('command')
+                    response = await self.dispatch(request)
+                    CONTROL_COMMANDS.labels(command, 'ok').inc()
+                except (ControlException, ValueError, TypeError, AttributeError) as exception:
+                    response = {'error': str(exception)}
+                    # Arbitrary client input must not become a label
+                    CONTROL_COMMANDS.labels(command if command in self.COMMANDS else 'unknown', 'error').inc()
+
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """ Serve a client connection in a task, tracked so shutdown can cancel it
+        """
+        task = asyncio.ensure_future(self.handle(reader, writer))
+        self.__connections.add(task)
+        task.add_done_callback(self.__connections.discard)
+
+    async def watch(self) -> None:
+        loop = asyncio.get_event_loop()
+
+        while not self.__stopped.is_set():
+            paths = await loop.run_in_executor(self.__executor, self.watcher.scan)
+
+            if paths:
+                WATCHED_FILES.inc(len(paths))
+                await self.add(paths)
+
+            try:
+                await asyncio.wait_for(self.__stopped.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def choke(self) -> None:
+        """ Recompute upload slots every Choker.ROUND seconds
+        """
+        choker = self.maintain.choker
+
+        while not self.__stopped.is_set():
+            choker.run_round()
+
+            try:
+                await asyncio.wait_for(self.__stopped.wait(), choker.ROUND)
+            except asyncio.TimeoutError:
+                pass
+
+    def claim_socket(self) -> None:
+        """ Remove a socket file left by a daemon that did not exit cleanly
+
+        :raise: clutcher.exception.DaemonException if another daemon is listening
+        """
+        if not self.socket_path.exists():
+            return None
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as _socket:
+            try:
+                _socket.connect(str(self.socket_path))
+            except (ConnectionRefusedError, FileNotFoundError):
+                self.socket_path.unlink()
+                return None
+
+        raise DaemonException(f'Daemon is already running on {self.socket_path}')
+
+    async def serve(self, files: list = None) -> None:
+        self.__stopped = asyncio.Event()
+        self.claim_socket()
+
+        server = await asyncio.start_unix_server(self.connect, path=str(self.socket_path))
+        os.chmod(str(self.socket_path), 0o600)
+        watcher = asyncio.ensure_future(self.watch()) if self.watcher else None
+        choker = asyncio.ensure_future(self.choke())
+
+        try:
+            if files:
+                await self.add(files)
+
+            await self.__stopped.wait()
+        finally:
+            server.close()
+
+            # Idle clients would keep their handle() pending past loop.close()
+            connections = list(self.__connections)
+
+            for task in connections:
+                task.cancel()
+
+            await asyncio.gather(*connections, return_exceptions=True)
+            await server.wait_closed()
+
+            if watcher:
+                await watcher
+
+            await choker
+
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+
+    def run(self, files: list = None) -> None:
+        """ Serve until SIGTERM, SIGINT or the shutdown command
+        """
+        self.__loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.__loop)
+
+        for _signal in (signal.SIGTERM, signal.SIGINT):
+            self.__loop.add_signal_handler(_signal, self.stop)
+
+        try:
+            self.__loop.run_until_complete(self.serve(files))
+        finally:
+            self.__executor.shutdown()
+            self.__loop.close()
+
+    def stop(self) -> None:
+        if self.__stopped is not None:
+            self.__stopped.set()
+
+
+def detach() -> None:
+    """ Double fork into the background, the parent process exits
+
+        The working directory is kept, the database lives relative to it.
+    """
+    if os.fork():
+        os._exit(0)
+
+    os.setsid()
+
+    if os.fork():
+        os._exit(0)
+
+    _null = os.open(os.devnull, os.O_RDWR)
+
+    for _fd in (0, 1, 2):
+        os.dup2(_null, _fd)
+
+    os.close(_null)
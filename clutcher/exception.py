@@ -0,0 +1,6 @@
+class DaemonException(Exception):
+    pass
+
+
+class ControlException(Exception):
+    pass
@@ -1,8 +1,10 @@
 from concurrent.futures import ThreadPoolExecutor
 import threading
 
+from clutcher import metrics
 from database.database import Database
 from database.exception import WrongSchemeException
+from torrent.network.choker import Choker
 from torrent.structure.torrent import Torrent
 
 
@@ -16,39 +18,85 @@ class Maintain:
 
         # Other
         self.torrents = [Torrent(file) for file in self.files]
+        self.choker = Choker(slots=kwargs.get('upload_slots') or 4, global_slots=kwargs.get('global_upload_slots'))
+        self.__stopped = threading.Event()
+        self.__choking = None
+
+    @staticmethod
+    def is_complete(torrent: Torrent) -> bool:
+        """ All files exist with their full length. Pieces are not verified
+        """
+        _files = torrent.files
+
+        for index in range(len(_files)):
+            try:
+                if _files.path(index).stat().st_size != _files.lengths[index]:
+                    return False
+            except OSError:
+                return False
+
+        return True
+
+    def add(self, torrent: Torrent) -> None:
+        """ Register a torrent as leeching, call before process() on the thread that handles remove()
+        """
+        self.choker.add_torrent(torrent.info_hash)
 
     def process(self, torrent: Torrent) -> None:
         # self.save_to_database(torrent)
-        print(f'Task Executed {threading.current_thread()}')
+        # A no-op if the torrent was removed since add()
+        self.choker.seeding(torrent.info_hash, self.is_complete(torrent))
+        metrics.TORRENTS_PROCESSED.inc()
 
     def start(self) -> None:
+        """ Process all torrents, then run choking rounds every Choker.ROUND seconds on a
+        background thread until stop(). The daemon drives its own rounds instead
+        """
+        for torrent in self.torrents:
+            self.add(torrent)
+
         with ThreadPoolExecutor() as executor:
             running_tasks = [executor.submit(self.process, torrent) for torrent in self.torrents]
 
             for running_task in running_tasks:
                 running_task.result()
 
-    def pause(self):
-        raise NotImplementedError()
+        self.choker.run_round()
+        self.__stopped.clear()
+        self.__choking = threading.Thread(target=self.__choke, name='choker', daemon=True)
+        self.__choking.start()
+
+    def __choke(self) -> None:
+        while not self.__stopped.wait(self.choker.ROUND):
+            self.choker.run_round()
 
-    def resume(self):
-        raise NotImplementedError()
+    def pause(self, torrent: Torrent) -> None:
+        self.choker.pause(torrent.info_hash)
 
-    def stop(self):
-        raise NotImplementedError()
+    def resume(self, torrent: Torrent) -> None:
+        self.choker.resume(torrent.info_hash)
+
+    def remove(self, torrent: Torrent) -> None:
+        self.choker.remove_torrent(torrent.info_hash)
+
+    def stop(self) -> None:
+        self.__stopped.set()
+
+        if self.__choking is not None:
+            self.__choking.join()
+            self.__choking = None
 
     def save_to_database(self, torrent: Torrent, scheme: str = 'torrent') -> None:
         if not self.use_database:
             return None
 
+        if scheme != 'torrent':
+            raise WrongSchemeException(f'Scheme {scheme} not found')
+
         database = Database()
-        dict_data = torrent.get_dict()
-        _keys = dict_data.keys()
 
-        if scheme == 'torrent':
-            sql = f'INSERT INTO torrent ({", ".join(_keys)}) VALUES (:{", :".join(_keys)})'
-        else:
-            raise WrongSchemeException(f'Scheme {scheme} not found')
+        # Saved once per info_hash
+        with database.connection:
+            database.torrents.insert(torrent.get_dict(), conflict='IGNORE')
 
-        database.execute(sql, dict_data)
         database.close()
@@ -0,0 +1,313 @@
+""" In-process metrics
+
+    Counters, gauges and fixed-bucket histograms cheap enough for hot paths:
+    an update is a lock and an addition, a histogram observation adds a bisect.
+"""
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import json
+import os
+import pathlib
+import threading
+import time
+
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    __slots__ = ('lock', 'value')
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+    def sample(self) -> float:
+        return self.value
+
+
+class Gauge(Counter):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram) -> None:
+        self.histogram = histogram
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Histogram:
+    __slots__ = ('lock', 'buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS) -> None:
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        # The last one is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        _index = bisect_left(self.buckets, value)
+
+        with self.lock:
+            self.counts[_index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self) -> _Timer:
+        """ Observe duration of a with block in seconds
+        """
+        return _Timer(self)
+
+    def sample(self) -> dict:
+        with self.lock:
+            counts = list(self.counts)
+            _sum = self.sum
+            _count = self.count
+
+        cumulative = 0
+        buckets = {}
+
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+
+        return {'buckets': buckets, 'sum': _sum, 'count': _count}
+
+
+class Metric:
+    """ Named metric with optional labels
+
+        Unlabeled metrics are used directly: metric.inc(), labeled ones through
+        metric.labels('udp://tracker:80').inc(). Children are cached, so hot paths
+        can keep the child returned by labels().
+    """
+    TYPES = {'counter': Counter, 'gauge': Gauge, 'histogram': Histogram}
+
+    def __init__(self, _type: str, name: str, documentation: str, label_names: tuple = (), **kwargs) -> None:
+        self.type = _type
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+
+        self.__kwargs = kwargs
+        self.__lock = threading.Lock()
+        self.__children = {}
+
+    def labels(self, *values):
+        child = self.__children.get(values)
+
+        if child is not None:
+            return child
+
+        if len(values) != len(self.label_names):
+            raise ValueError(f'{self.name} expects labels {self.label_names}, got {values}')
+
+        with self.__lock:
+            return self.__children.setdefault(values, self.TYPES[self.type](**self.__kwargs))
+
+    def children(self) -> list:
+        with self.__lock:
+            return list(self.__children.items())
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+
+class Registry:
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, _type: str, name: str, documentation: str, labels: tuple = (), **kwargs) -> Metric:
+        with self.lock:
+            metric = self.metrics.get(name)
+
+            if metric is None:
+                metric = self.metrics[name] = Metric(_type, name, documentation, labels, **kwargs)
+            elif metric.type != _type or metric.label_names != tuple(labels):
+                raise ValueError(f'Metric {name} is already registered as {metric.type} {metric.label_names}')
+
+            return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple = ()) -> Metric:
+        return self.register('counter', name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str, labels: tuple = ()) -> Metric:
+        return self.register('gauge', name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Metric:
+        return self.register('histogram', name, documentation, labels, buckets=tuple(sorted(buckets)))
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            metrics = list(self.metrics.values())
+
+        _snapshot = {}
+
+        for metric in metrics:
+            _snapshot[metric.name] = {
+                'type': metric.type,
+                'help': metric.documentation,
+                'values': [{'labels': dict(zip(metric.label_names, values)), 'value': child.sample()}
+                           for values, child in metric.children()],
+            }
+
+        return _snapshot
+
+    def to_json(self) -> str:
+        return json.dumps({'time': time.time(), 'metrics': self.snapshot()}, indent=2)
+
+    def to_prometheus(self) -> str:
+        """ Prometheus text exposition format 0.0.4
+        """
+        lines = []
+
+        for name, metric in self.snapshot().items():
+            lines.append(f'# HELP {name} {_escape(metric["help"], quote=False)}')
+            lines.append(f'# TYPE {name} {metric["type"]}')
+
+            for value in metric['values']:
+                labels = value['labels']
+
+                if metric['type'] != 'histogram':
+                    lines.append(f'{name}{_labels(labels)} {value["value"]}')
+                    continue
+
+                for bound, count in value['value']['buckets'].items():
+                    lines.append(f'{name}_bucket{_labels(dict(labels, le=bound))} {count}')
+
+                lines.append(f'{name}_sum{_labels(labels)} {value["value"]["sum"]}')
+                lines.append(f'{name}_count{_labels(labels)} {value["value"]["count"]}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str, quote: bool = True) -> str:
+    value = value.replace('\\', '\\\\').replace('\n', '\\n')
+
+    return value.replace('"', '\\"') if quote else value
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ''
+
+    return '{' + ','.join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + '}'
+
+
+class SnapshotWriter(threading.Thread):
+    """ Write JSON snapshots of a registry to a file every interval seconds
+
+        The file is replaced atomically, readers never see a partial snapshot.
+    """
+    def __init__(self, path: str, interval: float = 10, registry: Registry = None) -> None:
+        super().__init__(name='metrics-snapshot', daemon=True)
+
+        self.path = pathlib.Path(path).resolve()
+        self.interval = interval
+        self.registry = registry or REGISTRY
+        self.__stopped = threading.Event()
+
+    def write(self) -> None:
+        _tmp = self.path.with_name(f'.{self.path.name}.tmp')
+        _tmp.write_text(self.registry.to_json(), 'utf-8')
+        os.replace(str(_tmp), str(self.path))
+
+    def run(self) -> None:
+        while not self.__stopped.wait(self.interval):
+            self.write()
+
+    def stop(self) -> None:
+        self.__stopped.set()
+        self.write()
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return None
+
+        body = self.registry.to_prometheus().encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def serve(port: int, host: str = '127.0.0.1', registry: Registry = None) -> HTTPServer:
+    """ Serve registry in Prometheus text format on http://host:port/metrics in a daemon thread
+
+    :return: Server, call shutdown() to stop it
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry or REGISTRY})
+    server = _ThreadingHTTPServer((host, port), handler)
+
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+
+    return server
+
+
+REGISTRY = Registry()
+
+# Well-known metrics, shared by subsystems
+TRACKER_RTT = REGISTRY.histogram('clutcher_tracker_rtt_seconds', 'Tracker request round trip time', ('tracker',))
+ANNOUNCES = REGISTRY.counter('clutcher_announces_total', 'Tracker announces by outcome', ('tracker', 'outcome'))
+SCRAPES = REGISTRY.counter('clutcher_scrapes_total', 'Tracker scrapes by outcome', ('tracker', 'outcome'))
+BYTES_RECEIVED = REGISTRY.counter('clutcher_received_bytes_total', 'Bytes received', ('source',))
+BYTES_SENT = REGISTRY.counter('clutcher_sent_bytes_total', 'Bytes sent', ('source',))
+HASHED_BYTES = REGISTRY.counter('clutcher_hashed_bytes_total', 'Bytes hashed with SHA1', ('purpose',))
+HASH_SECONDS = REGISTRY.counter('clutcher_hash_seconds_total', 'Time spent hashing', ('purpose',))
+DISK_QUEUE = REGISTRY.gauge('clutcher_disk_queue_depth', 'Pieces read from disk and waiting to be hashed')
+DB_COMMIT = REGISTRY.histogram('clutcher_database_commit_seconds', 'Database commit latency')
+DHT_MESSAGES = REGISTRY.counter('clutcher_dht_messages_total', 'DHT messages', ('direction', 'type'))
+DHT_LOOKUP = REGISTRY.histogram('clutcher_dht_lookup_seconds', 'DHT iterative lookup duration', ('method',))
+TORRENTS_PROCESSED = REGISTRY.counter('clutcher_torrents_processed_total', 'Torrents processed by Maintain')
@@ -0,0 +1,244 @@
+""" Profiling hooks for CLI and GUI runs
+
+    Two CPU modes:
+    - cprofile: deterministic, profiles every thread started while active, writes PATH.pstats.
+      Python 3.12+ allows one profiler per process, which mixes up call stacks of threads,
+      so sampling is used there instead
+    - sampling: a timer thread samples stacks of all threads, writes PATH.collapsed,
+      the collapsed-stack format flamegraph.pl, inferno and speedscope read
+
+    Time is attributed to subsystems by source file, see SUBSYSTEMS.
+"""
+import cProfile
+import collections
+import fnmatch
+import json
+import os
+import pathlib
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+
+# Source file patterns, built-in functions (cProfile reports them with file '~') match by name
+SUBSYSTEMS = {
+    'tracker': ('*/torrent/network/udp_tracker_protocol.py', '*/torrent/network/http_tracker.py'),
+    'dht': ('*/torrent/network/dht.py',),
+    'peers': ('*/torrent/network/peer_store.py', '*/torrent/network/choker.py'),
+    # Before parsing, maker.py is in the same package
+    'hashing': ('*/torrent/structure/maker.py', '*/hashlib.py', '<built-in method _hashlib.*>',
+                "<method '*' of '_hashlib.*' objects>"),
+    'parsing': ('*/torrent/structure/*', '*/bencodepy/*'),
+    'database': ('*/database/*.py', '*/sqlite3/*', "<method '*' of 'sqlite3.*' objects>"),
+    'disk': ('*/pathlib.py', '*/shutil.py', '*/tempfile.py', "<method '*' of '_io.*' objects>",
+             '<built-in method io.open>', '<built-in method _io.open>', '<built-in method posix.*>',
+             '<built-in method nt.*>'),
+}
+MODES = ('cprofile', 'sampling')
+# Statistics are grouped by line, deeper tracebacks only slow tracing down
+TRACE_MALLOC_FRAMES = 1
+
+
+def subsystem(filename: str, subsystems: tuple = tuple(SUBSYSTEMS), function: str = None) -> str:
+    """
+
+    :param filename: Source file name
+    :param subsystems: Names from SUBSYSTEMS to match against
+    :param function: Function name, matched instead of filename for built-ins
+    :return: Subsystem name or None
+    """
+    if filename == '~' and function:
+        filename = function
+
+    filename = filename.replace(os.sep, '/')
+
+    for name in subsystems:
+        for pattern in SUBSYSTEMS[name]:
+            if fnmatch.fnmatchcase(filename, pattern):
+                return name
+
+    return None
+
+
+class Sampler(threading.Thread):
+    """ Low-overhead sampling profiler
+
+        Every interval seconds takes stacks of all other threads with sys._current_frames,
+        so the profiled code runs without any tracing hook. The sampler competes for the
+        GIL, so the real gap between samples is often longer than interval: every sample
+        is weighted by the measured time since the previous one.
+    """
+    def __init__(self, interval: float = 0.005) -> None:
+        super().__init__(name='profiling-sampler', daemon=True)
+
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.seconds = collections.Counter()
+        self.__stopped = threading.Event()
+
+    def run(self) -> None:
+        _ident = threading.get_ident()
+        _labels = {}
+        _last = time.perf_counter()
+
+        while not self.__stopped.wait(self.interval):
+            _now = time.perf_counter()
+            _weight = _now - _last
+            _last = _now
+
+            for ident, frame in sys._current_frames().items():
+                if ident == _ident:
+                    continue
+
+                stack = []
+
+                while frame is not None:
+                    code = frame.f_code
+                    label = _labels.get(code)
+
+                    if label is None:
+                        label = _labels[code] = (f'{code.co_name} ({pathlib.Path(code.co_filename).name}:'
+                                                 f'{code.co_firstlineno})', code.co_filename)
+
+                    stack.append(label)
+                    frame = frame.f_back
+
+                stack.reverse()
+                stack = tuple(stack)
+                self.stacks[stack] += 1
+                self.seconds[stack] += _weight
+
+    def stop(self) -> None:
+        self.__stopped.set()
+        self.join()
+
+
+class Profiler:
+    """ Context manager profiling the with block
+
+        Does nothing if neither path nor trace_malloc are given, so it can wrap runs unconditionally.
+    """
+    def __init__(self, path: str = None, mode: str = 'cprofile', interval: float = 0.005, trace_malloc: int = 0,
+                 subsystems: list = None) -> None:
+        """
+
+        :param path: Output path prefix. PATH.pstats, PATH.collapsed, PATH.subsystems.json
+        and PATH.malloc.txt are written depending on options
+        :param mode: One of MODES
+        :param interval: Sampling interval in seconds, sampling mode only
+        :param trace_malloc: Number of top allocators to record, 0 disables tracemalloc
+        :param subsystems: Names from SUBSYSTEMS to restrict reports to, all by default
+        """
+        if mode not in MODES:
+            raise ValueError(f'Profiling mode must be one of {MODES}, got {mode}')
+
+        if path and mode == 'cprofile' and sys.version_info >= (3, 12):
+            print('Profiling: cprofile cannot profile threads on Python 3.12+, using sampling mode',
+                  file=sys.stderr)
+            mode = 'sampling'
+
+        self.path = path
+        self.mode = mode
+        self.interval = interval
+        self.trace_malloc = trace_malloc
+        self.subsystems = tuple(subsystems or SUBSYSTEMS)
+
+        self.__profiles = []
+        self.__sampler = None
+        self.__start = None
+
+    def __enter__(self):
+        if self.trace_malloc:
+            tracemalloc.start(TRACE_MALLOC_FRAMES)
+
+        if self.path and self.mode == 'cprofile':
+            self.__enable_cprofile()
+            threading.setprofile(self.__enable_cprofile)
+        elif self.path:
+            self.__sampler = Sampler(self.interval)
+            self.__sampler.start()
+
+        self.__start = time.perf_counter()
+
+        return self
+
+    def __enable_cprofile(self, *args) -> None:
+        # Called once per new thread, cProfile then replaces this hook
+        profile = cProfile.Profile()
+        self.__profiles.append(profile)
+        profile.enable()
+
+    def __exit__(self, *args) -> None:
+        elapsed = time.perf_counter() - self.__start
+
+        if self.path and self.mode == 'cprofile':
+            threading.setprofile(None)
+            self.__profiles[0].disable()
+            self.write_pstats(elapsed)
+        elif self.path:
+            self.__sampler.stop()
+            self.write_collapsed(elapsed)
+
+        if self.trace_malloc:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            self.write_malloc(snapshot)
+
+    def _output(self, suffix: str) -> pathlib.Path:
+        return pathlib.Path(f'{self.path}{suffix}').resolve()
+
+    def write_pstats(self, elapsed: float) -> None:
+        stats = pstats.Stats(*self.__profiles, stream=sys.stderr)
+        stats.dump_stats(str(self._output('.pstats')))
+
+        attributed = collections.Counter()
+
+        for (filename, _, function), (_, _, tottime, _, _) in stats.stats.items():
+            attributed[subsystem(filename, self.subsystems, function) or 'other'] += tottime
+
+        self.write_subsystems(attributed, elapsed, 'seconds')
+
+    def write_collapsed(self, elapsed: float) -> None:
+        attributed = collections.Counter()
+
+        with self._output('.collapsed').open('w', encoding='utf-8') as file:
+            for stack, count in self.__sampler.stacks.items():
+                # Innermost frame of a known subsystem owns the sample
+                _subsystems = (subsystem(filename, self.subsystems) for _, filename in reversed(stack))
+                _subsystem = next((name for name in _subsystems if name), None)
+                attributed[_subsystem or 'other'] += self.__sampler.seconds[stack]
+
+                if _subsystem or len(self.subsystems) == len(SUBSYSTEMS):
+                    file.write(f'{";".join(label for label, _ in stack)} {count}\n')
+
+        self.write_subsystems(attributed, elapsed, 'sampled thread seconds')
+
+    def write_subsystems(self, attributed: collections.Counter, elapsed: float, unit: str) -> None:
+        report = {
+            'mode': self.mode,
+            'elapsed': elapsed,
+            'subsystems': {name: attributed.get(name, 0.0) for name in self.subsystems + ('other',)},
+        }
+        self._output('.subsystems.json').write_text(json.dumps(report, indent=2), 'utf-8')
+
+        print(f'Profile ({self.mode}) written to {self._output("")}.*, {elapsed:.3f}s elapsed', file=sys.stderr)
+
+        for name, seconds in report['subsystems'].items():
+            print(f'  {name:<10} {seconds:10.3f} {unit}', file=sys.stderr)
+
+    def write_malloc(self, snapshot: tracemalloc.Snapshot) -> None:
+        if len(self.subsystems) != len(SUBSYSTEMS):
+            snapshot = snapshot.filter_traces([tracemalloc.Filter(True, pattern)
+                                               for name in self.subsystems for pattern in SUBSYSTEMS[name]])
+
+        lines = [f'Top {self.trace_malloc} allocators:']
+
+        for statistic in snapshot.statistics('lineno')[:self.trace_malloc]:
+            lines.append(str(statistic))
+
+        if self.path:
+            self._output('.malloc.txt').write_text('\n'.join(lines) + '\n', 'utf-8')
+        else:
+            print('\n'.join(lines), file=sys.stderr)
@@ -1,4 +1,5 @@
 from database.database import Database
+from database.query import Table
 from database.exception import WrongSchemeException
 from database.exception import WrongQueryException
 from database.exception import WrongRowFactoryException
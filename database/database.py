@@ -1,8 +1,9 @@
 import sqlite3
 import pathlib
 
-from clutcher import settings
+from clutcher import metrics, settings
 from database import exception
+from database.query import Table, stream
 
 
 class Row(sqlite3.Row):
@@ -19,30 +20,72 @@ class Row(sqlite3.Row):
 class Database:
     FETCH_MANY_AMOUNT = 100
     DEFAULT_ROW_FACTORY = 'Row'
+    # sqlite3 keeps this many prepared statements per connection
+    CACHED_STATEMENTS = 256
+    # PRAGMA user_version, see migrate()
+    SCHEMA_VERSION = 1
+    TORRENT_COLUMNS = {
+        'id': int,
+        'info_hash': bytes,
+        'name': str,
+        'state': str,
+        'torrent_path': str,
+        'path_to_save': str,
+        'created_by': str,
+        'comment': str,
+        'creation_date': int,
+    }
+    DHT_NODE_COLUMNS = {
+        'id': bytes,
+        'ip': str,
+        'port': int,
+    }
     _SQL_TORRENT_TABLE = """CREATE TABLE %s torrent (
                                             id integer PRIMARY KEY,
+                                            info_hash blob,
                                             name text NOT NULL,
+                                            state text NOT NULL DEFAULT 'active',
                                             torrent_path text,
                                             path_to_save text,
                                             created_by text,
                                             comment text,
-                                            creation_date text
+                                            creation_date integer
                                         )"""
+    _SQL_TORRENT_INDEXES = (
+        'CREATE UNIQUE INDEX IF NOT EXISTS torrent_info_hash ON torrent (info_hash)',
+        'CREATE INDEX IF NOT EXISTS torrent_name ON torrent (name)',
+        # Filtered by state, listed by name
+        'CREATE INDEX IF NOT EXISTS torrent_state ON torrent (state, name)',
+    )
+    _SQL_DHT_NODE_TABLE = """CREATE TABLE %s dht_node (
+                                            id blob PRIMARY KEY,
+                                            ip text NOT NULL,
+                                            port integer NOT NULL
+                                        )"""
+
+    def __init__(self, db_name: str = settings.NAME, database_path: str = None) -> None:
+        """
 
-    def __init__(self, db_name: str = settings.NAME) -> None:
-        _cwd = pathlib.Path.cwd()
+        :param database_path: Database file or ':memory:'. Defaults to database/data/<db_name>.db in the
+        working directory
+        """
+        if database_path is None:
+            database_path = (pathlib.Path.cwd() / 'database/data' / f'{db_name}.db').resolve()
 
-        self.database_path = (_cwd / 'database/data' / f'{db_name}.db').resolve()
+        self.database_path = database_path
         self.connection = self.database_path
         self.cursor = self.connection.cursor()
 
+        self.torrents = Table(self.connection, 'torrent', self.TORRENT_COLUMNS, not_null=('name', 'state'))
+        self.dht_nodes = Table(self.connection, 'dht_node', self.DHT_NODE_COLUMNS, not_null=('ip', 'port'))
+
     @property
     def connection(self) -> sqlite3.Connection:
         return self.__connection
 
     @connection.setter
     def connection(self, db_path: str, row_factory: str = DEFAULT_ROW_FACTORY) -> None:
-        _connection = sqlite3.connect(db_path)
+        _connection = sqlite3.connect(str(db_path), cached_statements=self.CACHED_STATEMENTS)
 
         if row_factory == self.DEFAULT_ROW_FACTORY:
             _connection.row_factory = Row
@@ -57,6 +100,54 @@ class Database:
         else:
             self.cursor.execute(query)
 
+        with metrics.DB_COMMIT.time():
+            self.connection.commit()
+
+    def executemany(self, query: str, values: list) -> None:
+        self.cursor.executemany(query, values)
+
+        with metrics.DB_COMMIT.time():
+            self.connection.commit()
+
+    def create_tables(self) -> None:
+        self.migrate()
+        self.create_table()
+        self.create_table(self._SQL_DHT_NODE_TABLE)
+
+        for query in self._SQL_TORRENT_INDEXES:
+            self.execute(query)
+
+        self.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+
+    def migrate(self) -> None:
+        """ Upgrade a torrent table created by an older version
+
+        Version 0 had no info_hash and state and stored creation_date as text: the
+        table is rebuilt, SQLite cannot change a column type in place. sqlite3 issues no
+        BEGIN before DDL, so the transaction is explicit: the rebuild and the new version
+        are committed together or not at all.
+        """
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(torrent)')]
+
+        if version >= 1 or not columns:
+            return None
+
+        _old = ('id', 'name', 'torrent_path', 'path_to_save', 'created_by', 'comment')
+
+        self.connection.execute('BEGIN')
+
+        try:
+            self.connection.execute('ALTER TABLE torrent RENAME TO torrent_v0')
+            self.connection.execute(self._SQL_TORRENT_TABLE % '')
+            self.connection.execute(f'INSERT INTO torrent ({", ".join(_old)}, creation_date) '
+                                    f'SELECT {", ".join(_old)}, CAST(creation_date AS integer) FROM torrent_v0')
+            self.connection.execute('DROP TABLE torrent_v0')
+            self.connection.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+        except BaseException:
+            self.connection.rollback()
+            raise
+
         self.connection.commit()
 
     def create_table(self, query: str = _SQL_TORRENT_TABLE, ignore_existence: bool = True) -> None:
@@ -80,31 +171,31 @@ class Database:
 
         self.execute(query % _if_not_exists)
 
-    def secure_fetchall(self, query: str) -> list:
-        _executed = self.cursor.execute(query)
-        _next = _executed.fetchmany(self.FETCH_MANY_AMOUNT)
-
-        while _next:
-            mapped_rows = self.rows_mapper(_next)
-            _next = _executed.fetchmany(self.FETCH_MANY_AMOUNT)
+    def secure_fetchall(self, query: str, values: tuple = ()) -> list:
+        """ Yield lists of at most FETCH_MANY_AMOUNT rows as dicts
+        """
+        _rows = []
 
-            yield mapped_rows
+        for row in self.stream(query, values):
+            _rows.append(row)
 
-    def delete_all_data(self):
-        self.execute('DELETE FROM torrent')
+            if len(_rows) == self.FETCH_MANY_AMOUNT:
+                yield _rows
+                _rows = []
 
-    @classmethod
-    def rows_mapper(cls, rows: list) -> list:
-        mapped_rows = []
+        if _rows:
+            yield _rows
 
-        for row in rows:
-            _keys = row.keys()
-            _values = [row.get(key) for key in _keys]
-            _zipped = zip(_keys, _values)
+    def stream(self, query: str, values: tuple = ()):
+        """ Iterate over rows as dicts, column names are mapped once per query
+        """
+        cursor = self.connection.cursor()
+        cursor.row_factory = None
 
-            mapped_rows.append(dict(_zipped))
+        return stream(cursor.execute(query, values))
 
-        return mapped_rows
+    def delete_all_data(self):
+        self.execute('DELETE FROM torrent')
 
     def close(self) -> None:
         self.connection.close()
@@ -0,0 +1,312 @@
+""" Query layer over sqlite3
+
+    SQL text is built once per query shape and cached, so the connection's prepared
+    statement cache is hit on every call after the first. Results are streamed: rows
+    are fetched FETCH_MANY_AMOUNT at a time as plain tuples, column names are read once
+    per cursor and each row becomes a dict with a single zip.
+"""
+from functools import lru_cache
+import os
+import sqlite3
+
+from database import exception
+
+
+FETCH_MANY_AMOUNT = 500
+
+
+def stream(cursor: sqlite3.Cursor, amount: int = FETCH_MANY_AMOUNT):
+    """ Iterate over executed cursor rows as dicts
+    """
+    _names = tuple(description[0] for description in cursor.description)
+    _fetchmany = cursor.fetchmany
+
+    rows = _fetchmany(amount)
+
+    while rows:
+        for row in rows:
+            yield dict(zip(_names, row))
+
+        rows = _fetchmany(amount)
+
+
+def coerce(column: str, _type: type, value):
+    """ Value as the column's python type: None, the type itself, or a lossless conversion
+
+    :raise: database.exception.WrongQueryException if value does not fit the column
+    """
+    if value is None or type(value) is _type:
+        return value
+
+    if _type is bytes and isinstance(value, (bytearray, memoryview)):
+        return bytes(value)
+
+    if _type is str and isinstance(value, (str, os.PathLike)):
+        return str(value)
+
+    if _type is int and isinstance(value, int):
+        return int(value)
+
+    if _type is float and isinstance(value, (int, float)):
+        return float(value)
+
+    raise exception.WrongQueryException(f'Column {column} takes {_type.__name__}, got {type(value).__name__}')
+
+
+def _where(where: tuple) -> str:
+    return f' WHERE {" AND ".join(f"{column} = ?" for column in where)}' if where else ''
+
+
+# SQL builders are cached on strings and tuples only: shared by all Table and Database
+# instances, and they keep no connection alive
+
+@lru_cache(maxsize=1024)
+def insert_sql(table: str, columns: tuple, conflict: str = None) -> str:
+    _or = f' OR {conflict}' if conflict else ''
+
+    return f'INSERT{_or} INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+
+
+@lru_cache(maxsize=1024)
+def select_sql(table: str, key: str, columns: tuple, where: tuple, order_by: str = None, descending: bool = False,
+               keyset: bool = False, limit: bool = False, nullable: bool = False, after_null: bool = False) -> str:
+    """
+
+    :param keyset: Rows after an (order_by, key) position, see Table.page
+    :param nullable: order_by may be NULL. SQLite sorts NULLs first ascending and last descending,
+    and comparisons with NULL are never true, so the NULL rows need their own branch
+    :param after_null: Position is in the NULL rows
+    """
+    _columns = ', '.join(columns) if columns else '*'
+    _conditions = [f'{column} = ?' for column in where]
+    _order = ''
+
+    if keyset:
+        _operator = '<' if descending else '>'
+
+        if order_by == key:
+            _conditions.append(f'{key} {_operator} ?')
+        elif after_null and descending:
+            _conditions.append(f'{order_by} IS NULL AND {key} < ?')
+        elif after_null:
+            _conditions.append(f'({order_by} IS NULL AND {key} > ? OR {order_by} IS NOT NULL)')
+        elif nullable and descending:
+            _conditions.append(f'(({order_by}, {key}) < (?, ?) OR {order_by} IS NULL)')
+        else:
+            _conditions.append(f'({order_by}, {key}) {_operator} (?, ?)')
+
+    if order_by:
+        _direction = ' DESC' if descending else ''
+        _order = f' ORDER BY {order_by}{_direction}'
+
+        if order_by != key:
+            _order += f', {key}{_direction}'
+
+    _where = f' WHERE {" AND ".join(_conditions)}' if _conditions else ''
+    _limit = ' LIMIT ?' if limit else ''
+
+    return f'SELECT {_columns} FROM {table}{_where}{_order}{_limit}'
+
+
+@lru_cache(maxsize=1024)
+def update_sql(table: str, columns: tuple, where: tuple) -> str:
+    return f'UPDATE {table} SET {", ".join(f"{column} = ?" for column in columns)}{_where(where)}'
+
+
+@lru_cache(maxsize=1024)
+def delete_sql(table: str, where: tuple) -> str:
+    return f'DELETE FROM {table}{_where(where)}'
+
+
+@lru_cache(maxsize=1024)
+def count_sql(table: str, where: tuple) -> str:
+    return f'SELECT count(*) FROM {table}{_where(where)}'
+
+
+class Table:
+    """ Typed queries on one table
+
+        Column names are checked against the table definition before they reach SQL,
+        values are coerced to the column types, see coerce(), and always bound as
+        parameters. Writes are not committed, wrap them in `with connection:`.
+
+        Usage:
+            torrents = Table(connection, 'torrent', TORRENT_COLUMNS)
+            torrents.insert({'name': 'x', 'info_hash': info_hash})
+            torrent = torrents.get('info_hash', info_hash)
+            rows, after = torrents.page(order_by='name', limit=100)
+            rows, after = torrents.page(order_by='name', after=after, limit=100)
+    """
+    CONFLICTS = (None, 'IGNORE', 'REPLACE')
+
+    def __init__(self, connection: sqlite3.Connection, name: str, columns: dict, key: str = 'id',
+                 not_null: tuple = ()) -> None:
+        """
+
+        :param columns: {column name: python type}, in table order. Values are coerced to the type
+        :param key: Unique NOT NULL column, used as pagination tie-breaker
+        :param not_null: NOT NULL columns, pagination over the others handles NULLs with extra conditions
+        """
+        self.connection = connection
+        self.name = name
+        self.columns = columns
+        self.key = key
+        self.not_null = frozenset(not_null) | {key}
+
+    def __check(self, columns) -> tuple:
+        columns = tuple(columns)
+
+        for column in columns:
+            if column not in self.columns:
+                raise exception.WrongQueryException(f'Table {self.name} has no column {column}')
+
+        return columns
+
+    def __values(self, columns: tuple, values) -> tuple:
+        _columns = self.columns
+
+        return tuple(value if value is None or type(value) is _columns[column] else
+                     coerce(column, _columns[column], value) for column, value in zip(columns, values))
+
+    def __cursor(self, sql: str, values=()) -> sqlite3.Cursor:
+        cursor = self.connection.cursor()
+        # Tuples are the cheapest rows, stream() names them once
+        cursor.row_factory = None
+
+        return cursor.execute(sql, values)
+
+    def __insert_sql(self, columns: tuple, conflict: str) -> str:
+        if conflict not in self.CONFLICTS:
+            raise exception.WrongQueryException(f'Conflict resolution must be one of {self.CONFLICTS}')
+
+        return insert_sql(self.name, columns, conflict)
+
+    def insert(self, row: dict, conflict: str = None) -> int:
+        """
+
+        :param conflict: None, 'IGNORE' or 'REPLACE'
+        :return: rowid
+        """
+        columns = self.__check(row)
+
+        return self.connection.execute(self.__insert_sql(columns, conflict),
+                                       self.__values(columns, row.values())).lastrowid
+
+    def insert_many(self, rows, conflict: str = None) -> None:
+        """
+
+        :param rows: Iterable of dicts with the same keys, consumed lazily
+        """
+        rows = iter(rows)
+        first = next(rows, None)
+
+        if first is None:
+            return None
+
+        columns = self.__check(first)
+        values = (self.__values(columns, [row[column] for column in columns]) for row in rows)
+
+        _sql = self.__insert_sql(columns, conflict)
+
+        self.connection.execute(_sql, self.__values(columns, [first[column] for column in columns]))
+        self.connection.executemany(_sql, values)
+
+    def get(self, column: str, value, columns: tuple = ()) -> dict:
+        """ First row with column = value, use with indexed columns
+
+        :return: dict or None
+        """
+        _where = self.__check((column,))
+        _sql = select_sql(self.name, self.key, self.__check(columns), _where, limit=True)
+
+        return next(stream(self.__cursor(_sql, self.__values(_where, (value,)) + (1,)), 1), None)
+
+    def select(self, columns: tuple = (), order_by: str = None, descending: bool = False, limit: int = None,
+               **where):
+        """ Stream rows matching where, e.g. select(state='active')
+
+        :return: Iterator of dicts
+        """
+        _where = self.__check(where)
+        _sql = select_sql(self.name, self.key, self.__check(columns), _where,
+                          order_by and self.__check((order_by,))[0], descending, limit=limit is not None)
+        values = self.__values(_where, where.values()) + ((limit,) if limit is not None else ())
+
+        return stream(self.__cursor(_sql, values))
+
+    def page(self, order_by: str = None, after: tuple = None, limit: int = 100, descending: bool = False,
+             columns: tuple = (), **where) -> tuple:
+        """ Keyset pagination: one indexed range scan per page, however deep the page is
+
+        :param order_by: Column to order by, the key by default. Ties are ordered by the key, NULLs come
+        first ascending and last descending
+        :param after: Position returned by the previous page, None for the first page
+        :return: (rows, position of the next page or None after the last page)
+        """
+        order_by = self.__check((order_by or self.key,))[0]
+        _where = self.__check(where)
+        _columns = self.__check(columns)
+
+        if _columns and (order_by not in _columns or self.key not in _columns):
+            _columns = _columns + tuple(column for column in (order_by, self.key) if column not in _columns)
+
+        _nullable = order_by not in self.not_null
+        _after_null = after is not None and _nullable and after[0] is None
+        _sql = select_sql(self.name, self.key, _columns, _where, order_by, descending, keyset=after is not None,
+                          limit=True, nullable=_nullable, after_null=_after_null)
+
+        if after is None:
+            _after = ()
+        elif order_by == self.key or _after_null:
+            _after = self.__values((self.key,), after[1:])
+        else:
+            _after = self.__values((order_by, self.key), after)
+
+        values = self.__values(_where, where.values()) + _after + (limit,)
+        rows = list(stream(self.__cursor(_sql, values), limit))
+
+        if len(rows) < limit:
+            return rows, None
+
+        return rows, (rows[-1][order_by], rows[-1][self.key])
+
+    def pages(self, order_by: str = None, limit: int = 100, descending: bool = False, columns: tuple = (),
+              **where):
+        """ All pages, each fetched with its own query: memory stays at one page
+
+        :return: Iterator of lists of dicts
+        """
+        after = None
+
+        while True:
+            rows, after = self.page(order_by, after, limit, descending, columns, **where)
+
+            if rows:
+                yield rows
+
+            if after is None:
+                break
+
+    def update(self, values: dict, **where) -> int:
+        """
+
+        :return: Number of updated rows
+        """
+        _columns = self.__check(values)
+        _where = self.__check(where)
+        _sql = update_sql(self.name, _columns, _where)
+
+        return self.connection.execute(_sql, self.__values(_columns, values.values())
+                                       + self.__values(_where, where.values())).rowcount
+
+    def delete(self, **where) -> int:
+        _where = self.__check(where)
+
+        return self.connection.execute(delete_sql(self.name, _where), self.__values(_where, where.values())).rowcount
+
+    def count(self, **where) -> int:
+        _where = self.__check(where)
+
+        _sql = count_sql(self.name, _where)
+
+        return self.connection.execute(_sql, self.__values(_where, where.values())).fetchone()[0]
@@ -37,7 +37,7 @@ setup(
     description='Torrent client',
     long_description=get_file('README.md'),
     long_description_content_type='text/markdown',
-    packages=find_packages(),
+    packages=find_packages(exclude=('benchmarks', 'benchmarks.*', 'tests', 'tests.*')),
     install_requires=[
         'bencode.py==4.0.0',
         'PyQt5==5.15.6',
@@ -0,0 +1,154 @@
+import random
+import time
+import unittest
+
+from clutcher.maintain import Maintain
+from torrent.network.choker import Choker
+
+
+LEECHING = b'l' * 20
+SEEDING = b's' * 20
+
+
+class ChokerTest(unittest.TestCase):
+    """ Choker with explicit clock values, a round every Choker.ROUND seconds
+    """
+    def setUp(self) -> None:
+        self.now = 1000.0
+
+    def choker(self, **kwargs) -> Choker:
+        return Choker(_random=random.Random(0), **kwargs)
+
+    def add_peers(self, choker: Choker, info_hash: bytes, rates: list, seeding: bool = False) -> list:
+        """ Interested peers, rates[i] bytes per second from peer i when leeching, to it when seeding
+
+        :return: Peers in rates order
+        """
+        choker.add_torrent(info_hash, seeding=seeding)
+        peers = [(f'10.{info_hash[0]}.0.{index}', 6881) for index in range(len(rates))]
+        # Connected long ago: no new peer weight in optimistic unchokes
+        _connected = self.now - 1000
+
+        for peer, rate in zip(peers, rates):
+            choker.connected(info_hash, peer, now=_connected)
+            choker.interested(info_hash, peer)
+
+            for second in range(20):
+                _add = choker.uploaded if seeding else choker.downloaded
+                _add(info_hash, peer, rate, now=self.now - 20 + second)
+
+        return peers
+
+    def unchoked(self, choker: Choker, info_hash: bytes, peers: list) -> set:
+        return {peer for peer in peers if not choker.is_choked(info_hash, peer)}
+
+    def test_regular_unchokes_best_peers(self) -> None:
+        for seeding in (False, True):
+            with self.subTest(seeding=seeding):
+                choker = self.choker(slots=3, optimistic=False)
+                peers = self.add_peers(choker, LEECHING, [10, 500, 20, 400, 300, 30], seeding=seeding)
+                changes = choker.run_round(now=self.now)
+
+                self.assertEqual(self.unchoked(choker, LEECHING, peers), {peers[1], peers[3], peers[4]})
+                _expected = [(LEECHING, peer, False) for peer in (peers[1], peers[3], peers[4])]
+                self.assertEqual(sorted(changes), sorted(_expected))
+                # Unchanged states are not reported again
+                self.assertEqual(choker.run_round(now=self.now + Choker.ROUND), [])
+
+    def test_uninterested_peers_stay_choked(self) -> None:
+        choker = self.choker(slots=3)
+        peers = self.add_peers(choker, LEECHING, [10, 500, 20])
+        choker.interested(LEECHING, peers[1], False)
+        choker.run_round(now=self.now)
+
+        self.assertNotIn(peers[1], self.unchoked(choker, LEECHING, peers))
+
+    def test_optimistic_unchoke_rotates(self) -> None:
+        choker = self.choker(slots=1)
+        peers = self.add_peers(choker, LEECHING, [1000] + [0] * 8)
+        optimistic = []
+
+        for round_ in range(Choker.OPTIMISTIC_ROUNDS * 6):
+            choker.run_round(now=self.now + round_ * Choker.ROUND)
+            unchoked = self.unchoked(choker, LEECHING, peers)
+
+            # One regular slot, one optimistic unchoke
+            self.assertEqual(len(unchoked), 2)
+            self.assertIn(peers[0], unchoked)
+            optimistic.append((unchoked - {peers[0]}).pop())
+
+        # Kept for OPTIMISTIC_ROUNDS rounds, then rotated
+        for start in range(0, len(optimistic), Choker.OPTIMISTIC_ROUNDS):
+            self.assertEqual(len(set(optimistic[start:start + Choker.OPTIMISTIC_ROUNDS])), 1)
+
+        self.assertGreater(len(set(optimistic)), 1)
+
+    def test_pause_and_resume(self) -> None:
+        choker = self.choker(slots=2)
+        peers = self.add_peers(choker, LEECHING, [100, 200, 300])
+        choker.run_round(now=self.now)
+        self.assertEqual(len(self.unchoked(choker, LEECHING, peers)), 3)
+
+        choker.pause(LEECHING)
+        changes = choker.run_round(now=self.now + Choker.ROUND)
+        self.assertEqual(self.unchoked(choker, LEECHING, peers), set())
+        self.assertTrue(all(choked for _, _, choked in changes))
+
+        choker.resume(LEECHING)
+        choker.run_round(now=self.now + 2 * Choker.ROUND)
+        self.assertGreaterEqual(self.unchoked(choker, LEECHING, peers), {peers[1], peers[2]})
+
+    def test_unknown_torrents_are_ignored(self) -> None:
+        choker = self.choker()
+        choker.pause(LEECHING)
+        choker.resume(LEECHING)
+        choker.seeding(LEECHING)
+
+        # pause did not register the torrent
+        with self.assertRaises(KeyError):
+            choker.connected(LEECHING, ('10.0.0.1', 6881))
+
+    def test_global_cap(self) -> None:
+        choker = self.choker(slots=4, global_slots=4, optimistic=False)
+        # Upload rates to seeding peers are far higher, they must not take all slots
+        leechers = self.add_peers(choker, LEECHING, [10, 20, 30, 40])
+        seeders = self.add_peers(choker, SEEDING, [10000, 20000, 30000, 40000], seeding=True)
+        choker.run_round(now=self.now)
+
+        self.assertEqual(self.unchoked(choker, LEECHING, leechers), {leechers[2], leechers[3]})
+        self.assertEqual(self.unchoked(choker, SEEDING, seeders), {seeders[2], seeders[3]})
+
+    def test_global_cap_odd_slot_goes_to_leeching(self) -> None:
+        choker = self.choker(slots=4, global_slots=3, optimistic=False)
+        leechers = self.add_peers(choker, LEECHING, [10, 20, 30, 40])
+        seeders = self.add_peers(choker, SEEDING, [10, 20, 30, 40], seeding=True)
+        choker.run_round(now=self.now)
+
+        self.assertEqual(len(self.unchoked(choker, LEECHING, leechers)), 2)
+        self.assertEqual(len(self.unchoked(choker, SEEDING, seeders)), 1)
+
+    def test_global_cap_not_reached(self) -> None:
+        choker = self.choker(slots=2, global_slots=10, optimistic=False)
+        leechers = self.add_peers(choker, LEECHING, [10, 20, 30])
+        seeders = self.add_peers(choker, SEEDING, [10, 20, 30], seeding=True)
+        choker.run_round(now=self.now)
+
+        self.assertEqual(len(self.unchoked(choker, LEECHING, leechers)), 2)
+        self.assertEqual(len(self.unchoked(choker, SEEDING, seeders)), 2)
+
+
+class MaintainChokingTest(unittest.TestCase):
+    def test_start_runs_rounds_until_stop(self) -> None:
+        maintain = Maintain(files=[])
+        maintain.choker.ROUND = 0.01
+        maintain.start()
+
+        try:
+            time.sleep(0.2)
+            self.assertGreater(maintain.choker.rounds, 2)
+        finally:
+            maintain.stop()
+
+        rounds = maintain.choker.rounds
+        time.sleep(0.05)
+        self.assertEqual(maintain.choker.rounds, rounds)
@@ -0,0 +1,255 @@
+import asyncio
+import json
+import os
+import pathlib
+import socket
+import tempfile
+import time
+import unittest
+
+from clutcher import control
+from clutcher.daemon import Daemon, Watcher
+from clutcher.exception import ControlException, DaemonException
+from torrent.structure.maker import TorrentMaker
+
+
+class WatcherTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write(self, name: str, content: bytes = b'd4:infod4:name1:aee', age: float = 10) -> str:
+        """ Write a file with an mtime age seconds in the past, i.e. already settled
+        """
+        path = self.path / name
+        path.write_bytes(content)
+        _mtime = time.time() - age
+        os.utime(str(path), (_mtime, _mtime))
+
+        return str(path)
+
+    def test_added(self) -> None:
+        watcher = Watcher(str(self.path), rescan=0)
+        self.assertEqual(watcher.scan(), [])
+
+        a = self.write('a.torrent')
+        b = self.write('b.torrent')
+        self.write('notes.txt')
+        self.write('.hidden.torrent')
+
+        self.assertEqual(sorted(watcher.scan()), [a, b])
+        self.assertEqual(watcher.scan(), [])
+
+    def test_modified(self) -> None:
+        watcher = Watcher(str(self.path), rescan=0)
+        a = self.write('a.torrent')
+        self.assertEqual(watcher.scan(), [a])
+
+        self.write('a.torrent', b'd4:infod4:name2:abee', age=5)
+
+        self.assertEqual(watcher.scan(), [a])
+        self.assertEqual(watcher.scan(), [])
+
+    def test_modified_in_place_found_by_rescan(self) -> None:
+        watcher = Watcher(str(self.path), rescan=3600)
+        a = self.write('a.torrent')
+        self.assertEqual(watcher.scan(), [a])
+        _mtime = os.stat(self.directory.name).st_mtime_ns
+
+        self.write('a.torrent', b'd4:infod4:name2:abee', age=5)
+        os.utime(self.directory.name, ns=(_mtime, _mtime))
+        self.assertEqual(watcher.scan(), [])
+
+        watcher.rescan = 0
+        self.assertEqual(watcher.scan(), [a])
+
+    def test_removed_and_added_again(self) -> None:
+        watcher = Watcher(str(self.path), rescan=0)
+        a = self.write('a.torrent')
+        self.assertEqual(watcher.scan(), [a])
+
+        os.unlink(a)
+        self.assertEqual(watcher.scan(), [])
+
+        self.write('a.torrent')
+        self.assertEqual(watcher.scan(), [a])
+
+    def test_files_being_written_wait_to_settle(self) -> None:
+        watcher = Watcher(str(self.path), settle=3600, rescan=0)
+        a = self.write('a.torrent', age=0)
+
+        self.assertEqual(watcher.scan(), [])
+        self.assertEqual(watcher.scan(), [a])
+
+    def test_missing_directory(self) -> None:
+        self.assertEqual(Watcher(str(self.path / 'missing')).scan(), [])
+
+
+class DaemonTest(unittest.TestCase):
+    """ Control protocol against a daemon serving on a temporary socket
+    """
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name)
+        self.socket_path = str(self.path / 'clutcher.sock')
+        self.torrents = {}
+
+        for name in ('alpha', 'beta'):
+            data = self.path / name
+            data.mkdir()
+            (data / 'file.bin').write_bytes(name.encode('utf-8') * 1000)
+            self.torrents[name] = str(TorrentMaker(str(data)).write(str(self.path / f'{name}.torrent')))
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.daemon = Daemon(self.socket_path)
+        self.serving = None
+
+    def tearDown(self) -> None:
+        if self.serving is not None and not self.serving.done():
+            self.daemon.stop()
+            self.loop.run_until_complete(self.serving)
+
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        self.directory.cleanup()
+
+    def session(self, function):
+        """ Serve while function runs on a thread, return its result
+        """
+        async def _session():
+            self.serving = asyncio.ensure_future(self.daemon.serve())
+
+            while not os.path.exists(self.socket_path):
+                await asyncio.sleep(0.01)
+
+            return await self.loop.run_in_executor(None, function)
+
+        return self.loop.run_until_complete(_session())
+
+    def request(self, command: str, torrents: list = None) -> dict:
+        return control.request(command, torrents, socket_path=self.socket_path, timeout=5)
+
+    def test_commands(self) -> None:
+        alpha, beta = self.torrents['alpha'], self.torrents['beta']
+
+        def _commands():
+            responses = [
+                self.request('add', [alpha, beta]),
+                self.request('add', [alpha, str(self.path / 'missing.torrent')]),
+                self.request('pause', ['alpha']),
+                self.request('status'),
+                self.request('resume', ['alpha']),
+            ]
+            info_hash = responses[0]['added'][1]
+            responses += [
+                self.request('remove', [info_hash]),
+                self.request('status'),
+            ]
+
+            with self.assertRaises(ControlException):
+                self.request('remove', [info_hash])
+
+            responses.append(self.request('shutdown'))
+
+            return responses
+
+        added, again, paused, status, resumed, removed, after, shutdown = self.session(_commands)
+        self.loop.run_until_complete(self.serving)
+
+        self.assertEqual(len(added['added']), 2)
+        self.assertEqual(again['duplicates'], added['added'][:1])
+        self.assertEqual(list(again['errors']), [str(self.path / 'missing.torrent')])
+        self.assertEqual(paused['paused'], added['added'][:1])
+        self.assertEqual({torrent['name']: torrent['state'] for torrent in status['torrents']},
+                         {'alpha': 'paused', 'beta': 'active'})
+        self.assertEqual(resumed['resumed'], added['added'][:1])
+        self.assertEqual(removed['removed'], added['added'][1:])
+        self.assertEqual([torrent['name'] for torrent in after['torrents']], ['alpha'])
+        self.assertEqual(shutdown, {'stopping': True})
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_bad_requests_keep_connection(self) -> None:
+        lines = [
+            b'not json\n',
+            b'[1]\n',
+            b'{"command": "status", "torrents": [1]}\n',
+            b'{"command": "status", "torrents": "alpha"}\n',
+            b'{"command": "unknown"}\n',
+            b'{"command": "status"}\n',
+        ]
+
+        def _requests():
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as _socket:
+                _socket.settimeout(5)
+                _socket.connect(self.socket_path)
+
+                with _socket.makefile('rb') as file:
+                    responses = []
+
+                    for line in lines:
+                        _socket.sendall(line)
+                        responses.append(json.loads(file.readline().decode('utf-8')))
+
+                    return responses
+
+        responses = self.session(_requests)
+
+        self.assertTrue(all('error' in response for response in responses[:-1]))
+        self.assertEqual(responses[-1], {'torrents': []})
+
+    def test_idle_client_does_not_block_shutdown(self) -> None:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as idle:
+            def _shutdown():
+                idle.connect(self.socket_path)
+
+                return self.request('shutdown')
+
+            self.assertEqual(self.session(_shutdown), {'stopping': True})
+            self.loop.run_until_complete(asyncio.wait_for(self.serving, 5))
+
+    def test_process_errors_are_logged(self) -> None:
+        def _fail(torrent):
+            raise RuntimeError('disk on fire')
+
+        self.daemon.maintain.process = _fail
+
+        with self.assertLogs('clutcher.daemon', 'ERROR') as logs:
+            self.session(lambda: self.request('add', [self.torrents['alpha']]))
+            self.daemon.stop()
+            self.loop.run_until_complete(self.serving)
+            # Daemon.run shuts the executor down, here it is left to finish the callback
+            time.sleep(0.1)
+
+        self.assertIn('disk on fire', '\n'.join(logs.output))
+
+    def test_second_daemon_on_same_socket(self) -> None:
+        def _claim():
+            with self.assertRaises(DaemonException):
+                Daemon(self.socket_path).claim_socket()
+
+        self.session(_claim)
+
+    def test_stale_socket_is_claimed(self) -> None:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+            stale.bind(self.socket_path)
+
+        Daemon(self.socket_path).claim_socket()
+
+        self.assertFalse(os.path.exists(self.socket_path))
+
+
+class ControlClientTest(unittest.TestCase):
+    def test_no_daemon(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(ControlException):
+                control.request('status', socket_path=os.path.join(directory, 'missing.sock'))
+
+            # Not a directory: an OSError other than refused or missing
+            pathlib.Path(directory, 'file').write_bytes(b'')
+
+            with self.assertRaises(ControlException):
+                control.request('status', socket_path=os.path.join(directory, 'file', 'clutcher.sock'))
@@ -0,0 +1,182 @@
+import pathlib
+import sqlite3
+import unittest
+
+from database.database import Database
+from database.exception import WrongQueryException
+
+
+_SQL_TORRENT_TABLE_V0 = """CREATE TABLE torrent (
+                               id integer PRIMARY KEY,
+                               name text NOT NULL,
+                               torrent_path text,
+                               path_to_save text,
+                               created_by text,
+                               comment text,
+                               creation_date text
+                           )"""
+
+
+class TableTest(unittest.TestCase):
+    ROWS = 23
+
+    def setUp(self) -> None:
+        self.database = Database(database_path=':memory:')
+        self.database.create_tables()
+        self.torrents = self.database.torrents
+
+        with self.database.connection:
+            self.torrents.insert_many({
+                'info_hash': bytes([index]) * 20,
+                # Ties and NULLs, so pages split inside runs of equal values
+                'name': f'torrent-{index % 5}',
+                'comment': None if index % 3 == 0 else f'comment-{index % 4}',
+                'creation_date': 1000 + index,
+                'state': 'paused' if index % 2 else 'active',
+            } for index in range(self.ROWS))
+
+    def tearDown(self) -> None:
+        self.database.close()
+
+    def ordered_ids(self, order_by: str, descending: bool = False, **where) -> list:
+        """ Expected order: SQLite sorts NULLs first ascending and last descending, ties by id
+        """
+        _direction = 'DESC' if descending else 'ASC'
+        _where = f'WHERE {" AND ".join(f"{column} = ?" for column in where)}' if where else ''
+        rows = self.database.connection.execute(f'SELECT id FROM torrent {_where} '
+                                                f'ORDER BY {order_by} {_direction}, id {_direction}',
+                                                tuple(where.values()))
+
+        return [row[0] for row in rows]
+
+    def test_crud(self) -> None:
+        with self.database.connection:
+            rowid = self.torrents.insert({'name': 'new', 'info_hash': b'n' * 20, 'torrent_path': pathlib.Path('/a')})
+            self.assertEqual(self.torrents.update({'state': 'paused'}, id=rowid), 1)
+
+        row = self.torrents.get('info_hash', bytearray(b'n' * 20), columns=('id', 'state', 'torrent_path'))
+        self.assertEqual(row, {'id': rowid, 'state': 'paused', 'torrent_path': '/a'})
+        self.assertEqual(self.torrents.count(state='paused'), self.ROWS // 2 + 1)
+        self.assertEqual([row['id'] for row in self.torrents.select(('id',), order_by='id', limit=2)], [1, 2])
+
+        with self.database.connection:
+            self.torrents.insert({'name': 'dup', 'info_hash': b'n' * 20}, conflict='IGNORE')
+            self.assertEqual(self.torrents.count(name='dup'), 0)
+            self.assertEqual(self.torrents.delete(id=rowid), 1)
+
+        self.assertIsNone(self.torrents.get('id', rowid))
+
+    def test_column_validation(self) -> None:
+        calls = [
+            lambda: self.torrents.insert({'name': 'x', 'bogus': 1}),
+            lambda: self.torrents.get('bogus', 1),
+            lambda: list(self.torrents.select(('name; DROP TABLE torrent',))),
+            lambda: list(self.torrents.select(bogus=1)),
+            lambda: self.torrents.page(order_by='bogus'),
+            lambda: self.torrents.update({'bogus': 1}, id=1),
+            lambda: self.torrents.count(bogus=1),
+            lambda: self.torrents.insert({'name': 'x'}, conflict='ABORT; --'),
+        ]
+
+        for call in calls:
+            with self.assertRaises(WrongQueryException):
+                call()
+
+    def test_type_validation(self) -> None:
+        calls = [
+            lambda: self.torrents.insert({'name': b'bytes'}),
+            lambda: self.torrents.insert({'name': 'x', 'creation_date': '2020'}),
+            lambda: self.torrents.get('info_hash', 'not bytes'),
+            lambda: self.torrents.update({'creation_date': 1.5}, id=1),
+            lambda: self.torrents.delete(id='1'),
+        ]
+
+        for call in calls:
+            with self.assertRaises(WrongQueryException):
+                call()
+
+        self.assertEqual(self.torrents.count(), self.ROWS)
+
+    def test_pages_match_order_by(self) -> None:
+        for order_by in ('id', 'name', 'comment', 'creation_date', 'info_hash'):
+            for descending in (False, True):
+                for limit in (1, 4, 7, 100):
+                    with self.subTest(order_by=order_by, descending=descending, limit=limit):
+                        pages = list(self.torrents.pages(order_by, limit, descending, columns=('id',)))
+                        ids = [row['id'] for rows in pages for row in rows]
+
+                        self.assertEqual(ids, self.ordered_ids(order_by, descending))
+                        self.assertTrue(all(len(rows) <= limit for rows in pages))
+
+    def test_pages_with_where(self) -> None:
+        pages = self.torrents.pages('comment', 2, columns=('id', 'state'), state='paused')
+        rows = [row for _rows in pages for row in _rows]
+
+        self.assertEqual([row['id'] for row in rows], self.ordered_ids('comment', state='paused'))
+        self.assertEqual({row['state'] for row in rows}, {'paused'})
+
+    def test_page_position(self) -> None:
+        rows, after = self.torrents.page(order_by='name', limit=3)
+        self.assertEqual(after, (rows[-1]['name'], rows[-1]['id']))
+
+        rows, after = self.torrents.page(order_by='name', after=after, limit=self.ROWS)
+        self.assertEqual(len(rows), self.ROWS - 3)
+        self.assertIsNone(after)
+
+
+class MigrationTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.database = Database(database_path=':memory:')
+
+    def tearDown(self) -> None:
+        self.database.close()
+
+    def columns(self) -> list:
+        return [row[1] for row in self.database.connection.execute('PRAGMA table_info(torrent)')]
+
+    def version(self) -> int:
+        return self.database.connection.execute('PRAGMA user_version').fetchone()[0]
+
+    def test_new_database(self) -> None:
+        self.database.create_tables()
+
+        self.assertIn('info_hash', self.columns())
+        self.assertEqual(self.version(), Database.SCHEMA_VERSION)
+
+    def test_migrate_v0(self) -> None:
+        with self.database.connection:
+            self.database.connection.execute(_SQL_TORRENT_TABLE_V0)
+            self.database.connection.execute("INSERT INTO torrent (name, comment, creation_date) "
+                                             "VALUES ('old', 'kept', '1500000000')")
+
+        self.database.create_tables()
+        row = next(self.database.torrents.select(('name', 'comment', 'creation_date', 'state', 'info_hash')))
+
+        self.assertEqual(row, {'name': 'old', 'comment': 'kept', 'creation_date': 1500000000, 'state': 'active',
+                               'info_hash': None})
+        self.assertEqual(self.version(), Database.SCHEMA_VERSION)
+
+        # Migrated once: a second start keeps the new columns
+        with self.database.connection:
+            self.database.torrents.update({'info_hash': b'i' * 20}, name='old')
+
+        self.database.create_tables()
+        self.assertEqual(self.database.torrents.get('name', 'old')['info_hash'], b'i' * 20)
+
+    def test_failed_migration_rolls_back(self) -> None:
+        connection = self.database.connection
+
+        with connection:
+            # A NULL name cannot be copied into the new table, the INSERT fails after ALTER and CREATE
+            connection.execute(_SQL_TORRENT_TABLE_V0.replace('name text NOT NULL', 'name text'))
+            connection.execute("INSERT INTO torrent (name) VALUES (NULL)")
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.database.migrate()
+
+        tables = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+
+        self.assertEqual(tables, ['torrent'])
+        self.assertNotIn('info_hash', self.columns())
+        self.assertEqual(self.version(), 0)
+        self.assertFalse(connection.in_transaction)
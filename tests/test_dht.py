@@ -0,0 +1,138 @@
+import asyncio
+import random
+import unittest
+
+import bencodepy
+
+from torrent.exception import KRPCException
+from torrent.network.dht import DHTNode
+
+
+class _MalformedNode(asyncio.DatagramProtocol):
+    """ Answers every query with wrongly typed nodes and values
+    """
+    def __init__(self, node_id: bytes) -> None:
+        self.transport = None
+        self.node_id = node_id
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, address: tuple) -> None:
+        message = bencodepy.decode(data)
+        response = {b'id': self.node_id, b'nodes': 7, b'values': [b'short', 1], b'token': b'x'}
+        self.transport.sendto(bencodepy.encode({b't': message[b't'], b'y': b'r', b'r': response}), address)
+
+
+class DHTSwarmTest(unittest.TestCase):
+    """ DHT nodes on localhost, every node bootstraps from the first one
+    """
+    NODES = 12
+
+    def setUp(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        _random = random.Random(0)
+        self.swarm = [DHTNode(node_id=_random.getrandbits(160).to_bytes(20, 'big'), host='127.0.0.1', port=0)
+                      for _ in range(self.NODES)]
+        self.info_hash = _random.getrandbits(160).to_bytes(20, 'big')
+
+        async def _start():
+            for node in self.swarm:
+                await node.start()
+
+            for node in self.swarm[1:]:
+                await node.bootstrap([(self.swarm[0].host, self.swarm[0].port)])
+
+        self.run_async(_start())
+
+    def tearDown(self) -> None:
+        for node in self.swarm:
+            node.stop()
+
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    @staticmethod
+    def address(node: DHTNode) -> tuple:
+        return node.host, node.port
+
+    def test_ping(self) -> None:
+        first, second = self.swarm[:2]
+
+        self.assertEqual(self.run_async(first.ping(self.address(second))), second.node_id)
+        self.assertIn((second.node_id, self.address(second)), list(first.routing_table))
+
+    def test_find_node(self) -> None:
+        target = self.swarm[-1]
+        result = self.run_async(self.swarm[1].find_node(target.node_id))
+
+        self.assertGreater(result.responses, 0)
+        self.assertEqual(result.nodes[0][:2], (target.node_id, self.address(target)))
+
+    def test_announce_and_get_peers(self) -> None:
+        self.run_async(self.swarm[3].announce(self.info_hash, port=6881))
+        result = self.run_async(self.swarm[7].get_peers(self.info_hash))
+
+        self.assertEqual(result.socket_addresses, [('127.0.0.1', 6881)])
+
+    def test_implied_port(self) -> None:
+        announcer = self.swarm[3]
+        self.run_async(announcer.announce(self.info_hash))
+        result = self.run_async(self.swarm[7].get_peers(self.info_hash))
+
+        self.assertEqual(result.socket_addresses, [self.address(announcer)])
+
+    def test_rejected_announces(self) -> None:
+        first, second = self.swarm[:2]
+        token = self.run_async(first.query(self.address(second), 'get_peers', {b'info_hash': self.info_hash}))[b'token']
+        bad = [
+            {b'info_hash': self.info_hash, b'port': 6881, b'token': b'forged!!'},
+            {b'info_hash': self.info_hash, b'port': 70000, b'token': token},
+            {b'info_hash': self.info_hash, b'port': b'6881', b'token': token},
+            {b'info_hash': b'short', b'port': 6881, b'token': token},
+        ]
+
+        for arguments in bad:
+            with self.assertRaises(KRPCException):
+                self.run_async(first.query(self.address(second), 'announce_peer', arguments))
+
+        self.assertEqual(second.stored_peers(self.info_hash), [])
+
+    def test_peer_store_bound(self) -> None:
+        first, second = self.swarm[:2]
+        second.MAX_INFO_HASHES = 3
+        second.MAX_PEERS_PER_INFO_HASH = 2
+        token = self.run_async(first.query(self.address(second), 'get_peers', {b'info_hash': self.info_hash}))[b'token']
+        info_hashes = [bytes([index]) * 20 for index in range(5)]
+
+        for info_hash in info_hashes:
+            for port in (1, 2, 3):
+                self.run_async(first.query(self.address(second), 'announce_peer',
+                                           {b'info_hash': info_hash, b'port': port, b'token': token}))
+
+        stored = [second.stored_peers(info_hash) for info_hash in info_hashes]
+
+        self.assertEqual([len(peers) for peers in stored], [0, 0, 2, 2, 2])
+        self.assertEqual([peer[-2:] for peer in stored[-1]], [b'\x00\x03', b'\x00\x02'])
+
+    def test_malformed_response_does_not_abort_lookup(self) -> None:
+        searcher = self.swarm[5]
+        self.run_async(self.swarm[3].announce(self.info_hash, port=6881))
+
+        # Closest to the info hash, so every lookup queries it
+        node_id = self.info_hash[:-1] + bytes([self.info_hash[-1] ^ 1])
+        transport, malformed = self.run_async(
+            self.loop.create_datagram_endpoint(lambda: _MalformedNode(node_id), local_addr=('127.0.0.1', 0)))
+
+        try:
+            searcher.routing_table.add(malformed.node_id, transport.get_extra_info('sockname')[:2])
+            result = self.run_async(searcher.get_peers(self.info_hash))
+        finally:
+            transport.close()
+
+        self.assertEqual(result.socket_addresses, [('127.0.0.1', 6881)])
+        self.assertNotIn(malformed.node_id, [node_id for node_id, _, _ in result.nodes])
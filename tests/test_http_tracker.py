@@ -0,0 +1,113 @@
+import asyncio
+import unittest
+
+from benchmarks.tracker import StandInTracker
+from torrent.exception import TrackerFailureException
+from torrent.network.http_tracker import ConnectionPool, HTTPTrackerClient
+from torrent.network.peer_store import PeerStore
+
+
+INFO_HASH = bytes(range(20))
+PEER_ID = b'-CL0001-' + bytes(12)
+
+
+class HTTPTrackerClientTest(unittest.TestCase):
+    """ HTTPTrackerClient against the local stand-in tracker
+    """
+    def setUp(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.tracker = None
+        self.client = None
+
+    def tearDown(self) -> None:
+        if self.client:
+            self.client.close()
+
+        if self.tracker:
+            self.run_async(self.tracker.stop())
+
+        self.loop.close()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def start(self, **kwargs) -> str:
+        self.tracker = StandInTracker(**kwargs)
+        self.client = HTTPTrackerClient(ConnectionPool(max_per_host=4, max_idle=4), timeout=5)
+
+        return self.run_async(self.tracker.start())
+
+    def test_announce(self) -> None:
+        url = self.start(peers=3, interval=900)
+        response = self.run_async(self.client.announce(url, INFO_HASH, PEER_ID))
+
+        self.assertEqual(response.interval, 900)
+        self.assertEqual(response.complete, 10)
+        self.assertEqual(response.incomplete, 5)
+        self.assertEqual(response.socket_addresses, [('10.0.0.0', 6881), ('10.0.0.1', 6881), ('10.0.0.2', 6881)])
+
+        peers = PeerStore()
+        response.add_to(peers)
+        self.assertEqual(len(peers), 3)
+        self.assertIn(('10.0.0.1', 6881), peers)
+
+    def test_keep_alive_reuses_connection(self) -> None:
+        url = self.start()
+
+        for _ in range(5):
+            self.run_async(self.client.announce(url, INFO_HASH, PEER_ID))
+
+        self.assertEqual(self.tracker.requests, 5)
+        self.assertEqual(self.tracker.connections, 1)
+        self.assertEqual(self.client.pool.opened, 1)
+
+    def test_connection_close(self) -> None:
+        url = self.start(keep_alive=False)
+
+        for _ in range(3):
+            self.run_async(self.client.announce(url, INFO_HASH, PEER_ID))
+
+        self.assertEqual(self.tracker.connections, 3)
+
+    def test_chunked_body(self) -> None:
+        url = self.start(framing='chunked')
+
+        for _ in range(2):
+            response = self.run_async(self.client.announce(url, INFO_HASH, PEER_ID))
+            self.assertEqual(len(response.socket_addresses), 50)
+
+        self.assertEqual(self.tracker.connections, 1)
+
+    def test_close_delimited_body(self) -> None:
+        url = self.start(framing='close')
+
+        for _ in range(2):
+            response = self.run_async(self.client.announce(url, INFO_HASH, PEER_ID))
+            self.assertEqual(response.interval, 1800)
+            self.assertEqual(len(response.socket_addresses), 50)
+
+        self.assertEqual(self.tracker.connections, 2)
+
+    def test_announce_many(self) -> None:
+        url = self.start()
+        requests = [{'url': url, 'info_hash': i.to_bytes(20, 'big'), 'peer_id': PEER_ID} for i in range(20)]
+        responses = self.run_async(self.client.announce_many(requests))
+
+        self.assertEqual([len(response.socket_addresses) for response in responses], [50] * 20)
+        self.assertLessEqual(self.tracker.connections, 4)
+
+    def test_failure_reason(self) -> None:
+        url = self.start()
+
+        with self.assertRaises(TrackerFailureException):
+            self.run_async(self.client.announce(url, b'short', PEER_ID))
+
+    def test_scrape(self) -> None:
+        url = self.start()
+        stats = self.run_async(self.client.scrape(url, [INFO_HASH]))
+
+        self.assertEqual(stats, {INFO_HASH: {'complete': 10, 'downloaded': 100, 'incomplete': 5}})
+
+
+if __name__ == '__main__':
+    unittest.main()
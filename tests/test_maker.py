@@ -0,0 +1,74 @@
+import hashlib
+import pathlib
+import random
+import tempfile
+import unittest
+
+from torrent.structure.maker import TorrentMaker
+
+
+PIECE_LENGTH = 2 ** 14
+# Files smaller than, equal to and larger than a piece, so pieces span up to four files
+LENGTHS = (1, 5000, PIECE_LENGTH, 3 * PIECE_LENGTH + 7, 0, 123, PIECE_LENGTH - 1, 2 * PIECE_LENGTH)
+
+
+class TorrentMakerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name) / 'data'
+        self.path.mkdir()
+        _random = random.Random(0)
+        contents = {}
+
+        # Named so that the sorted order, which is the piece order, differs from creation order
+        for index, length in enumerate(LENGTHS):
+            name = f'{len(LENGTHS) - index:02}'
+            contents[name] = bytes(_random.getrandbits(8) for _ in range(length))
+            (self.path / name).mkdir()
+            (self.path / name / 'file.bin').write_bytes(contents[name])
+
+        self.data = b''.join(contents[name] for name in sorted(contents))
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    @staticmethod
+    def serial_pieces(data: bytes, piece_length: int) -> bytes:
+        return b''.join(hashlib.sha1(data[start:start + piece_length]).digest()
+                        for start in range(0, len(data), piece_length))
+
+    def test_pieces_match_serial_hashing(self) -> None:
+        for workers in (1, 4):
+            for piece_length in (PIECE_LENGTH, 2 * PIECE_LENGTH):
+                with self.subTest(workers=workers, piece_length=piece_length):
+                    maker = TorrentMaker(str(self.path), piece_length=piece_length, workers=workers)
+
+                    self.assertEqual(maker.total_length, len(self.data))
+                    self.assertEqual(maker.hash_pieces(), self.serial_pieces(self.data, piece_length))
+
+    def test_info(self) -> None:
+        info = TorrentMaker(str(self.path), piece_length=PIECE_LENGTH, workers=4).build_info()
+
+        self.assertEqual(info[b'name'], b'data')
+        self.assertEqual(info[b'pieces'], self.serial_pieces(self.data, PIECE_LENGTH))
+        self.assertEqual([file[b'path'] for file in info[b'files']][:2], [[b'01', b'file.bin'], [b'02', b'file.bin']])
+        self.assertEqual(sum(file[b'length'] for file in info[b'files']), len(self.data))
+
+    def test_single_file(self) -> None:
+        path = self.path / '05' / 'file.bin'
+        info = TorrentMaker(str(path), piece_length=PIECE_LENGTH, workers=4).build_info()
+
+        self.assertEqual(info[b'length'], path.stat().st_size)
+        self.assertEqual(info[b'pieces'], self.serial_pieces(path.read_bytes(), PIECE_LENGTH))
+
+    def test_no_data(self) -> None:
+        empty = pathlib.Path(self.directory.name) / 'empty'
+        (empty / 'nested').mkdir(parents=True)
+
+        with self.assertRaises(ValueError):
+            TorrentMaker(str(empty))
+
+        (empty / 'nested' / 'zero.bin').write_bytes(b'')
+
+        with self.assertRaises(ValueError):
+            TorrentMaker(str(empty))
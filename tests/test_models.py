@@ -0,0 +1,138 @@
+import os
+import time
+import unittest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import QCoreApplication, Qt
+
+from ui.models import TorrentStats, TorrentTableModel
+
+
+_application = QCoreApplication.instance() or QCoreApplication([])
+
+
+class TorrentTableModelTest(unittest.TestCase):
+    """ Model without a view, the refresh timer is stopped and flush is called explicitly
+    """
+    def setUp(self) -> None:
+        self.stats = TorrentStats()
+
+        for index, name in enumerate(('delta', 'Alpha', 'charlie', 'bravo')):
+            self.stats.append(bytes([index]) * 20, name, size=(index + 1) * 1024)
+
+        self.model = TorrentTableModel(self.stats)
+        self.model.timer.stop()
+        self.changed = []
+        self.model.dataChanged.connect(lambda first, last: self.changed.append((first.row(), last.row())))
+
+    def tearDown(self) -> None:
+        self.model.close()
+
+    def names(self) -> list:
+        return [self.model.data(self.model.index(row, 0)) for row in range(self.model.rowCount())]
+
+    def wait_sorted(self) -> None:
+        _deadline = time.monotonic() + 5
+
+        while self.model._sorting:
+            self.assertLess(time.monotonic(), _deadline, 'sort did not finish')
+            QCoreApplication.processEvents()
+            time.sleep(0.001)
+
+    def test_data(self) -> None:
+        self.assertEqual(self.model.rowCount(), 4)
+        self.assertEqual(self.model.columnCount(), len(TorrentTableModel.COLUMNS))
+        self.assertEqual(self.model.headerData(1, Qt.Horizontal), 'Size')
+
+        row = self.stats.row(b'\x01' * 20)
+        self.stats.update(row, progress=0.5, download_rates=3 * 1024 ** 2, states=2)
+        cells = [self.model.data(self.model.index(row, column)) for column in range(self.model.columnCount())]
+
+        self.assertEqual(cells, ['Alpha', '2.0 KiB', '50.0%', '3.0 MiB/s', '0 B/s', '0', '0', 'downloading'])
+        self.assertIsNone(self.model.data(self.model.index(row, 0), Qt.TextAlignmentRole))
+        self.assertIsNotNone(self.model.data(self.model.index(row, 1), Qt.TextAlignmentRole))
+
+    def test_flush_adds_rows(self) -> None:
+        self.stats.append(b'e' * 20, 'echo')
+        # Already known, not added twice
+        self.stats.append(b'\x00' * 20, 'delta')
+        self.assertEqual(self.model.rowCount(), 4)
+
+        self.model.flush()
+
+        self.assertEqual(self.model.rowCount(), 5)
+        self.assertEqual(self.names()[-1], 'echo')
+
+    def test_coalesce(self) -> None:
+        self.assertEqual(TorrentTableModel.coalesce([3]), [(3, 3)])
+        self.assertEqual(TorrentTableModel.coalesce([0, 1, 2, 5, 7, 8]), [(0, 2), (5, 5), (7, 8)])
+
+        rows = list(range(0, 4 * TorrentTableModel.MAX_RANGES, 2))
+        self.assertEqual(TorrentTableModel.coalesce(rows), [(rows[0], rows[-1])])
+
+    def test_flush_coalesces_changes(self) -> None:
+        for _ in range(3):
+            for row in (0, 1, 3):
+                self.stats.update(row, upload_rates=1.0)
+
+        self.model.flush()
+        self.assertEqual(self.changed, [(0, 1), (3, 3)])
+
+        # Nothing dirty, nothing emitted
+        self.model.flush()
+        self.assertEqual(len(self.changed), 2)
+
+    def test_sort(self) -> None:
+        self.model.sort(0)
+        self.wait_sorted()
+        self.assertEqual(self.names(), ['Alpha', 'bravo', 'charlie', 'delta'])
+
+        self.model.sort(1, Qt.DescendingOrder)
+        self.wait_sorted()
+        self.assertEqual(self.names(), ['bravo', 'charlie', 'Alpha', 'delta'])
+
+        # Dirty rows are reported at their sorted position
+        self.stats.update(self.stats.row(b'\x03' * 20), upload_rates=1.0)
+        self.model.flush()
+        self.assertEqual(self.changed, [(0, 0)])
+
+    def test_changes_to_sort_column_sort_again(self) -> None:
+        self.model.sort(1)
+        self.wait_sorted()
+        self.assertEqual(self.names(), ['delta', 'Alpha', 'charlie', 'bravo'])
+
+        self.stats.update(self.stats.row(b'\x00' * 20), sizes=10 * 1024)
+        self.model.flush()
+        self.wait_sorted()
+        self.assertEqual(self.names(), ['Alpha', 'charlie', 'bravo', 'delta'])
+
+        # Appended rows take their sorted place too
+        self.stats.append(b'e' * 20, 'echo', size=1)
+        self.model.flush()
+        self.wait_sorted()
+        self.assertEqual(self.names()[0], 'echo')
+
+    def test_other_columns_keep_order(self) -> None:
+        self.model.sort(0)
+        self.wait_sorted()
+        generation = self.model._sort_generation
+
+        self.stats.update(0, progress=1.0)
+        self.model.flush()
+
+        self.assertEqual(self.model._sort_generation, generation)
+        self.assertFalse(self.model._sorting)
+
+    def test_changes_during_sort_sort_once_more(self) -> None:
+        self.model.sort(1)
+        self.stats.update(self.stats.row(b'\x00' * 20), sizes=10 * 1024)
+        self.model.flush()
+        self.stats.update(self.stats.row(b'\x01' * 20), sizes=20 * 1024)
+        self.model.flush()
+        # Queued behind the running sort, not submitted
+        self.assertEqual(self.model._sort_generation, 1)
+
+        self.wait_sorted()
+        self.assertEqual(self.model._sort_generation, 2)
+        self.assertEqual(self.names(), ['charlie', 'bravo', 'delta', 'Alpha'])
@@ -0,0 +1,136 @@
+import unittest
+
+from torrent.network.peer_store import PeerStore
+
+
+class PeerStoreTest(unittest.TestCase):
+    """ PeerStore with explicit clock values, in seconds since store creation
+    """
+    def test_deduplicates_across_sources(self) -> None:
+        store = PeerStore()
+        store.add_many([('10.0.0.1', 6881), ('10.0.0.2', 6881)], now=0)
+        store.add_compact(bytes([10, 0, 0, 1, 0x1a, 0xe1, 10, 0, 0, 3, 0x1a, 0xe1]), now=5)
+        store.add('2001:db8::1', 6881, now=5)
+        store.add_compact6(bytes.fromhex('20010db8000000000000000000000001') + (6881).to_bytes(2, 'big'), now=6)
+
+        self.assertEqual(len(store), 4)
+        self.assertIn(('10.0.0.3', 6881), store)
+        self.assertEqual(store.state('10.0.0.1', 6881)['last_seen'], 5)
+        self.assertEqual(store.state('2001:db8::1', 6881)['last_seen'], 6)
+
+    def test_candidate_order(self) -> None:
+        store = PeerStore()
+        store.add('10.0.0.1', 1, now=0)
+        store.add('10.0.0.2', 1, now=0)
+        store.add('10.0.0.3', 1, now=0)
+
+        first, second, third = (store.next_candidate(now=0) for _ in range(3))
+        self.assertIsNone(store.next_candidate(now=0))
+
+        store.failed(*first, now=10)
+        store.disconnected(*second, now=10)
+        store.add('10.0.0.4', 1, now=10)
+
+        # New peers first, reconnects after BACKOFF, failed peers after their backoff
+        self.assertEqual(store.next_candidate(now=10), ('10.0.0.4', 1))
+        self.assertIsNone(store.next_candidate(now=10 + PeerStore.BACKOFF - 1))
+        self.assertEqual(store.next_candidate(now=10 + PeerStore.BACKOFF), second)
+        self.assertIsNone(store.next_candidate(now=10 + PeerStore.backoff(1) - 1))
+        self.assertEqual(store.next_candidate(now=10 + PeerStore.backoff(1)), first)
+        self.assertEqual(store.state(*first)['failures'], 1)
+        self.assertTrue(store.state(*third)['connected'])
+
+    def test_backoff_grows_until_forgotten(self) -> None:
+        store = PeerStore()
+        store.add('10.0.0.1', 1, now=0)
+        now = 0
+
+        for failures in range(1, PeerStore.MAX_FAILURES + 1):
+            peer = store.next_candidate(now=now)
+            store.failed(*peer, now=now)
+            self.assertEqual(store.state(*peer)['retry_at'], now + PeerStore.backoff(failures))
+            now += PeerStore.backoff(failures)
+
+        store.failed(*store.next_candidate(now=now), now=now)
+        self.assertEqual(len(store), 0)
+
+    def test_reconnected_peer_does_not_block_queue(self) -> None:
+        store = PeerStore()
+        store.add('10.0.0.1', 1, now=0)
+        store.add('10.0.0.2', 1, now=0)
+        first = store.next_candidate(now=0)
+        second = store.next_candidate(now=0)
+
+        # first leaves an entry for retry at 65 in the reconnect queue, then is queued again for 75
+        store.disconnected(*first, now=50)
+        store.connected(*first, now=51)
+        store.disconnected(*second, now=50)
+        store.disconnected(*first, now=60)
+
+        self.assertEqual(store.next_candidate(now=70), second)
+        self.assertIsNone(store.next_candidate(now=70))
+        self.assertEqual(store.next_candidate(now=75), first)
+
+    def test_unknown_peers_are_ignored(self) -> None:
+        store = PeerStore()
+        store.connected('10.0.0.1', 1)
+        store.disconnected('10.0.0.1', 1)
+        store.failed('10.0.0.1', 1)
+
+        self.assertEqual(len(store), 0)
+
+    def test_ban(self) -> None:
+        store = PeerStore(max_peers=2)
+        store.add('10.0.0.1', 1, now=0)
+        store.add('10.0.0.2', 1, now=0)
+        store.next_candidate(now=0)
+        store.next_candidate(now=0)
+
+        # Full, nothing to evict: the ban is kept all the same
+        store.ban('10.0.0.3', 1)
+        store.ban('10.0.0.1', 1)
+        store.add('10.0.0.3', 1, now=1)
+        store.add('10.0.0.1', 1, now=1)
+        store.failed('10.0.0.1', 1, now=1)
+
+        self.assertTrue(store.is_banned('10.0.0.3', 1))
+        self.assertTrue(store.state('10.0.0.1', 1)['banned'])
+        self.assertNotIn(('10.0.0.1', 1), store)
+        self.assertNotIn(('10.0.0.3', 1), store)
+        self.assertEqual(len(store), 1)
+
+    def test_bans_are_bounded(self) -> None:
+        store = PeerStore(max_bans=3)
+
+        for port in range(1, 6):
+            store.ban('10.0.0.1', port)
+
+        self.assertEqual([store.is_banned('10.0.0.1', port) for port in range(1, 6)],
+                         [False, False, True, True, True])
+
+    def test_eviction_bound(self) -> None:
+        store = PeerStore(max_peers=3)
+
+        for host in range(1, 4):
+            store.add(f'10.0.0.{host}', 1, now=0)
+
+        connected = store.next_candidate(now=0)
+        failed = store.next_candidate(now=0)
+        store.failed(*failed, now=0)
+
+        # The idle peer with the most failures makes room, connected peers stay
+        store.add('10.0.0.4', 1, now=1)
+        self.assertEqual(len(store), 3)
+        self.assertNotIn(failed, store)
+        self.assertIn(connected, store)
+
+        store.next_candidate(now=1)
+        store.next_candidate(now=1)
+        store.add('10.0.0.5', 1, now=1)
+        self.assertEqual(len(store), 3)
+        self.assertNotIn(('10.0.0.5', 1), store)
+
+        for _ in range(100):
+            store.add_many([(f'10.1.0.{host}', 1) for host in range(50)], now=2)
+
+        self.assertLessEqual(len(store), 3)
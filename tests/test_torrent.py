@@ -0,0 +1,51 @@
+import os
+import pathlib
+import tempfile
+import unittest
+
+import bencodepy
+
+from torrent.structure.torrent import Torrent
+
+
+class TorrentTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write(self, info: dict) -> str:
+        info = {b'name': b'data', b'piece length': 2 ** 14, b'pieces': b'p' * 20, **info}
+        path = self.path / 'data.torrent'
+        path.write_bytes(bencodepy.encode({b'announce': b'http://127.0.0.1/announce', b'info': info}))
+
+        return str(path)
+
+    def test_files(self) -> None:
+        torrent = Torrent(self.write({b'files': [
+            {b'path': [b'a', b'one.bin'], b'length': 3},
+            {b'path': [b'a', b'..', b'two.bin'], b'length': 5},
+        ]}))
+        _root = pathlib.Path.cwd().resolve() / 'data'
+
+        self.assertEqual(list(torrent.files), [{'path': _root / 'a' / 'one.bin', 'length': 3},
+                                               {'path': _root / 'two.bin', 'length': 5}])
+        self.assertEqual(list(torrent.files.offsets), [0, 3])
+        self.assertEqual(torrent.total_length, 8)
+
+    def test_single_file(self) -> None:
+        torrent = Torrent(self.write({b'length': 7}))
+
+        self.assertEqual(torrent.files[0], {'path': pathlib.Path.cwd().resolve() / 'data', 'length': 7})
+        self.assertEqual(torrent.total_length, 7)
+
+    def test_data_decoded_is_read_once(self) -> None:
+        path = self.write({b'length': 7})
+        torrent = Torrent(path)
+        data_decoded = torrent.data_decoded
+        os.unlink(path)
+
+        self.assertIs(torrent.data_decoded, data_decoded)
+        self.assertEqual(data_decoded[b'info'][b'length'], 7)
@@ -1,2 +1,3 @@
 from torrent.exception import WrongMessageException
 from torrent.structure.torrent import Torrent
+from torrent.structure.maker import TorrentMaker
@@ -4,3 +4,15 @@ class WrongMessageException(Exception):
 
 class IsNotInitialized(Exception):
     pass
+
+
+class TrackerFailureException(Exception):
+    pass
+
+
+class HTTPException(Exception):
+    pass
+
+
+class KRPCException(Exception):
+    pass
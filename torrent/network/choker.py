@@ -0,0 +1,319 @@
+""" Upload slot scheduler (BEP 3 choking)
+
+    Every ROUND seconds the interested peers of each torrent are ranked and the best
+    ones get the upload slots. Leeching torrents rank peers by how fast they send to us
+    (tit-for-tat), seeding torrents by how fast we send to them, so slots go to peers
+    that can take the bandwidth. On top of that, one optimistic unchoke per torrent
+    rotates every OPTIMISTIC_ROUNDS rounds to find better partners.
+
+    A round selects with heapq.nlargest, O(peers log slots), and reports only changed
+    choke states. Download and upload rates are not comparable, so a global slot cap is
+    shared between leeching and seeding torrents in proportion to their candidates, and
+    each share goes to the best peers by its own rate.
+"""
+from array import array
+from operator import itemgetter
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from clutcher import metrics
+
+
+CHOKE_CHANGES = metrics.REGISTRY.counter('clutcher_choke_changes_total', 'Choke state changes', ('change',))
+UNCHOKED = metrics.REGISTRY.gauge('clutcher_unchoked_peers', 'Unchoked peers, optimistic ones included')
+CHOKE_ROUND = metrics.REGISTRY.histogram('clutcher_choke_round_seconds', 'Choking round duration')
+
+
+class RateEstimator:
+    """ Bytes per second over a sliding window of one-second buckets
+    """
+    __slots__ = ('window', 'buckets', 'total', 'second', 'start')
+
+    WINDOW = 20
+
+    def __init__(self, now: float, window: int = WINDOW) -> None:
+        self.window = window
+        self.buckets = array('Q', bytes(8 * window))
+        self.total = 0
+        self.second = int(now)
+        self.start = now
+
+    def __advance(self, second: int) -> None:
+        if second <= self.second:
+            return None
+
+        if second - self.second >= self.window:
+            self.buckets = array('Q', bytes(8 * self.window))
+            self.total = 0
+        else:
+            for _second in range(self.second + 1, second + 1):
+                _index = _second % self.window
+                self.total -= self.buckets[_index]
+                self.buckets[_index] = 0
+
+        self.second = second
+
+    def add(self, amount: int, now: float) -> None:
+        _second = int(now)
+        self.__advance(_second)
+        self.buckets[_second % self.window] += amount
+        self.total += amount
+
+    def rate(self, now: float) -> float:
+        self.__advance(int(now))
+
+        # Young estimators average over their age, not the whole window
+        return self.total / max(1.0, min(self.window, now - self.start))
+
+
+class _Peer:
+    __slots__ = ('interested', 'choked', 'connected_at', 'download', 'upload')
+
+    def __init__(self, now: float) -> None:
+        self.interested = False
+        self.choked = True
+        self.connected_at = now
+        self.download = RateEstimator(now)
+        self.upload = RateEstimator(now)
+
+
+class _Torrent:
+    __slots__ = ('seeding', 'paused', 'peers', 'optimistic')
+
+    def __init__(self, seeding: bool) -> None:
+        self.seeding = seeding
+        self.paused = False
+        self.peers = {}
+        self.optimistic = None
+
+
+class Choker:
+    """ Choking scheduler for all torrents
+
+        Feed it with peer events and call run_round() every ROUND seconds (due() tells
+        when). Peers are (ip, port) tuples. Thread-safe.
+
+        Usage:
+            choker = Choker(slots=4, global_slots=200)
+            choker.add_torrent(torrent.info_hash, seeding=True)
+            choker.connected(torrent.info_hash, peer)
+            choker.interested(torrent.info_hash, peer, True)
+            for info_hash, peer, choked in choker.run_round():
+                ...
+    """
+    ROUND = 10
+    OPTIMISTIC_ROUNDS = 3
+    # Newly connected peers are this many times as likely to be unchoked optimistically
+    NEW_PEER_WEIGHT = 3
+
+    def __init__(self, slots: int = 4, global_slots: int = None, optimistic: bool = True,
+                 _random: random.Random = None) -> None:
+        """
+
+        :param slots: Regular upload slots per torrent
+        :param global_slots: Regular upload slots over all torrents, unlimited if None
+        :param optimistic: Keep an optimistic unchoke per torrent on top of the regular slots
+        """
+        self.slots = slots
+        self.global_slots = global_slots
+        self.optimistic = optimistic
+        self.random = _random or random.Random()
+
+        self.rounds = 0
+        self.last_round = None
+        self.__lock = threading.Lock()
+        self.__torrents = {}
+
+    def add_torrent(self, info_hash: bytes, seeding: bool = False) -> None:
+        with self.__lock:
+            torrent = self.__torrents.get(info_hash)
+
+            if torrent is None:
+                self.__torrents[info_hash] = _Torrent(seeding)
+            else:
+                torrent.seeding = seeding
+
+    def remove_torrent(self, info_hash: bytes) -> None:
+        with self.__lock:
+            torrent = self.__torrents.pop(info_hash, None)
+
+        if torrent is not None:
+            UNCHOKED.dec(sum(not peer.choked for peer in torrent.peers.values()))
+
+    def seeding(self, info_hash: bytes, seeding: bool = True) -> None:
+        """ Torrents not added or already removed are ignored
+        """
+        with self.__lock:
+            torrent = self.__torrents.get(info_hash)
+
+            if torrent is not None:
+                torrent.seeding = seeding
+
+    def pause(self, info_hash: bytes) -> None:
+        """ All peers of a paused torrent are choked on the next round. Unknown torrents are ignored
+        """
+        with self.__lock:
+            torrent = self.__torrents.get(info_hash)
+
+            if torrent is not None:
+                torrent.paused = True
+
+    def resume(self, info_hash: bytes) -> None:
+        with self.__lock:
+            torrent = self.__torrents.get(info_hash)
+
+            if torrent is not None:
+                torrent.paused = False
+
+    def connected(self, info_hash: bytes, peer: tuple, now: float = None) -> None:
+        now = time.monotonic() if now is None else now
+
+        with self.__lock:
+            self.__torrents[info_hash].peers.setdefault(peer, _Peer(now))
+
+    def disconnected(self, info_hash: bytes, peer: tuple) -> None:
+        with self.__lock:
+            torrent = self.__torrents.get(info_hash)
+
+            if torrent is None:
+                return None
+
+            _peer = torrent.peers.pop(peer, None)
+
+            if _peer is not None and not _peer.choked:
+                UNCHOKED.dec()
+
+            if torrent.optimistic == peer:
+                torrent.optimistic = None
+
+    def interested(self, info_hash: bytes, peer: tuple, interested: bool = True) -> None:
+        with self.__lock:
+            self.__torrents[info_hash].peers[peer].interested = interested
+
+    def downloaded(self, info_hash: bytes, peer: tuple, amount: int, now: float = None) -> None:
+        """ Peer sent us amount bytes of piece data
+        """
+        now = time.monotonic() if now is None else now
+
+        with self.__lock:
+            self.__torrents[info_hash].peers[peer].download.add(amount, now)
+
+    def uploaded(self, info_hash: bytes, peer: tuple, amount: int, now: float = None) -> None:
+        """ We sent peer amount bytes of piece data
+        """
+        now = time.monotonic() if now is None else now
+
+        with self.__lock:
+            self.__torrents[info_hash].peers[peer].upload.add(amount, now)
+
+    def rates(self, info_hash: bytes, peer: tuple, now: float = None) -> tuple:
+        """
+
+        :return: (download rate, upload rate) in bytes per second
+        """
+        now = time.monotonic() if now is None else now
+
+        with self.__lock:
+            _peer = self.__torrents[info_hash].peers[peer]
+
+            return _peer.download.rate(now), _peer.upload.rate(now)
+
+    def is_choked(self, info_hash: bytes, peer: tuple) -> bool:
+        with self.__lock:
+            return self.__torrents[info_hash].peers[peer].choked
+
+    def due(self, now: float = None) -> bool:
+        now = time.monotonic() if now is None else now
+
+        return self.last_round is None or now - self.last_round >= self.ROUND
+
+    def run_round(self, now: float = None) -> list:
+        """ Recompute upload slots
+
+        :return: List of (info_hash, peer, choked) for peers whose choke state changed
+        """
+        now = time.monotonic() if now is None else now
+
+        with CHOKE_ROUND.time(), self.__lock:
+            self.last_round = now
+            self.rounds += 1
+            rotate = self.rounds % self.OPTIMISTIC_ROUNDS == 1
+            _slots = self.slots
+            # Ranked by download rate and by upload rate
+            leeching = []
+            seeding = []
+
+            for info_hash, torrent in self.__torrents.items():
+                if torrent.paused:
+                    continue
+
+                if torrent.seeding:
+                    candidates = ((peer.upload.rate(now), key) for key, peer in torrent.peers.items()
+                                  if peer.interested)
+                    winners = seeding
+                else:
+                    candidates = ((peer.download.rate(now), key) for key, peer in torrent.peers.items()
+                                  if peer.interested)
+                    winners = leeching
+
+                for rate, key in heapq.nlargest(_slots, candidates, key=itemgetter(0)):
+                    winners.append((rate, info_hash, key))
+
+            _total = len(leeching) + len(seeding)
+
+            if self.global_slots is not None and _total > self.global_slots:
+                # Rounded down for seeding, leeching torrents trade and get the odd slot
+                _seeding_slots = self.global_slots * len(seeding) // _total
+                seeding = heapq.nlargest(_seeding_slots, seeding, key=itemgetter(0))
+                leeching = heapq.nlargest(self.global_slots - _seeding_slots, leeching, key=itemgetter(0))
+
+            unchoke = {}
+
+            for _, info_hash, key in itertools.chain(leeching, seeding):
+                unchoke.setdefault(info_hash, set()).add(key)
+
+            changes = []
+
+            for info_hash, torrent in self.__torrents.items():
+                _unchoke = unchoke.get(info_hash, set())
+
+                if self.optimistic:
+                    self.__optimistic_unchoke(torrent, _unchoke, rotate, now)
+
+                if torrent.optimistic is not None:
+                    _unchoke.add(torrent.optimistic)
+
+                for key, peer in torrent.peers.items():
+                    choked = key not in _unchoke
+
+                    if choked != peer.choked:
+                        peer.choked = choked
+                        changes.append((info_hash, key, choked))
+
+        for _, _, choked in changes:
+            CHOKE_CHANGES.labels('choke' if choked else 'unchoke').inc()
+            UNCHOKED.inc(-1 if choked else 1)
+
+        return changes
+
+    def __optimistic_unchoke(self, torrent: _Torrent, unchoke: set, rotate: bool, now: float) -> None:
+        if torrent.paused:
+            torrent.optimistic = None
+            return None
+
+        current = torrent.peers.get(torrent.optimistic)
+
+        if not rotate and current is not None and current.interested and torrent.optimistic not in unchoke:
+            return None
+
+        _new = now - self.ROUND * self.OPTIMISTIC_ROUNDS
+        candidates = []
+
+        for key, peer in torrent.peers.items():
+            if peer.interested and key not in unchoke:
+                candidates.extend([key] * (self.NEW_PEER_WEIGHT if peer.connected_at > _new else 1))
+
+        torrent.optimistic = self.random.choice(candidates) if candidates else None
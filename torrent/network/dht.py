@@ -0,0 +1,576 @@
+""" Mainline DHT node (BEP 5)
+
+    Kademlia over KRPC: bencoded dictionaries in UDP datagrams. One asyncio datagram
+    endpoint multiplexes all transactions, lookups query ALPHA nodes in parallel.
+"""
+import asyncio
+import collections
+import hashlib
+import heapq
+import os
+import socket
+import time
+
+import bencodepy
+
+from clutcher import metrics
+from torrent.exception import KRPCException
+
+
+class RoutingTable:
+    """ k-bucket routing table
+
+        Bucket i holds nodes whose XOR distance to own id has bit length i + 1. A node is
+        an id and a packed address, ip << 16 | port, both ints. Buckets are ordered from least
+        to most recently seen, a full bucket only takes a new node if its least recently seen
+        node failed FAILURES_TO_REPLACE queries.
+    """
+    K = 8
+    FAILURES_TO_REPLACE = 2
+
+    def __init__(self, node_id: bytes) -> None:
+        self.node_id = int.from_bytes(node_id, 'big')
+        self.buckets = [collections.OrderedDict() for _ in range(160)]
+        self.failures = {}
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self.buckets)
+
+    def __iter__(self):
+        for bucket in self.buckets:
+            for node_id, address in bucket.items():
+                yield node_id.to_bytes(20, 'big'), self.unpack(address)
+
+    @staticmethod
+    def pack(address: tuple) -> int:
+        ip, port = address
+
+        return int.from_bytes(socket.inet_aton(ip), 'big') << 16 | port
+
+    @staticmethod
+    def unpack(address: int) -> tuple:
+        return socket.inet_ntoa((address >> 16).to_bytes(4, 'big')), address & 0xffff
+
+    def __bucket(self, node_id: int) -> collections.OrderedDict:
+        return self.buckets[(node_id ^ self.node_id).bit_length() - 1]
+
+    def add(self, node_id: bytes, address: tuple) -> bool:
+        """ Add or refresh a node which responded or sent a query
+
+        :return: True if the node is in the table
+        """
+        _node_id = int.from_bytes(node_id, 'big')
+
+        if _node_id == self.node_id:
+            return False
+
+        bucket = self.__bucket(_node_id)
+        self.failures.pop(_node_id, None)
+
+        if _node_id in bucket:
+            bucket.move_to_end(_node_id)
+            bucket[_node_id] = self.pack(address)
+            return True
+
+        if len(bucket) >= self.K:
+            oldest = next(iter(bucket))
+
+            if self.failures.get(oldest, 0) < self.FAILURES_TO_REPLACE:
+                return False
+
+            del bucket[oldest]
+            self.failures.pop(oldest, None)
+
+        bucket[_node_id] = self.pack(address)
+
+        return True
+
+    def failed(self, node_id: bytes) -> None:
+        _node_id = int.from_bytes(node_id, 'big')
+
+        if _node_id in self.__bucket(_node_id):
+            self.failures[_node_id] = self.failures.get(_node_id, 0) + 1
+
+    def closest(self, target: bytes, count: int = K) -> list:
+        """
+
+        :return: Up to count (node id, (ip, port)) closest to target by XOR distance
+        """
+        _target = int.from_bytes(target, 'big')
+        nodes = ((node_id, address) for bucket in self.buckets for node_id, address in bucket.items())
+        closest = heapq.nsmallest(count, nodes, key=lambda node: node[0] ^ _target)
+
+        return [(node_id.to_bytes(20, 'big'), self.unpack(address)) for node_id, address in closest]
+
+    @classmethod
+    def encode_nodes(cls, nodes: list) -> bytes:
+        """ Compact node info: 20 bytes id, 4 bytes IPv4, 2 bytes port per node
+        """
+        return b''.join(node_id + socket.inet_aton(ip) + port.to_bytes(2, 'big') for node_id, (ip, port) in nodes)
+
+    @classmethod
+    def decode_nodes(cls, payload: bytes) -> list:
+        nodes = []
+
+        for start in range(0, len(payload) - len(payload) % 26, 26):
+            nodes.append((payload[start:start + 20], (socket.inet_ntoa(payload[start + 20:start + 24]),
+                                                      int.from_bytes(payload[start + 24:start + 26], 'big'))))
+
+        return nodes
+
+
+class LookupResult:
+    """ Outcome and cost of an iterative lookup
+    """
+    def __init__(self, target: bytes) -> None:
+        self.target = target
+        self.peers = set()
+        # (node id, address, token) of nodes which responded, closest first
+        self.nodes = []
+        self.queries = 0
+        self.responses = 0
+        self.duration = None
+
+    @property
+    def socket_addresses(self) -> list:
+        return [(socket.inet_ntoa(peer[:4]), int.from_bytes(peer[4:6], 'big')) for peer in self.peers]
+
+    def get_dict(self) -> dict:
+        return {
+            'peers': len(self.peers),
+            'nodes': len(self.nodes),
+            'queries': self.queries,
+            'responses': self.responses,
+            'duration': self.duration,
+        }
+
+
+class DHTNode(asyncio.DatagramProtocol):
+    """ DHT node
+
+        Usage:
+            node = DHTNode(port=6881)
+            await node.start()
+            await node.bootstrap([('router.bittorrent.com', 6881)])
+            result = await node.get_peers(torrent.info_hash)
+            torrent.peers.add_many(result.socket_addresses)
+    """
+    ALPHA = 3
+    K = RoutingTable.K
+    QUERY_TIMEOUT = 2.0
+    TOKEN_ROTATION = 300
+    PEER_TTL = 1800
+    MAX_INFO_HASHES = 2000
+    MAX_PEERS_PER_INFO_HASH = 1000
+    MAX_VALUES = 50
+
+    def __init__(self, node_id: bytes = None, host: str = '0.0.0.0', port: int = 6881) -> None:
+        self.node_id = node_id or os.urandom(20)
+        self.host = host
+        self.port = port
+
+        self.routing_table = RoutingTable(self.node_id)
+        self.transport = None
+        self.messages = collections.Counter()
+
+        self.__transaction = 0
+        self.__transactions = {}
+        self.__secrets = [os.urandom(16), os.urandom(16)]
+        self.__secrets_rotated = time.monotonic()
+        # info_hash -> {compact peer: last announce}, both ordered from least to most recently announced
+        self.__peers = collections.OrderedDict()
+
+    async def start(self) -> None:
+        loop = asyncio.get_event_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: self, local_addr=(self.host, self.port))
+        self.host, self.port = self.transport.get_extra_info('sockname')[:2]
+
+    def stop(self) -> None:
+        for future, _ in self.__transactions.values():
+            if not future.done():
+                future.cancel()
+
+        self.__transactions.clear()
+
+        if self.transport:
+            self.transport.close()
+
+    def __count(self, direction: str, _type: str) -> None:
+        self.messages[(direction, _type)] += 1
+        metrics.DHT_MESSAGES.labels(direction, _type).inc()
+
+    def __send(self, message: dict, address: tuple, _type: str) -> None:
+        self.transport.sendto(bencodepy.encode(message), address)
+        self.__count('sent', _type)
+
+    # Transactions
+
+    def __transaction_id(self) -> bytes:
+        while True:
+            self.__transaction = (self.__transaction + 1) & 0xffff
+            transaction_id = self.__transaction.to_bytes(2, 'big')
+
+            if transaction_id not in self.__transactions:
+                return transaction_id
+
+    async def query(self, address: tuple, name: str, arguments: dict) -> dict:
+        """ Send a query and wait for its response
+
+        :return: Response dict "r"
+        :raise: asyncio.TimeoutError, torrent.exception.KRPCException on KRPC error
+        """
+        transaction_id = self.__transaction_id()
+        future = asyncio.get_event_loop().create_future()
+        self.__transactions[transaction_id] = (future, address)
+
+        arguments = dict(arguments)
+        arguments[b'id'] = self.node_id
+
+        try:
+            self.__send({b't': transaction_id, b'y': b'q', b'q': name.encode('ascii'), b'a': arguments}, address,
+                        name)
+
+            return await asyncio.wait_for(future, self.QUERY_TIMEOUT)
+        finally:
+            self.__transactions.pop(transaction_id, None)
+
+    def datagram_received(self, data: bytes, address: tuple) -> None:
+        try:
+            message = bencodepy.decode(data)
+            transaction_id = message[b't']
+            _type = message[b'y']
+        except Exception:
+            self.__count('received', 'invalid')
+            return None
+
+        if _type == b'q':
+            self.__handle_query(message, transaction_id, address)
+            return None
+
+        pending = self.__transactions.get(transaction_id)
+
+        if pending is None or pending[1] != address or pending[0].done():
+            self.__count('received', 'unexpected')
+            return None
+
+        future = pending[0]
+
+        if _type == b'r' and isinstance(message.get(b'r'), dict) and len(message[b'r'].get(b'id', b'')) == 20:
+            self.__count('received', 'response')
+            self.routing_table.add(message[b'r'][b'id'], address)
+            future.set_result(message[b'r'])
+        elif _type == b'e':
+            self.__count('received', 'error')
+            future.set_exception(KRPCException(repr(message.get(b'e'))))
+        else:
+            self.__count('received', 'invalid')
+            future.set_exception(KRPCException('Invalid response'))
+
+    def error_received(self, exc: Exception) -> None:
+        pass
+
+    # Queries from other nodes
+
+    def __handle_query(self, message: dict, transaction_id: bytes, address: tuple) -> None:
+        name = message.get(b'q')
+        arguments = message.get(b'a')
+
+        if not isinstance(name, bytes):
+            self.__count('received', 'invalid')
+            self.__error(transaction_id, address, 203, 'Protocol Error')
+            return None
+
+        name = name.decode('ascii', 'replace')
+        self.__count('received', name)
+
+        if not isinstance(arguments, dict) or not self.__is_id(arguments.get(b'id')):
+            self.__error(transaction_id, address, 203, 'Protocol Error')
+            return None
+
+        handler = getattr(self, f'_on_{name}', None)
+
+        if handler is None:
+            self.__error(transaction_id, address, 204, 'Method Unknown')
+            return None
+
+        try:
+            response = handler(arguments, address)
+        except (KeyError, TypeError, ValueError):
+            self.__error(transaction_id, address, 203, 'Protocol Error')
+            return None
+
+        if response is None:
+            return None
+
+        self.routing_table.add(arguments[b'id'], address)
+        response[b'id'] = self.node_id
+        self.__send({b't': transaction_id, b'y': b'r', b'r': response}, address, 'response')
+
+    @staticmethod
+    def __is_id(value) -> bool:
+        return isinstance(value, bytes) and len(value) == 20
+
+    def __error(self, transaction_id: bytes, address: tuple, code: int, text: str) -> None:
+        self.__send({b't': transaction_id, b'y': b'e', b'e': [code, text.encode('utf-8')]}, address, 'error')
+
+    def _on_ping(self, arguments: dict, address: tuple) -> dict:
+        return {}
+
+    def _on_find_node(self, arguments: dict, address: tuple) -> dict:
+        return {b'nodes': RoutingTable.encode_nodes(self.routing_table.closest(arguments[b'target']))}
+
+    def _on_get_peers(self, arguments: dict, address: tuple) -> dict:
+        info_hash = arguments[b'info_hash']
+        response = {
+            b'token': self.token(address[0]),
+            b'nodes': RoutingTable.encode_nodes(self.routing_table.closest(info_hash)),
+        }
+        values = self.stored_peers(info_hash)
+
+        if values:
+            response[b'values'] = values
+
+        return response
+
+    def _on_announce_peer(self, arguments: dict, address: tuple) -> dict:
+        if not self.valid_token(arguments[b'token'], address[0]):
+            raise ValueError('Bad token')
+
+        info_hash = arguments[b'info_hash']
+        port = address[1] if arguments.get(b'implied_port') else arguments[b'port']
+
+        if not self.__is_id(info_hash):
+            raise ValueError('Bad info_hash')
+
+        if not isinstance(port, int) or not 0 < port <= 0xffff:
+            raise ValueError('Bad port')
+
+        self.store_peer(info_hash, socket.inet_aton(address[0]) + port.to_bytes(2, 'big'))
+
+        return {}
+
+    # Tokens and stored peers
+
+    def __rotate_secrets(self) -> None:
+        now = time.monotonic()
+
+        if now - self.__secrets_rotated > self.TOKEN_ROTATION:
+            self.__secrets = [os.urandom(16), self.__secrets[0]]
+            self.__secrets_rotated = now
+
+    def token(self, ip: str) -> bytes:
+        self.__rotate_secrets()
+
+        return hashlib.sha1(self.__secrets[0] + socket.inet_aton(ip)).digest()[:8]
+
+    def valid_token(self, token: bytes, ip: str) -> bool:
+        """ Tokens issued in the current and the previous rotation are accepted
+        """
+        self.__rotate_secrets()
+
+        return any(hashlib.sha1(secret + socket.inet_aton(ip)).digest()[:8] == token for secret in self.__secrets)
+
+    @staticmethod
+    def __expire(peers: collections.OrderedDict, expired: float) -> None:
+        while peers and next(iter(peers.values())) < expired:
+            peers.popitem(last=False)
+
+    def store_peer(self, info_hash: bytes, peer: bytes) -> None:
+        """ Store an announced peer
+
+            At most MAX_INFO_HASHES info hashes are kept. The least recently announced one
+            goes first, and so does any whose peers all expired.
+        """
+        now = time.monotonic()
+        peers = self.__peers.get(info_hash)
+
+        if peers is None:
+            peers = self.__peers[info_hash] = collections.OrderedDict()
+        else:
+            self.__peers.move_to_end(info_hash)
+
+        peers.pop(peer, None)
+        peers[peer] = now
+
+        self.__expire(peers, now - self.PEER_TTL)
+
+        if len(peers) > self.MAX_PEERS_PER_INFO_HASH:
+            peers.popitem(last=False)
+
+        while self.__peers:
+            _info_hash, _peers = next(iter(self.__peers.items()))
+
+            if len(self.__peers) <= self.MAX_INFO_HASHES and _peers[next(reversed(_peers))] >= now - self.PEER_TTL:
+                break
+
+            del self.__peers[_info_hash]
+
+    def stored_peers(self, info_hash: bytes) -> list:
+        peers = self.__peers.get(info_hash)
+
+        if not peers:
+            return []
+
+        self.__expire(peers, time.monotonic() - self.PEER_TTL)
+
+        if not peers:
+            del self.__peers[info_hash]
+            return []
+
+        # Most recently announced first
+        return list(reversed(peers))[:self.MAX_VALUES]
+
+    # Lookups
+
+    async def ping(self, address: tuple) -> bytes:
+        """
+
+        :return: Node id
+        """
+        return (await self.query(address, 'ping', {}))[b'id']
+
+    async def bootstrap(self, addresses: list = ()) -> LookupResult:
+        """ Fill the routing table: ping addresses, then look up own id
+
+        :param addresses: (host, port) of known nodes, e.g. DHT routers. Hosts are resolved
+        """
+        loop = asyncio.get_event_loop()
+        resolved = []
+
+        for host, port in addresses:
+            try:
+                infos = await loop.getaddrinfo(host, port, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+            except OSError:
+                continue
+
+            resolved.extend(info[4][:2] for info in infos[:1])
+
+        await asyncio.gather(*(self.ping(address) for address in resolved), return_exceptions=True)
+
+        return await self.find_node(self.node_id)
+
+    async def find_node(self, target: bytes) -> LookupResult:
+        return await self.lookup(target, 'find_node', {b'target': target})
+
+    async def get_peers(self, info_hash: bytes) -> LookupResult:
+        return await self.lookup(info_hash, 'get_peers', {b'info_hash': info_hash})
+
+    async def announce(self, info_hash: bytes, port: int = None) -> LookupResult:
+        """ Look up info_hash and announce to the K closest nodes which gave a token
+
+        :param port: Port peers should connect to. DHT port is implied if None
+        """
+        result = await self.get_peers(info_hash)
+        arguments = {b'info_hash': info_hash, b'port': port or self.port}
+
+        if port is None:
+            arguments[b'implied_port'] = 1
+
+        announces = [self.query(address, 'announce_peer', {**arguments, b'token': token})
+                     for _, address, token in result.nodes[:self.K] if token]
+        await asyncio.gather(*announces, return_exceptions=True)
+
+        return result
+
+    @staticmethod
+    def valid_response(response: dict) -> bool:
+        """ Types and lengths of the find_node and get_peers fields a lookup reads
+        """
+        nodes = response.get(b'nodes', b'')
+        values = response.get(b'values', [])
+        token = response.get(b'token', b'')
+
+        return (isinstance(nodes, bytes) and len(nodes) % 26 == 0 and isinstance(token, bytes)
+                and isinstance(values, list) and all(isinstance(peer, bytes) and len(peer) == 6 for peer in values))
+
+    async def lookup(self, target: bytes, method: str, arguments: dict) -> LookupResult:
+        """ Iterative lookup with ALPHA queries in flight
+
+            Stops when the K closest known nodes have all been queried.
+        """
+        start = time.perf_counter()
+        result = LookupResult(target)
+        _target = int.from_bytes(target, 'big')
+
+        # node id (int) -> address
+        candidates = {int.from_bytes(node_id, 'big'): address
+                      for node_id, address in self.routing_table.closest(target, self.K)}
+        queried = set()
+        responded = {}
+        pending = {}
+
+        while True:
+            closest = heapq.nsmallest(self.K, candidates, key=lambda node_id: node_id ^ _target)
+
+            for node_id in closest:
+                if len(pending) >= self.ALPHA:
+                    break
+
+                if node_id in queried:
+                    continue
+
+                queried.add(node_id)
+                task = asyncio.ensure_future(self.query(candidates[node_id], method, arguments))
+                pending[task] = node_id
+                result.queries += 1
+
+            if not pending:
+                break
+
+            done, _ = await asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                node_id = pending.pop(task)
+
+                try:
+                    response = task.result()
+
+                    if not self.valid_response(response):
+                        raise KRPCException('Malformed response')
+                except (asyncio.TimeoutError, KRPCException, OSError):
+                    self.routing_table.failed(node_id.to_bytes(20, 'big'))
+                    candidates.pop(node_id, None)
+                    continue
+
+                result.responses += 1
+                responded[node_id] = response.get(b'token')
+                result.peers.update(response.get(b'values', ()))
+
+                for _node_id, address in RoutingTable.decode_nodes(response.get(b'nodes', b'')):
+                    _node_id = int.from_bytes(_node_id, 'big')
+
+                    if _node_id != self.routing_table.node_id:
+                        candidates.setdefault(_node_id, address)
+
+        for node_id in sorted(responded, key=lambda _node_id: _node_id ^ _target):
+            result.nodes.append((node_id.to_bytes(20, 'big'), candidates[node_id], responded[node_id]))
+
+        result.duration = time.perf_counter() - start
+        metrics.DHT_LOOKUP.labels(method).observe(result.duration)
+
+        return result
+
+    # Persistence
+
+    def save(self, database) -> None:
+        """ Save routing table for a warm start
+
+        :param database: database.database.Database with dht_node table
+        """
+        # One transaction: a failed save keeps the previous nodes
+        with database.connection:
+            database.dht_nodes.delete()
+            database.dht_nodes.insert_many(({'id': node_id, 'ip': ip, 'port': port}
+                                            for node_id, (ip, port) in self.routing_table), conflict='REPLACE')
+
+    def load(self, database) -> int:
+        """ Load saved nodes into the routing table, call bootstrap() afterwards to verify them
+
+        :return: Number of nodes loaded
+        """
+        loaded = 0
+
+        for row in database.dht_nodes.select(('id', 'ip', 'port')):
+            loaded += self.routing_table.add(row['id'], (row['ip'], row['port']))
+
+        return loaded
@@ -0,0 +1,397 @@
+""" HTTP(S) tracker client (BEP 3, BEP 23 compact peers, BEP 48 scrape)
+
+    Runs on asyncio: thousands of announces share one thread, and connections to a tracker
+    host are kept alive in a bounded pool, so re-announces skip TCP and TLS setup.
+"""
+import asyncio
+import collections
+import socket
+import ssl
+import time
+from urllib.parse import quote_from_bytes, urlencode, urlsplit
+
+import bencodepy
+
+from clutcher import metrics, settings
+from torrent.exception import HTTPException, TrackerFailureException
+
+
+class HTTPAnnounceResponse:
+    """ Announce response, peers are kept in compact form until socket_addresses is used
+    """
+    def __init__(self) -> None:
+        self.interval = None
+        self.min_interval = None
+        self.tracker_id = None
+        self.complete = None
+        self.incomplete = None
+        self.warning = None
+        self.peers = b''
+        self.peers6 = b''
+
+    def from_bytes(self, payload: bytes) -> None:
+        data = bencodepy.decode(payload)
+
+        if b'failure reason' in data:
+            raise TrackerFailureException(data[b'failure reason'].decode('utf-8', 'replace'))
+
+        self.interval = data.get(b'interval')
+        self.min_interval = data.get(b'min interval')
+        self.tracker_id = data.get(b'tracker id')
+        self.complete = data.get(b'complete')
+        self.incomplete = data.get(b'incomplete')
+        self.warning = data.get(b'warning message')
+        self.peers = self.compact(data.get(b'peers', b''))
+        self.peers6 = data.get(b'peers6', b'')
+
+    @staticmethod
+    def compact(peers) -> bytes:
+        """ Trackers may ignore compact=1 and send a list of dicts
+        """
+        if isinstance(peers, bytes):
+            return peers
+
+        return b''.join(socket.inet_aton(peer[b'ip'].decode('utf-8')) + peer[b'port'].to_bytes(2, 'big')
+                        for peer in peers if b':' not in peer[b'ip'])
+
+    @property
+    def socket_addresses(self) -> list:
+        addresses = []
+
+        for start in range(0, len(self.peers) - len(self.peers) % 6, 6):
+            addresses.append((socket.inet_ntoa(self.peers[start:start + 4]),
+                              int.from_bytes(self.peers[start + 4:start + 6], 'big')))
+
+        for start in range(0, len(self.peers6) - len(self.peers6) % 18, 18):
+            addresses.append((socket.inet_ntop(socket.AF_INET6, self.peers6[start:start + 16]),
+                              int.from_bytes(self.peers6[start + 16:start + 18], 'big')))
+
+        return addresses
+
+    def add_to(self, peer_store) -> None:
+        """
+
+        :param peer_store: torrent.network.peer_store.PeerStore
+        """
+        peer_store.add_compact(self.peers)
+        peer_store.add_compact6(self.peers6)
+
+
+class _Connection:
+    __slots__ = ('reader', 'writer', 'used')
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.used = 0
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class ConnectionPool:
+    """ Keep-alive connections per (scheme, host, port)
+
+        At most max_per_host connections to a host are open at a time, at most max_idle
+        of them are kept for reuse.
+    """
+    def __init__(self, max_per_host: int = 4, max_idle: int = 2, ssl_context: ssl.SSLContext = None) -> None:
+        self.max_per_host = max_per_host
+        self.max_idle = max_idle
+        self.ssl_context = ssl_context
+
+        self.opened = 0
+        self.__idle = collections.defaultdict(collections.deque)
+        self.__limits = {}
+
+    def __limit(self, key: tuple) -> asyncio.Semaphore:
+        limit = self.__limits.get(key)
+
+        if limit is None:
+            limit = self.__limits[key] = asyncio.Semaphore(self.max_per_host)
+
+        return limit
+
+    async def acquire(self, scheme: str, host: str, port: int) -> _Connection:
+        key = (scheme, host, port)
+        await self.__limit(key).acquire()
+
+        idle = self.__idle[key]
+
+        while idle:
+            connection = idle.pop()
+
+            if not connection.reader.at_eof():
+                return connection
+
+            connection.close()
+
+        try:
+            _ssl = None
+
+            if scheme == 'https':
+                _ssl = self.ssl_context or ssl.create_default_context()
+
+            reader, writer = await asyncio.open_connection(host, port, ssl=_ssl)
+        except BaseException:
+            self.__limit(key).release()
+            raise
+
+        self.opened += 1
+
+        return _Connection(reader, writer)
+
+    def release(self, scheme: str, host: str, port: int, connection: _Connection, reuse: bool) -> None:
+        key = (scheme, host, port)
+        idle = self.__idle[key]
+
+        if reuse and len(idle) < self.max_idle:
+            idle.append(connection)
+        else:
+            connection.close()
+
+        self.__limit(key).release()
+
+    def close(self) -> None:
+        for idle in self.__idle.values():
+            while idle:
+                idle.pop().close()
+
+
+class HTTPTrackerClient:
+    """ Announce and scrape HTTP(S) trackers
+
+        Usage:
+            client = HTTPTrackerClient()
+            response = await client.announce(torrent.announce.decode(), torrent.info_hash, torrent.peer_id)
+            response.add_to(torrent.peers)
+    """
+    USER_AGENT = f'{settings.NAME}/{settings.VERSION}'
+    MAX_RESPONSE_LENGTH = 2 ** 22
+
+    def __init__(self, pool: ConnectionPool = None, timeout: float = 30, concurrency: int = 256) -> None:
+        self.pool = pool or ConnectionPool()
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.__semaphore = None
+
+    async def announce(self, url: str, info_hash: bytes, peer_id: bytes, port: int = 6881, uploaded: int = 0,
+                       downloaded: int = 0, left: int = 0, event: str = None, numwant: int = None,
+                       tracker_id: bytes = None) -> HTTPAnnounceResponse:
+        """
+
+        :param event: None, 'started', 'completed' or 'stopped'
+        :raise: torrent.exception.TrackerFailureException if tracker sent failure reason
+        :raise: torrent.exception.HTTPException on non 200 responses
+        """
+        params = {
+            'port': port,
+            'uploaded': uploaded,
+            'downloaded': downloaded,
+            'left': left,
+            'compact': 1,
+        }
+
+        if event:
+            params['event'] = event
+
+        if numwant is not None:
+            params['numwant'] = numwant
+
+        if tracker_id:
+            params['trackerid'] = tracker_id
+
+        query = (f'info_hash={quote_from_bytes(info_hash)}&peer_id={quote_from_bytes(peer_id)}&'
+                 f'{urlencode(params)}')
+        response = HTTPAnnounceResponse()
+        host = urlsplit(url).netloc
+
+        try:
+            response.from_bytes(await self.get(url, query))
+        except TrackerFailureException:
+            metrics.ANNOUNCES.labels(host, 'failure').inc()
+            raise
+        except Exception:
+            metrics.ANNOUNCES.labels(host, 'error').inc()
+            raise
+
+        metrics.ANNOUNCES.labels(host, 'ok').inc()
+
+        return response
+
+    async def announce_many(self, requests: list) -> list:
+        """
+
+        :param requests: List of dicts with announce() kwargs
+        :return: List of HTTPAnnounceResponse or exceptions, in order of requests
+        """
+        return await asyncio.gather(*(self.announce(**request) for request in requests), return_exceptions=True)
+
+    @staticmethod
+    def scrape_url(url: str) -> str:
+        """ BEP 48: replace the last "announce" path component with "scrape"
+        """
+        split = urlsplit(url)
+        head, _, tail = split.path.rpartition('/')
+
+        if not tail.startswith('announce'):
+            raise ValueError(f'Tracker {url} does not support scrape')
+
+        return split._replace(path=f'{head}/scrape{tail[len("announce"):]}').geturl()
+
+    async def scrape(self, url: str, info_hashes: list) -> dict:
+        """
+
+        :param url: Announce URL
+        :return: {info_hash: {'complete': int, 'downloaded': int, 'incomplete': int}}
+        """
+        host = urlsplit(url).netloc
+        query = '&'.join(f'info_hash={quote_from_bytes(info_hash)}' for info_hash in info_hashes)
+
+        try:
+            data = bencodepy.decode(await self.get(self.scrape_url(url), query))
+
+            if b'failure reason' in data:
+                raise TrackerFailureException(data[b'failure reason'].decode('utf-8', 'replace'))
+        except TrackerFailureException:
+            metrics.SCRAPES.labels(host, 'failure').inc()
+            raise
+        except Exception:
+            metrics.SCRAPES.labels(host, 'error').inc()
+            raise
+
+        metrics.SCRAPES.labels(host, 'ok').inc()
+
+        return {info_hash: {key.decode('utf-8'): value for key, value in stats.items()}
+                for info_hash, stats in data.get(b'files', {}).items()}
+
+    async def get(self, url: str, query: str) -> bytes:
+        if self.__semaphore is None:
+            self.__semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with self.__semaphore:
+            return await asyncio.wait_for(self.__get(url, query), self.timeout)
+
+    async def __get(self, url: str, query: str) -> bytes:
+        split = urlsplit(url)
+        scheme = split.scheme
+        host = split.hostname
+        port = split.port or (443 if scheme == 'https' else 80)
+        path = split.path or '/'
+        query = f'{split.query}&{query}' if split.query else query
+        request = (f'GET {path}?{query} HTTP/1.1\r\n'
+                   f'Host: {split.netloc}\r\n'
+                   f'User-Agent: {self.USER_AGENT}\r\n'
+                   f'Accept-Encoding: identity\r\n'
+                   f'Connection: keep-alive\r\n\r\n').encode('ascii')
+
+        if scheme not in ('http', 'https'):
+            raise ValueError(f'Not an HTTP tracker: {url}')
+
+        # A kept-alive connection may have been closed by the tracker meanwhile, retry once on a new one
+        for attempt in range(2):
+            connection = await self.pool.acquire(scheme, host, port)
+            reused = connection.used > 0
+            reuse = False
+            start = time.perf_counter()
+
+            try:
+                connection.writer.write(request)
+                status, body, reuse = await self.__read_response(connection.reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if reused and attempt == 0:
+                    continue
+
+                raise
+            finally:
+                connection.used += 1
+                self.pool.release(scheme, host, port, connection, reuse)
+
+            metrics.TRACKER_RTT.labels(split.netloc).observe(time.perf_counter() - start)
+            metrics.BYTES_SENT.labels('tracker').inc(len(request))
+            metrics.BYTES_RECEIVED.labels('tracker').inc(len(body))
+
+            if status != 200:
+                raise HTTPException(f'Tracker {url} responded with status {status}')
+
+            return body
+
+    async def __read_response(self, reader: asyncio.StreamReader) -> tuple:
+        """
+
+        :return: (status, body, connection can be reused)
+        """
+        status_line = await reader.readline()
+
+        if not status_line:
+            raise ConnectionResetError('Connection closed by tracker')
+
+        version, status, _ = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+        headers = {}
+
+        while True:
+            line = await reader.readline()
+
+            if line in (b'\r\n', b'\n', b''):
+                break
+
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        reuse = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            chunks = []
+            length = 0
+
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+
+                if not size:
+                    break
+
+                length += size
+
+                if length > self.MAX_RESPONSE_LENGTH:
+                    raise HTTPException('Tracker response is too large')
+
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+
+            # Trailers
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            length = int(headers['content-length'])
+
+            if length > self.MAX_RESPONSE_LENGTH:
+                raise HTTPException('Tracker response is too large')
+
+            body = await reader.readexactly(length)
+        else:
+            # Body ends when the tracker closes the connection
+            chunks = []
+            length = 0
+
+            while True:
+                chunk = await reader.read(self.MAX_RESPONSE_LENGTH + 1 - length)
+
+                if not chunk:
+                    break
+
+                length += len(chunk)
+
+                if length > self.MAX_RESPONSE_LENGTH:
+                    raise HTTPException('Tracker response is too large')
+
+                chunks.append(chunk)
+
+            body = b''.join(chunks)
+            reuse = False
+
+        return int(status), body, reuse
+
+    def close(self) -> None:
+        self.pool.close()
@@ -0,0 +1,288 @@
+from array import array
+import collections
+import ipaddress
+import time
+
+
+class PeerStore:
+    """ Deduplicated per-torrent peer store
+
+        A peer is a packed integer: ip << 16 | port, IPv6 peers additionally have IPV6 set.
+        Per-peer state lives in arrays indexed by slot, freed slots are reused.
+
+        Candidates wait in FIFO queues: new peers, reconnects and one per failure count.
+        Backoff depends only on the queue, so every queue is ordered by retry time and
+        next_candidate only looks at MAX_FAILURES + 2 queue heads. Queue entries are
+        (retry_at, slot, generation), a slot's generation changes whenever it is queued
+        again or freed, so stale entries never pass for live ones and are skipped lazily.
+
+        Banned peers are kept apart from the slots, so bans do not count against max_peers.
+        Beyond MAX_BANS the oldest ban is forgotten.
+    """
+    IPV6 = 1 << 144
+
+    # Flags
+    FREE = 0
+    IDLE = 1
+    CONNECTED = 2
+
+    # Queues, QUEUE_RECONNECT + failures for failed peers
+    QUEUE_NEW = 0
+    QUEUE_RECONNECT = 1
+
+    BACKOFF = 15
+    MAX_FAILURES = 7
+    MAX_PEERS = 65536
+    MAX_BANS = 4096
+
+    def __init__(self, max_peers: int = MAX_PEERS, max_bans: int = MAX_BANS) -> None:
+        self.max_peers = max_peers
+        self.max_bans = max_bans
+        self.__epoch = time.monotonic()
+
+        self.__slots = {}
+        # Packed peer -> None, oldest ban first
+        self.__banned = collections.OrderedDict()
+        self.__free = []
+        self.peers = []
+        self.flags = array('B')
+        self.failures = array('B')
+        # Seconds since store creation
+        self.last_seen = array('I')
+        self.retry_at = array('I')
+        self.queue = array('B')
+        self.generation = array('I')
+        self.__queues = [collections.deque() for _ in range(self.QUEUE_RECONNECT + self.MAX_FAILURES + 1)]
+
+    def __len__(self) -> int:
+        return len(self.__slots)
+
+    def __contains__(self, peer: tuple) -> bool:
+        return self.pack(*peer) in self.__slots
+
+    def now(self) -> int:
+        return int(time.monotonic() - self.__epoch)
+
+    @classmethod
+    def pack(cls, ip: str, port: int) -> int:
+        address = ipaddress.ip_address(ip)
+        _packed = int(address) << 16 | port
+
+        return _packed | cls.IPV6 if address.version == 6 else _packed
+
+    @classmethod
+    def unpack(cls, peer: int) -> tuple:
+        port = peer & 0xffff
+
+        if peer & cls.IPV6:
+            return str(ipaddress.IPv6Address((peer ^ cls.IPV6) >> 16)), port
+
+        return str(ipaddress.IPv4Address(peer >> 16)), port
+
+    def add(self, ip: str, port: int, now: int = None) -> None:
+        self.add_packed(self.pack(ip, port), now)
+
+    def add_many(self, socket_addresses: list, now: int = None) -> None:
+        """
+
+        :param socket_addresses: List of (ip, port), e.g. IPv4AnnounceResponse.socket_addresses
+        """
+        now = self.now() if now is None else now
+
+        for ip, port in socket_addresses:
+            self.add_packed(self.pack(ip, port), now)
+
+    def add_compact(self, payload: bytes, now: int = None) -> None:
+        """ Add peers in compact format: 6 bytes per peer, IPv4 and port in network byte order
+        """
+        now = self.now() if now is None else now
+        _from_bytes = int.from_bytes
+
+        for start in range(0, len(payload) - len(payload) % 6, 6):
+            self.add_packed(_from_bytes(payload[start:start + 6], 'big'), now)
+
+    def add_compact6(self, payload: bytes, now: int = None) -> None:
+        """ Add peers in compact IPv6 format: 18 bytes per peer
+        """
+        now = self.now() if now is None else now
+        _from_bytes = int.from_bytes
+
+        for start in range(0, len(payload) - len(payload) % 18, 18):
+            self.add_packed(_from_bytes(payload[start:start + 18], 'big') | self.IPV6, now)
+
+    def add_packed(self, peer: int, now: int = None) -> None:
+        now = self.now() if now is None else now
+        slot = self.__slots.get(peer)
+
+        if slot is not None:
+            self.last_seen[slot] = now
+            return None
+
+        if peer in self.__banned:
+            return None
+
+        if len(self.__slots) >= self.max_peers and not self.__evict():
+            return None
+
+        if self.__free:
+            slot = self.__free.pop()
+            self.peers[slot] = peer
+            self.flags[slot] = self.IDLE
+            self.failures[slot] = 0
+            self.last_seen[slot] = now
+            self.retry_at[slot] = now
+            self.queue[slot] = self.QUEUE_NEW
+            self.generation[slot] = (self.generation[slot] + 1) & 0xffffffff
+        else:
+            slot = len(self.peers)
+            self.peers.append(peer)
+            self.flags.append(self.IDLE)
+            self.failures.append(0)
+            self.last_seen.append(now)
+            self.retry_at.append(now)
+            self.queue.append(self.QUEUE_NEW)
+            self.generation.append(0)
+
+        self.__slots[peer] = slot
+        self.__queues[self.QUEUE_NEW].append((now, slot, self.generation[slot]))
+
+    def __remove(self, slot: int) -> None:
+        del self.__slots[self.peers[slot]]
+        self.flags[slot] = self.FREE
+        self.generation[slot] = (self.generation[slot] + 1) & 0xffffffff
+        self.__free.append(slot)
+
+    def __evict(self) -> bool:
+        """ Drop an idle peer with the most failures to make room for a new one
+        """
+        for index in range(len(self.__queues) - 1, -1, -1):
+            queue = self.__queues[index]
+
+            while queue:
+                entry = queue.popleft()
+
+                if self.__is_queued(entry):
+                    self.__remove(entry[1])
+                    return True
+
+        return False
+
+    def __is_queued(self, entry: tuple) -> bool:
+        retry_at, slot, generation = entry
+
+        return (self.generation[slot] == generation and self.flags[slot] == self.IDLE
+                and self.retry_at[slot] == retry_at)
+
+    def __enqueue(self, slot: int, index: int, retry_at: int) -> None:
+        generation = (self.generation[slot] + 1) & 0xffffffff
+        self.flags[slot] = self.IDLE
+        self.queue[slot] = index
+        self.retry_at[slot] = retry_at
+        self.generation[slot] = generation
+        self.__queues[index].append((retry_at, slot, generation))
+
+    def next_candidate(self, now: int = None) -> tuple:
+        """ Best peer to connect to: new ones, then reconnects, then fewest failures. Marks it as connected
+
+        :return: (ip, port) or None if no peer is ready
+        """
+        now = self.now() if now is None else now
+
+        for queue in self.__queues:
+            while queue:
+                entry = queue[0]
+
+                if not self.__is_queued(entry):
+                    queue.popleft()
+                    continue
+
+                # Live entries of a queue are in retry order, the rest of this queue is not ready either
+                if entry[0] > now:
+                    break
+
+                queue.popleft()
+                slot = entry[1]
+                self.flags[slot] = self.CONNECTED
+
+                return self.unpack(self.peers[slot])
+
+        return None
+
+    def __slot(self, ip: str, port: int) -> int:
+        return self.__slots[self.pack(ip, port)]
+
+    def connected(self, ip: str, port: int, now: int = None) -> None:
+        """ Unknown peers, e.g. evicted or banned ones, are ignored here, in disconnected and in failed
+        """
+        slot = self.__slots.get(self.pack(ip, port))
+
+        if slot is None:
+            return None
+
+        self.flags[slot] = self.CONNECTED
+        self.failures[slot] = 0
+        self.last_seen[slot] = self.now() if now is None else now
+
+    def disconnected(self, ip: str, port: int, now: int = None) -> None:
+        slot = self.__slots.get(self.pack(ip, port))
+
+        if slot is None or self.flags[slot] != self.CONNECTED:
+            return None
+
+        now = self.now() if now is None else now
+        self.__enqueue(slot, self.QUEUE_RECONNECT, now + self.BACKOFF)
+
+    def failed(self, ip: str, port: int, now: int = None) -> None:
+        """ Connection attempt failed: retry later with exponential backoff, forget the peer
+        after MAX_FAILURES
+        """
+        slot = self.__slots.get(self.pack(ip, port))
+
+        if slot is None:
+            return None
+
+        failures = self.failures[slot] + 1
+
+        if failures > self.MAX_FAILURES:
+            self.__remove(slot)
+            return None
+
+        now = self.now() if now is None else now
+        self.failures[slot] = failures
+        self.__enqueue(slot, self.QUEUE_RECONNECT + failures, now + self.backoff(failures))
+
+    def ban(self, ip: str, port: int) -> None:
+        """ Forget the peer and do not add it again, however full the store is
+        """
+        peer = self.pack(ip, port)
+        slot = self.__slots.get(peer)
+
+        if slot is not None:
+            self.__remove(slot)
+
+        self.__banned.pop(peer, None)
+        self.__banned[peer] = None
+
+        if len(self.__banned) > self.max_bans:
+            self.__banned.popitem(last=False)
+
+    def is_banned(self, ip: str, port: int) -> bool:
+        return self.pack(ip, port) in self.__banned
+
+    @classmethod
+    def backoff(cls, failures: int) -> int:
+        return cls.BACKOFF * 2 ** failures
+
+    def state(self, ip: str, port: int) -> dict:
+        if self.is_banned(ip, port):
+            return {'connected': False, 'banned': True, 'failures': 0, 'last_seen': None, 'retry_at': None}
+
+        slot = self.__slot(ip, port)
+
+        return {
+            'connected': self.flags[slot] == self.CONNECTED,
+            'banned': False,
+            'failures': self.failures[slot],
+            'last_seen': self.last_seen[slot],
+            'retry_at': self.retry_at[slot],
+        }
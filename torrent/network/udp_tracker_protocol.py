@@ -89,7 +89,7 @@ class ConnectionResponse(UDPTrackerProtocolInterface):
     def from_bytes(self, payload) -> None:
         self.action, = unpack('>I', payload[:4])
         self.transaction_id, = unpack('>I', payload[4:8])
-        self.connection_id, = unpack('>I', payload[8:16])
+        self.connection_id, = unpack('>Q', payload[8:16])
 
 
 class IPv4AnnounceRequest(UDPTrackerProtocolInterface):
@@ -179,17 +179,15 @@ class IPv4AnnounceResponse(UDPTrackerProtocolInterface):
         self.socket_addresses = []
 
     def to_bytes(self) -> bytes:
-        """ TODO: unpack socket_addresses
-        """
         if not self.transaction_id:
             raise IsNotInitialized('IPv4AnnounceResponse is not initialized')
 
-        action, = unpack('>I', self.action)
-        transaction_id, = unpack('>I', self.transaction_id)
-        interval, = unpack('>I', self.interval)
-        leechers, = unpack('>I', self.leechers)
-        seeders, = unpack('>I', self.seeders)
-        socket_addresses = b'00000000'
+        action = pack('>I', self.action)
+        transaction_id = pack('>I', self.transaction_id)
+        interval = pack('>I', self.interval)
+        leechers = pack('>I', self.leechers)
+        seeders = pack('>I', self.seeders)
+        socket_addresses = b''.join(socket.inet_aton(ip) + pack('>H', port) for ip, port in self.socket_addresses)
 
         return action + transaction_id + interval + leechers + seeders + socket_addresses
 
@@ -330,8 +328,6 @@ class ErrorResponse(UDPTrackerProtocolInterface):
         return action + transaction_id + message
 
     def from_bytes(self, payload) -> None:
-        _message_length = len(self.message)
-
         self.action, = unpack('>I', payload[:4])
         self.transaction_id, = unpack('>I', payload[4:8])
-        self.message, = unpack(f'>{_message_length}s', payload[8:])
+        self.message = payload[8:].decode('utf-8')
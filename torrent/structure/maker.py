@@ -0,0 +1,207 @@
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import hashlib
+import math
+import os
+import pathlib
+import time
+
+import bencodepy
+
+from clutcher import metrics, settings
+
+
+class TorrentMaker:
+    """ Create .torrent files from a file or a directory
+
+        Files are read as one logical byte stream, sequentially and with readinto into a
+        fixed set of piece buffers, while the pieces are SHA1-hashed in a thread pool:
+        hashlib releases the GIL for large buffers, so hashing runs on all cores and memory
+        stays at MAX_IN_FLIGHT_PER_WORKER * workers pieces.
+    """
+    MIN_PIECE_LENGTH = 2 ** 14
+    MAX_PIECE_LENGTH = 2 ** 24
+    TARGET_PIECES = 1500
+    MAX_IN_FLIGHT_PER_WORKER = 4
+
+    def __init__(self, path: str, announce: list = None, piece_length: int = None, comment: str = None,
+                 private: bool = False, workers: int = None) -> None:
+        """
+
+        :param path: File or directory to create torrent from
+        :param announce: Tracker URLs, the first one is used as announce
+        :param piece_length: Piece size in bytes, power of 2. Chosen from total length if None
+        :param comment: Torrent comment
+        :param private: Set private flag (BEP 27)
+        :param workers: Hashing threads, os.cpu_count() by default
+        """
+        self.path = pathlib.Path(path).resolve()
+
+        if not self.path.exists():
+            raise FileNotFoundError(f'File {str(self.path)} does not exist.')
+
+        self.announce = list(announce or [])
+        self.comment = comment
+        self.private = private
+        self.workers = workers or os.cpu_count() or 1
+
+        # List of (absolute path, path components relative to self.path, length)
+        self.files = self.scan(self.path)
+        self.total_length = sum(length for _, _, length in self.files)
+
+        if not self.total_length:
+            raise ValueError(f'No data in {str(self.path)}, a torrent needs at least one byte')
+
+        self.piece_length = piece_length or self.choose_piece_length(self.total_length)
+
+        if self.piece_length & (self.piece_length - 1):
+            raise ValueError(f'Piece length must be a power of 2, got {self.piece_length}')
+
+    @classmethod
+    def scan(cls, path: pathlib.Path) -> list:
+        if path.is_file():
+            return [(str(path), [path.name], path.stat().st_size)]
+
+        files = []
+        directories = [(str(path), [])]
+
+        while directories:
+            directory, components = directories.pop()
+
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append((entry.path, components + [entry.name]))
+                    elif entry.is_file():
+                        files.append((entry.path, components + [entry.name], entry.stat().st_size))
+
+        files.sort(key=lambda file: file[1])
+
+        return files
+
+    @classmethod
+    def choose_piece_length(cls, total_length: int) -> int:
+        if total_length <= cls.MIN_PIECE_LENGTH * cls.TARGET_PIECES:
+            return cls.MIN_PIECE_LENGTH
+
+        _exponent = math.ceil(math.log2(total_length / cls.TARGET_PIECES))
+
+        return min(2 ** _exponent, cls.MAX_PIECE_LENGTH)
+
+    @staticmethod
+    def _hash(view: memoryview) -> bytes:
+        _start = time.perf_counter()
+        digest = hashlib.sha1(view).digest()
+        metrics.HASH_SECONDS.labels('pieces').inc(time.perf_counter() - _start)
+
+        return digest
+
+    def hash_pieces(self) -> bytes:
+        """
+
+        :return: Concatenated SHA1 digests of all pieces
+        """
+        in_flight = self.workers * self.MAX_IN_FLIGHT_PER_WORKER
+        buffers = collections.deque(bytearray(self.piece_length) for _ in range(in_flight))
+        pending = collections.deque()
+        digests = []
+
+        def _hashed(_) -> None:
+            metrics.DISK_QUEUE.dec()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            def _submit(buffer: bytearray, length: int) -> None:
+                # Counted before the piece can be hashed, so the gauge never goes below zero
+                metrics.DISK_QUEUE.inc()
+
+                try:
+                    future = executor.submit(self._hash, memoryview(buffer)[:length])
+                except BaseException:
+                    metrics.DISK_QUEUE.dec()
+                    raise
+
+                future.add_done_callback(_hashed)
+                pending.append((future, buffer))
+                metrics.HASHED_BYTES.labels('pieces').inc(length)
+
+            buffer = buffers.popleft()
+            filled = 0
+
+            for file_path, _, _ in self.files:
+                with open(file_path, 'rb', buffering=0) as file:
+                    while True:
+                        read = file.readinto(memoryview(buffer)[filled:])
+
+                        if not read:
+                            break
+
+                        filled += read
+
+                        if filled < self.piece_length:
+                            continue
+
+                        _submit(buffer, filled)
+
+                        if not buffers:
+                            future, _buffer = pending.popleft()
+                            digests.append(future.result())
+                            buffers.append(_buffer)
+
+                        buffer = buffers.popleft()
+                        filled = 0
+
+            if filled:
+                _submit(buffer, filled)
+
+            digests.extend(future.result() for future, _ in pending)
+
+        return b''.join(digests)
+
+    def build_info(self) -> dict:
+        """ Info dictionary. Reads and hashes every file, call once per torrent
+        """
+        info = {
+            b'name': self.path.name.encode('utf-8'),
+            b'piece length': self.piece_length,
+            b'pieces': self.hash_pieces(),
+        }
+
+        if self.path.is_file():
+            info[b'length'] = self.total_length
+        else:
+            info[b'files'] = [{
+                b'length': length,
+                b'path': [component.encode('utf-8') for component in components],
+            } for _, components, length in self.files]
+
+        if self.private:
+            info[b'private'] = 1
+
+        return info
+
+    def get_dict(self) -> dict:
+        data = {
+            b'created by': f'{settings.NAME}/{settings.VERSION}'.encode('utf-8'),
+            b'creation date': int(time.time()),
+            b'info': self.build_info(),
+        }
+
+        if self.announce:
+            data[b'announce'] = self.announce[0].encode('utf-8')
+
+        if len(self.announce) > 1:
+            data[b'announce-list'] = [[url.encode('utf-8')] for url in self.announce]
+
+        if self.comment:
+            data[b'comment'] = self.comment.encode('utf-8')
+
+        return data
+
+    def to_bytes(self) -> bytes:
+        return bencodepy.encode(self.get_dict())
+
+    def write(self, torrent_path: str) -> pathlib.Path:
+        path = pathlib.Path(torrent_path).resolve()
+        path.write_bytes(self.to_bytes())
+
+        return path
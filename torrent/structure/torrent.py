@@ -1,41 +1,136 @@
+from array import array
 import hashlib
 import pathlib
+import sys
 import time
 
 import bencodepy
 
+from clutcher import metrics
+from torrent.network.peer_store import PeerStore
+
+
+class FileTable:
+    """ Columnar table of torrent files
+
+        Path components are interned once per table and files refer to them by index,
+        lengths and offsets (in the torrent byte stream) are arrays of unsigned 64-bit
+        integers, so a file costs a few dozen bytes instead of a dict and a pathlib.Path.
+        Paths are built and resolved on demand.
+    """
+    __slots__ = ('root', 'components', 'path_indexes', 'path_offsets', 'lengths', 'offsets')
+
+    def __init__(self, root: pathlib.Path) -> None:
+        self.root = root
+        self.components = []
+        # Component indexes of all paths, path i is path_indexes[path_offsets[i]:path_offsets[i + 1]]
+        self.path_indexes = array('I')
+        self.path_offsets = array('Q', [0])
+        self.lengths = array('Q')
+        self.offsets = array('Q')
+
+    @classmethod
+    def from_info(cls, info: dict, root: pathlib.Path) -> 'FileTable':
+        table = cls(root)
+        _indexes = {}
+        _name = info.get(b'name')
+
+        def _append(components: list, length: int) -> None:
+            for component in components:
+                index = _indexes.get(component)
+
+                if index is None:
+                    index = _indexes[component] = len(table.components)
+                    table.components.append(sys.intern(component.decode('utf-8')))
+
+                table.path_indexes.append(index)
+
+            table.path_offsets.append(len(table.path_indexes))
+            table.offsets.append(table.offsets[-1] + table.lengths[-1] if table.lengths else 0)
+            table.lengths.append(length)
+
+        if b'files' in info:
+            for file in info.get(b'files'):
+                _append([_name] + file.get(b'path'), file.get(b'length'))
+        else:
+            _append([_name], info.get(b'length'))
+
+        return table
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def path_components(self, index: int) -> list:
+        _components = self.components
+        _indexes = self.path_indexes[self.path_offsets[index]:self.path_offsets[index + 1]]
+
+        return [_components[i] for i in _indexes]
+
+    def path(self, index: int) -> pathlib.Path:
+        return self.root.joinpath(*self.path_components(index)).resolve()
+
+    def __getitem__(self, index: int) -> dict:
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError('FileTable index out of range')
+
+        return {
+            'path': self.path(index),
+            'length': self.lengths[index],
+        }
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def total_length(self) -> int:
+        return sum(self.lengths)
+
 
 class Torrent:
     """ Main Torrent class
+
+        Keeps only what is extracted from the decoded data: the decoded tree itself is
+        dropped after construction, read again only if data_decoded is used, and files
+        are stored in a FileTable.
     """
+    __slots__ = ('path_to_save', '__torrent_path', '__data_decoded', 'announce', 'announce_list', 'comment',
+                 'created_by', 'creation_date', '__info_hash', '__files', '__total_length', 'name', 'piece_length',
+                 'pieces', '__peer_id', '__peers')
+
     def __init__(self, file_path: str) -> None:
         #  TODO: self.path_to_save should be setter for future
         self.path_to_save = pathlib.Path.cwd()
 
         # With setter
         self.torrent_path = file_path
-        self.data_decoded = self.torrent_path
+        self.__data_decoded = None
+        data_decoded = self.decode(self.torrent_path)
 
         # From data_decoded
-        self.announce = self.data_decoded.get(b'announce')
-        self.announce_list = self.data_decoded.get(b'announce-list')
-        self.comment = self.data_decoded.get(b'comment')
-        self.created_by = self.data_decoded.get(b'created by')
-        self.creation_date = self.data_decoded.get(b'creation date')
-        self.info = self.data_decoded.get(b'info')
-
-        # With setter from self.torrent_info
-        self.info_hash = self.info
-        self.files = self.info
-        self.total_length = self.info
-
-        # From self.info
-        self.name = self.info.get(b'name')
-        self.piece_length = self.info.get(b'piece length')
-        self.pieces = self.info.get(b'pieces')
+        self.announce = data_decoded.get(b'announce')
+        self.announce_list = data_decoded.get(b'announce-list')
+        self.comment = data_decoded.get(b'comment')
+        self.created_by = data_decoded.get(b'created by')
+        self.creation_date = data_decoded.get(b'creation date')
+        info = data_decoded.get(b'info')
+
+        # With setter from info
+        self.info_hash = info
+        self.files = info
+        self.total_length = self.files
+
+        # From info
+        self.name = info.get(b'name')
+        self.piece_length = info.get(b'piece length')
+        self.pieces = info.get(b'pieces')
 
         # Other
         self.peer_id = str(time.time())
+        self.__peers = None
 
     @property
     def torrent_path(self) -> pathlib.Path:
@@ -50,16 +145,20 @@ class Torrent:
 
         self.__torrent_path = path
 
+    @staticmethod
+    def decode(_path: pathlib.Path) -> dict:
+        _bytes: bytes = _path.read_bytes()
+
+        return bencodepy.decode(_bytes)
+
     @property
     def data_decoded(self) -> dict:
-        return self.__data_decoded
-
-    @data_decoded.setter
-    def data_decoded(self, _path: pathlib.Path) -> None:
-        _bytes: bytes = _path.read_bytes()
-        _data = bencodepy.decode(_bytes)
+        """ Decoded torrent file, read on first access and kept from then on
+        """
+        if self.__data_decoded is None:
+            self.__data_decoded = self.decode(self.torrent_path)
 
-        self.__data_decoded = _data
+        return self.__data_decoded
 
     @property
     def peer_id(self) -> bytes:
@@ -69,6 +168,15 @@ class Torrent:
     def peer_id(self, seed: str) -> None:
         self.__peer_id = hashlib.sha1(seed.encode('utf-8')).digest()
 
+    @property
+    def peers(self) -> PeerStore:
+        """ Peers from all trackers and other sources, created on first use
+        """
+        if self.__peers is None:
+            self.__peers = PeerStore()
+
+        return self.__peers
+
     @property
     def info_hash(self) -> bytes:
         return self.__info_hash
@@ -76,55 +184,32 @@ class Torrent:
     @info_hash.setter
     def info_hash(self, info: dict):
         _encoded = bencodepy.encode(info)
+        _start = time.perf_counter()
 
         self.__info_hash = hashlib.sha1(_encoded).digest()
 
+        metrics.HASHED_BYTES.labels('info_hash').inc(len(_encoded))
+        metrics.HASH_SECONDS.labels('info_hash').inc(time.perf_counter() - _start)
+
     @property
-    def files(self) -> list:
+    def files(self) -> FileTable:
         return self.__files
 
     @files.setter
     def files(self, info: dict):
-        _files: list = []
-        _name: bytes = info.get(b'name')
-        _name_decoded: str = _name.decode('utf-8')
-
-        if b'files' in info:
-            for file in info.get(b'files'):
-                _path = [path.decode('utf-8') for path in file.get(b'path')]
-                _file_name = pathlib.Path(*_path)
-                _file_path = (self.path_to_save / _name_decoded / _file_name).resolve()
-
-                _files.append({
-                    'path': _file_path,
-                    'length': file.get(b'length')
-                })
-        else:
-            _files.append({
-                'path': (self.path_to_save / _name_decoded).resolve(),
-                'length': info.get(b'length')
-            })
-
-        self.__files = _files
+        self.__files = FileTable.from_info(info, self.path_to_save)
 
     @property
     def total_length(self) -> int:
         return self.__total_length
 
     @total_length.setter
-    def total_length(self, info: dict) -> None:
-        _total_length: int = 0
-
-        if 'files' in info:
-            for file in info.get(b'files'):
-                _total_length += file.get(b'files')
-        else:
-            _total_length = info.get(b'length')
-
-        self.__total_length = _total_length
+    def total_length(self, files: FileTable) -> None:
+        self.__total_length = files.total_length
 
     def get_dict(self):
         return {
+            'info_hash': self.info_hash,
             'name': self.name.decode('utf-8'),
             'torrent_path': str(self.torrent_path),
             'path_to_save': str(self.path_to_save),
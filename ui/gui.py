@@ -1,11 +1,12 @@
 from concurrent.futures import ThreadPoolExecutor
 import pathlib
-from PyQt5.QtWidgets import QMainWindow, QMessageBox, QFileDialog
+from PyQt5.QtWidgets import QAbstractItemView, QFileDialog, QMainWindow, QMessageBox, QTableView, QVBoxLayout
 import threading
 
 from clutcher import settings
 from torrent.structure.torrent import Torrent
 from ui.generated import Ui_MainFrame
+from ui.models import TorrentTableModel
 
 
 class MainFrame(QMainWindow, Ui_MainFrame):
@@ -13,11 +14,29 @@ class MainFrame(QMainWindow, Ui_MainFrame):
         super().__init__(parent)
 
         self.setupUi(self)
+        self.setup_torrent_view()
 
         # Triggers
         self.action_Add_Files.triggered.connect(self.add_files)
         self.action_Exit.triggered.connect(self.close)
 
+    def setup_torrent_view(self) -> None:
+        self.torrent_model = TorrentTableModel(parent=self)
+
+        self.torrent_view = QTableView(self.centralwidget)
+        self.torrent_view.setObjectName('torrent_view')
+        self.torrent_view.setModel(self.torrent_model)
+        self.torrent_view.setSortingEnabled(True)
+        self.torrent_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.torrent_view.setShowGrid(False)
+        self.torrent_view.verticalHeader().hide()
+        # Fixed row height lets the view skip measuring 10k rows
+        self.torrent_view.verticalHeader().setDefaultSectionSize(20)
+        self.torrent_view.horizontalHeader().setStretchLastSection(True)
+
+        layout = QVBoxLayout(self.centralwidget)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.torrent_view)
 
     def retranslateUi(self, MainFrame):
         super().retranslateUi(MainFrame)
@@ -30,6 +49,7 @@ class MainFrame(QMainWindow, Ui_MainFrame):
                                      QMessageBox.No)
 
         if reply == QMessageBox.Yes:
+            self.torrent_model.close()
             event.accept()
         else:
             event.ignore()
@@ -54,6 +74,11 @@ class MainFrame(QMainWindow, Ui_MainFrame):
         if broken_files:
             self.show_message(f'Errors for files: {", ".join(broken_files)} have occurred.', _type='error')
 
+        for torrent in torrents:
+            self.torrent_model.stats.append(torrent.info_hash, torrent.name.decode('utf-8'), torrent.total_length or 0)
+
+        self.torrent_model.add_rows()
+
         with ThreadPoolExecutor() as executor:
             running_tasks = [executor.submit(self.process, torrent) for torrent in torrents]
 
@@ -0,0 +1,321 @@
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, QObject, Qt, QTimer, pyqtSignal
+
+
+class TorrentStats:
+    """ Columnar store of torrent stats
+
+        Every column is a flat list or array indexed by store row, so 10k torrents cost
+        a handful of arrays instead of 10k objects. Writers (network threads) only
+        mark rows and columns as dirty, readers (the GUI) collect them at their own pace.
+    """
+    STATES = ('queued', 'checking', 'downloading', 'seeding', 'paused', 'error')
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+
+        self.info_hashes = []
+        self.names = []
+        self.sizes = array('Q')
+        self.progress = array('d')
+        self.download_rates = array('d')
+        self.upload_rates = array('d')
+        self.seeders = array('I')
+        self.leechers = array('I')
+        self.states = array('B')
+
+        self.__rows = {}
+        self.__dirty = set()
+        self.__dirty_columns = set()
+
+    def __len__(self) -> int:
+        # names is appended first, other columns may lag behind it without the lock
+        with self.lock:
+            return len(self.names)
+
+    def row(self, info_hash: bytes) -> int:
+        return self.__rows[info_hash]
+
+    def append(self, info_hash: bytes, name: str, size: int = 0) -> int:
+        with self.lock:
+            if info_hash in self.__rows:
+                return self.__rows[info_hash]
+
+            row = len(self.names)
+
+            self.info_hashes.append(info_hash)
+            self.names.append(name)
+            self.sizes.append(size)
+            self.progress.append(0.0)
+            self.download_rates.append(0.0)
+            self.upload_rates.append(0.0)
+            self.seeders.append(0)
+            self.leechers.append(0)
+            self.states.append(0)
+            self.__rows[info_hash] = row
+
+            return row
+
+    def update(self, row: int, **values) -> None:
+        """
+
+        :param row: Store row, see TorrentStats.row
+        :param values: Column name and value pairs, e.g. download_rates=1024.0
+        :return: None
+        """
+        with self.lock:
+            for column, value in values.items():
+                getattr(self, column)[row] = value
+
+            self.__dirty.add(row)
+            self.__dirty_columns.update(values)
+
+    def take_changes(self) -> tuple:
+        """ Row count and dirty rows taken at once, so every dirty row is within the count
+
+        :return: (number of rows, sorted dirty rows, names of the columns written to)
+        """
+        with self.lock:
+            length = len(self.names)
+            dirty, self.__dirty = self.__dirty, set()
+            columns, self.__dirty_columns = self.__dirty_columns, set()
+
+        return length, sorted(dirty), columns
+
+    def snapshot(self, column: str):
+        """ Copy of a column, safe to use from another thread
+        """
+        with self.lock:
+            return getattr(self, column)[:]
+
+
+class _SortSignals(QObject):
+    finished = pyqtSignal(int, object)
+
+
+class TorrentTableModel(QAbstractTableModel):
+    """ Virtualized torrent list
+
+        The view asks only for visible cells, updates are coalesced to contiguous
+        dataChanged ranges at most REFRESH_RATE times per second and sorting runs
+        in a worker thread. A sorted view is sorted again when the sort column
+        changes or rows are added, with at most one sort in flight.
+    """
+    REFRESH_RATE = 4
+    # With more ranges than that a single min..max range is cheaper for the view
+    MAX_RANGES = 32
+    COLUMNS = (
+        ('Name', 'names'),
+        ('Size', 'sizes'),
+        ('Progress', 'progress'),
+        ('Down', 'download_rates'),
+        ('Up', 'upload_rates'),
+        ('Seeders', 'seeders'),
+        ('Leechers', 'leechers'),
+        ('State', 'states'),
+    )
+
+    def __init__(self, stats: TorrentStats = None, parent=None) -> None:
+        super().__init__(parent)
+
+        self.stats = stats if stats is not None else TorrentStats()
+
+        # view row -> store row and store row -> view row
+        self._order = array('I', range(len(self.stats)))
+        self._position = array('I', self._order)
+
+        self._sort_generation = 0
+        self._sort_column = None
+        self._sort_order = Qt.AscendingOrder
+        # A sort is running and a newer change needs another one after it
+        self._sorting = False
+        self._resort = False
+        self._sort_executor = ThreadPoolExecutor(max_workers=1)
+        self._sort_signals = _SortSignals()
+        self._sort_signals.finished.connect(self._apply_order)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(int(1000 / self.REFRESH_RATE))
+        self.timer.timeout.connect(self.flush)
+        self.timer.start()
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+
+        return len(self._order)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+
+        return len(self.COLUMNS)
+
+    def headerData(self, section: int, orientation, role: int = Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section][0]
+
+        return None
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        column = self.COLUMNS[index.column()][1]
+        value = getattr(self.stats, column)[self._order[index.row()]]
+
+        if role == Qt.DisplayRole:
+            return self.format(column, value)
+
+        if role == Qt.TextAlignmentRole and column != 'names':
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+
+        return None
+
+    @classmethod
+    def format(cls, column: str, value) -> str:
+        if column == 'names':
+            return value
+        if column == 'sizes':
+            return cls.format_bytes(value)
+        if column == 'progress':
+            return f'{value * 100:.1f}%'
+        if column in ('download_rates', 'upload_rates'):
+            return f'{cls.format_bytes(value)}/s'
+        if column == 'states':
+            return TorrentStats.STATES[value]
+
+        return str(value)
+
+    @staticmethod
+    def format_bytes(value: float) -> str:
+        for unit in ('B', 'KiB', 'MiB', 'GiB'):
+            if value < 1024:
+                return f'{value:.1f} {unit}' if unit != 'B' else f'{int(value)} {unit}'
+
+            value /= 1024
+
+        return f'{value:.1f} TiB'
+
+    def add_rows(self, length: int = None) -> None:
+        """ Expose rows appended to the store since the last call
+
+        :param length: Number of store rows to expose, all by default
+        """
+        first = len(self._order)
+        last = (len(self.stats) if length is None else length) - 1
+
+        if last < first:
+            return None
+
+        self.beginInsertRows(QModelIndex(), first, last)
+        self._order.extend(range(first, last + 1))
+        self._position.extend(range(first, last + 1))
+        self.endInsertRows()
+
+    def flush(self) -> None:
+        length, dirty, columns = self.stats.take_changes()
+        _rows = len(self._position)
+        self.add_rows(length)
+
+        if self._sort_column is not None:
+            if len(self._position) > _rows or self.COLUMNS[self._sort_column][1] in columns:
+                self.resort()
+
+        # Rows the view does not have yet are read fresh when they are inserted
+        dirty = [row for row in dirty if row < _rows]
+
+        if not dirty:
+            return None
+
+        last_column = len(self.COLUMNS) - 1
+
+        for first, last in self.coalesce(sorted(self._position[row] for row in dirty)):
+            self.dataChanged.emit(self.index(first, 0), self.index(last, last_column))
+
+    @classmethod
+    def coalesce(cls, rows: list) -> list:
+        """ Turn sorted rows into inclusive (first, last) ranges
+
+        :param rows: Sorted view rows
+        :return: List of ranges, a single one if there are more than MAX_RANGES
+        """
+        ranges = []
+        first = last = rows[0]
+
+        for row in rows[1:]:
+            if row != last + 1:
+                ranges.append((first, last))
+                first = row
+
+            last = row
+
+        ranges.append((first, last))
+
+        if len(ranges) > cls.MAX_RANGES:
+            return [(rows[0], rows[-1])]
+
+        return ranges
+
+    def sort(self, column: int, order=Qt.AscendingOrder) -> None:
+        self.add_rows()
+        self._sort_column = column
+        self._sort_order = order
+        self._sorting = True
+        self._resort = False
+        self._sort_generation += 1
+        generation = self._sort_generation
+        values = self.stats.snapshot(self.COLUMNS[column][1])[:len(self._order)]
+        reverse = order == Qt.DescendingOrder
+
+        def _sort():
+            if values and isinstance(values[0], str):
+                key = [value.casefold() for value in values].__getitem__
+            else:
+                key = values.__getitem__
+
+            _order = array('I', sorted(range(len(values)), key=key, reverse=reverse))
+            self._sort_signals.finished.emit(generation, _order)
+
+        self._sort_executor.submit(_sort)
+
+    def resort(self) -> None:
+        """ Sort again by the current sort column, once the running sort is applied
+        """
+        if self._sorting:
+            self._resort = True
+        else:
+            self.sort(self._sort_column, self._sort_order)
+
+    def _apply_order(self, generation: int, order: array) -> None:
+        if generation != self._sort_generation:
+            return None
+
+        self._sorting = False
+
+        # Rows appended while sorting keep their place at the end
+        order.extend(range(len(order), len(self._order)))
+        position = array('I', bytes(order.itemsize * len(order)))
+
+        for view_row, row in enumerate(order):
+            position[row] = view_row
+
+        self.layoutAboutToBeChanged.emit()
+
+        old_indexes = self.persistentIndexList()
+        new_indexes = [self.index(position[self._order[index.row()]], index.column()) for index in old_indexes]
+
+        self._order = order
+        self._position = position
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
+
+        if self._resort:
+            self.sort(self._sort_column, self._sort_order)
+
+    def close(self) -> None:
+        self.timer.stop()
+        self._sort_executor.shutdown(wait=False)